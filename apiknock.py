@@ -1,17 +1,21 @@
-from importlib import reload
-from apiparser.openapi import OpenAPIParser
-from modules.requester import Requester
 from modules.knockerconfig import KnockerConfig, USER_COUNT
-from modules.junit import JUnitCreator
+from modules.reporter import get_reporter, SUCCESS, FAILURE, ERROR
 from optparse import OptionParser
-from modules.tester import Tester
 import sys
 import os
 import logging
 
+# Only lightweight modules are imported above. Everything else (e.g. yaml, requests, sqlite3 or http.server) is
+# imported by the code paths which actually need it, so generating a config or showing the help stays fast.
+
 logger = logging.getLogger('apiknock')
 
-usage = "%prog [options] <api-file>"
+# The options of the checks, which the coordinator sends to its workers, so all workers test the same cells. The
+# workers only take over these options, all others (e.g. connection settings) are their own.
+WORKER_OPTIONS = ("variants", "max_variants", "max_values", "variant_strategy", "differential", "volatile_fields")
+
+usage = "%prog [options] <api-file>\n       %prog [options] --plan <plan-file>\n" \
+        "       %prog [options] --worker <address>"
 
 
 def get_parser(file_format):
@@ -19,61 +23,164 @@ def get_parser(file_format):
         raise ValueError("Invalid file format. Can be 'openapi'.")
 
     if file_format == 'openapi':
+        from apiparser.openapi import OpenAPIParser
         return OpenAPIParser()
 
 
-def get_base_url(options, parser):
-    base_url = None
-    try:
-        base_url = parser.get_base_url()
-    except ValueError:
-        pass
-
+def get_base_urls(options, parser):
     if options.override_base_url:
-        base_url = options.override_base_url
-
-    if base_url:
-        msg = "[+] Using base URL: %s" % base_url
-        print(msg)
-        logger.info(msg)
-        return base_url
+        base_urls = options.override_base_url
     else:
+        try:
+            base_urls = [parser.get_base_url()]
+        except ValueError:
+            base_urls = []
+
+    base_urls = [base_url for base_url in base_urls if base_url]
+    if not base_urls:
         msg = "[E] Could not extract base URL from API spec. Please use --override-base-url."
         print(msg)
         logger.critical(msg)
         sys.exit(1)
 
+    for base_url in base_urls:
+        msg = "[+] Using base URL: %s" % base_url
+        print(msg)
+        logger.info(msg)
+    return base_urls
 
-def main():
-    print(""" _______ _______ _______ _     _  ______ _______ _____
- |______ |______ |       |     | |_____/ |_____|   |  
- ______| |______ |_____  |_____| |    \_ |     | __|__
- 
- [ knock, knock... I'm there!  -  apiknock.securai.de ]                                
-    """)
+
+def get_base_url(options, parser):
+    base_urls = get_base_urls(options, parser)
+    if len(base_urls) > 1:
+        print("[W] Only the first base URL is used.")
+    return base_urls[0]
+
+
+def print_summary(tester):
+    counts = tester.get_results().counts()
+    msg = "[+] Finished: %d requests sent, %d checks succeeded, %d failed, %d errors." % (
+        tester.get_total_requests(),
+        counts[SUCCESS],
+        counts[FAILURE],
+        counts[ERROR]
+    )
+    print(msg)
+    logger.info(msg)
+
+
+def get_option_parser():
     opt_parser = OptionParser(usage=usage)
     opt_parser.add_option("-f", "--format", dest="format",
                           help="the api file FORMAT (can be openapi)", metavar="FORMAT")
     opt_parser.add_option("-i", "--insecure", action="store_false", dest="verify_certs", default=True,
                           help="ignore certificate warnings (!!INSECURE!!)")
     opt_parser.add_option("-p", "--proxy", dest="proxy", help="specify a PROXY server", metavar="PROXY")
+    opt_parser.add_option("--transport", dest="transport", default="requests", metavar="NAME",
+                          help="the HTTP client: requests (HTTP/1.1, default) or httpx (HTTP/2, needs httpx[http2])")
     opt_parser.add_option("-c", "--config", dest="config_filename", help="specify a configuration FILE", metavar="FILE")
     opt_parser.add_option("-g", "--generate-config", metavar="FILENAME", dest="generate_config_filename",
                           help="generate a config file and store it in FILENAME")
+    opt_parser.add_option("--save-plan", metavar="FILE", dest="save_plan",
+                          help="resolve the API file and config (-c) into the run plan FILE and exit")
+    opt_parser.add_option("--plan", metavar="FILE", dest="plan",
+                          help="run the run plan FILE instead of parsing an API file and config")
     opt_parser.add_option("-l", "--logfile", metavar="FILENAME", dest="logfile", help="write log output to FILE")
     opt_parser.add_option("-d", "--log-level", metavar="LOGLEVEL", dest="loglevel", help="specify LOGLEVEL")
     opt_parser.add_option("-a", "--auth-type", metavar="TYPE", dest="auth_type",
                           help="sets the authentication to TYPE (can be: bearer, header, cookie, query)")
     opt_parser.add_option("-n", "--auth-name", metavar="NAME", dest="auth_name", help="sets the parameter, cookie or "
                                                                                       "header name for authentication")
-    opt_parser.add_option("-o", "--out-format", metavar="FORMAT", dest="out_format", help="specifies the output FORMAT"
-                                                                                          "can be junit")
-    opt_parser.add_option("-w", "--output-file", metavar="FILE", dest="out_file", help="specifies the output FILE")
+    opt_parser.add_option("-o", "--out-format", metavar="FORMAT", dest="out_format", action="append", default=[],
+                          help="specifies the output FORMAT, can be junit, jsonl, sarif or the path of a reporter "
+                               "class (can be used multiple times, each one needs a -w)")
+    opt_parser.add_option("-w", "--output-file", metavar="FILE", dest="out_file", action="append", default=[],
+                          help="specifies the output FILE for the -o at the same position")
+
+    opt_parser.add_option("--max-memory-results", metavar="COUNT", dest="max_memory_results", type="int",
+                          default=100000, help="keep at most COUNT results in memory before spilling them to disk")
+    opt_parser.add_option("--result-store", metavar="FILE", dest="result_store",
+                          help="spill results to the SQLite database FILE instead of a temporary file")
+
+    opt_parser.add_option("--variants", dest="variants", default=False, action="store_true",
+                          help="test every request with several parameter values (enum members, boundaries, IDs)")
+    opt_parser.add_option("--max-variants", metavar="COUNT", dest="max_variants", type="int", default=20,
+                          help="test at most COUNT variants per request (default 20)")
+    opt_parser.add_option("--max-values", metavar="COUNT", dest="max_values", type="int", default=5,
+                          help="use at most COUNT values per parameter for variants (default 5)")
+    opt_parser.add_option("--variant-strategy", metavar="STRATEGY", dest="variant_strategy", default="pairwise",
+                          help="combine parameter values pairwise (default) or cartesian")
+    opt_parser.add_option("--id-file", metavar="FILE", dest="id_file",
+                          help="FILE with one ID per line, used as value of ID parameters for variants")
+
+    opt_parser.add_option("--progress", dest="progress", default=False, action="store_true",
+                          help="show a single progress line (throughput, error rate, ETA) instead of every result")
+    opt_parser.add_option("--metrics-file", metavar="FILE", dest="metrics_file",
+                          help="write Prometheus metrics to FILE (updated every 10 seconds)")
+    opt_parser.add_option("--metrics-port", metavar="PORT", dest="metrics_port", type="int",
+                          help="expose Prometheus metrics on http://127.0.0.1:PORT/metrics while running")
+
+    opt_parser.add_option("--capture", metavar="FILE", dest="capture",
+                          help="write the sent requests and received responses to FILE (credentials are redacted)")
+    opt_parser.add_option("--capture-format", metavar="FORMAT", dest="capture_format", default="har",
+                          help="the FORMAT of the capture file: har (default) or jsonl (one HAR entry per line)")
+    opt_parser.add_option("--capture-max-body", metavar="SIZE", dest="capture_max_body", type="int", default=4096,
+                          help="truncate captured bodies to SIZE characters (default 4096)")
+    opt_parser.add_option("--capture-body-rate", metavar="RATE", dest="capture_body_rate", type="float", default=1.0,
+                          help="capture the response bodies of this fraction of the requests (0 to 1, default 1)")
+    opt_parser.add_option("--record", metavar="FILE", dest="record",
+                          help="record all responses in FILE, so the checks can be evaluated again with --replay")
+    opt_parser.add_option("--replay", metavar="FILE", dest="replay",
+                          help="evaluate the checks against the responses recorded in FILE instead of sending requests")
+    opt_parser.add_option("--differential", action="store_true", dest="differential", default=False,
+                          help="fail cells of blocked users, who receive the same response as the first user with "
+                               "access")
+    opt_parser.add_option("--volatile-field", metavar="NAME", dest="volatile_fields", action="append",
+                          help="ignore the JSON field NAME (e.g. a timestamp) in the differential comparison. Can be "
+                               "used several times and implies --differential")
+    opt_parser.add_option("--latency-baseline", metavar="FILE", dest="latency_baseline",
+                          help="report operations whose p90 latency regressed compared to the baseline FILE")
+    opt_parser.add_option("--save-latency-baseline", metavar="FILE", dest="save_latency_baseline",
+                          help="store the p90 latencies of this run as baseline in FILE")
+    opt_parser.add_option("--latency-regression-ratio", metavar="RATIO", dest="latency_ratio", type="float",
+                          default=1.5, help="allowed growth of the p90 latency compared to the baseline (default 1.5)")
+    opt_parser.add_option("--history", metavar="FILE", dest="history",
+                          help="test the operations, which failed most often in previous runs, first and store the "
+                               "failure rates and durations of this run in FILE")
+    opt_parser.add_option("--fail-fast", metavar="COUNT", dest="fail_fast", type="int",
+                          help="stop the run after COUNT failures")
+    opt_parser.add_option("--coordinator", metavar="ADDRESS", dest="coordinator",
+                          help="hand the operations out to workers connecting to ADDRESS (HOST:PORT or unix:PATH) "
+                               "instead of testing them")
+    opt_parser.add_option("--worker", metavar="ADDRESS", dest="worker",
+                          help="test the operations handed out by the coordinator at ADDRESS. Needs the base URL "
+                               "(-u) and the authentication info (-a, -1, ...), but neither API file nor config")
+    opt_parser.add_option("--batch-size", metavar="COUNT", dest="batch_size", type="int", default=5,
+                          help="number of operations the coordinator hands out to a worker at once (default 5)")
+    opt_parser.add_option("--lease-timeout", metavar="SECONDS", dest="lease_timeout", type="float", default=300.0,
+                          help="hand the batch of a worker out again, if it did not finish an operation within "
+                               "SECONDS (default 300)")
+    opt_parser.add_option("--secret", metavar="SECRET", dest="distributed_secret",
+                          default=os.environ.get("APIKNOCK_SECRET"),
+                          help="secret shared by the coordinator and its workers, which authenticates them to each "
+                               "other (default: the APIKNOCK_SECRET environment variable)")
 
     opt_parser.add_option("--fire", help="Just send out all requests once", dest="fire", default=False,
                           action="store_true")
-    opt_parser.add_option("-u", "--override-base-url", dest="override_base_url", help="overrides base URL defined in "
-                                                                                      "spec")
+    opt_parser.add_option("--concurrency", metavar="COUNT", dest="concurrency", type="int", default=1,
+                          help="use COUNT parallel workers for --fire load runs or test COUNT operations at the same "
+                               "time")
+    opt_parser.add_option("--duration", metavar="SECONDS", dest="load_duration", type="float",
+                          help="turn --fire into a load run lasting SECONDS")
+    opt_parser.add_option("--requests", metavar="COUNT", dest="load_requests", type="int",
+                          help="turn --fire into a load run sending COUNT requests")
+    opt_parser.add_option("--rps", metavar="RATE", dest="rps", type="float",
+                          help="target RATE in requests per second for load runs (default: as fast as possible)")
+    opt_parser.add_option("--load-mix", metavar="FILE", dest="load_mix",
+                          help="JSON FILE with the weight of every operation, e.g. {\"GET /pets\": 10}")
+    opt_parser.add_option("-u", "--override-base-url", dest="override_base_url", action="append",
+                          help="overrides base URL defined in spec. Use several times to run against several base URLs "
+                               "in parallel")
 
     opt_parser.add_option("-1", "--user-1", metavar="TOKEN", dest="user_1_token", help="TOKEN for user 1")
     opt_parser.add_option("-2", "--user-2", metavar="TOKEN", dest="user_2_token", help="TOKEN for user 2")
@@ -85,139 +192,612 @@ def main():
     opt_parser.add_option("-8", "--user-8", metavar="TOKEN", dest="user_8_token", help="TOKEN for user 8")
     opt_parser.add_option("-9", "--user-9", metavar="TOKEN", dest="user_9_token", help="TOKEN for user 9")
 
-    (options, args) = opt_parser.parse_args()
+    return opt_parser
 
-    if len(args) < 1:
-        opt_parser.error('API filename is missing')
 
-    api_file = args[0]
-    if not os.path.isfile(api_file):
-        opt_parser.error('<api-file> is not a file.')
+def work(opt_parser, options, metrics, capture):
+    from modules.distributed import ResultBuffer, Worker
+    from modules.requester import Requester
+    from modules.schema import SchemaCompiler
+    from modules.tester import Tester
 
-    file_format = options.format
-    if not file_format or file_format not in ['openapi']:
-        opt_parser.error('Invalid API file FORMAT. Can be \'openapi\'.')
+    if not options.auth_type or not options.user_1_token:
+        opt_parser.error("Please provide authentication info (-a, -n, -1, ...")
+    # The tokens are only sent to the base URL given to the worker, never to one the coordinator chose
+    if not options.override_base_url or len(options.override_base_url) > 1:
+        opt_parser.error("Please provide the base URL (-u) the worker sends its requests to.")
+    if not options.distributed_secret:
+        opt_parser.error("Please provide the secret shared with the coordinator (--secret or APIKNOCK_SECRET).")
 
-    if not options.config_filename and not options.generate_config_filename and not options.fire:
-        opt_parser.error('Please provide either a config file (-c) or generate a new one (-g). Or use --fire.')
+    worker = Worker(options.worker, options.distributed_secret)
+    try:
+        print("[+] Connecting to coordinator %s..." % options.worker)
+        setup = worker.connect()
 
-    if os.name == 'nt':
-        # Enables ANSI colors on windows-shell
-        os.system("color")
+        knocker_conf = KnockerConfig()
+        knocker_conf.load_config(setup["knockerconf"])
+        token_dict = get_token_dict(opt_parser, options, knocker_conf.get(USER_COUNT))
 
-    if options.logfile:
-        # Obviously some of the imported modules messes with the logger configuration. Shame!
-        # If those two lines are removed everything is printed out to stdout as well
-        logging.shutdown()
-        reload(logging)
-
-        if options.loglevel:
-            loglevel_dict = {
-                'DEBUG': logging.DEBUG,
-                'INFO': logging.INFO,
-                'WARNING': logging.WARNING,
-                'ERROR': logging.ERROR,
-                'CRITICAL': logging.CRITICAL
-            }
-            if options.loglevel.upper() in loglevel_dict:
-                if loglevel_dict[options.loglevel.upper()] == logging.DEBUG:
-                    print("[W] !WARNING! Debug-Logging will also log ALL YOUR TOKENS!")
-                logger.setLevel(loglevel_dict[options.loglevel.upper()])
-            else:
-                opt_parser.error("Invalid log-level. Can be 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'.")
-        else:
-            logger.setLevel(logging.ERROR)
-        fh = logging.FileHandler(options.logfile)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        fh.setFormatter(formatter)
-        logger.addHandler(fh)
+        # The checks are configured by the coordinator, the connection settings by the worker
+        for name, value in setup["options"].items():
+            if name not in WORKER_OPTIONS:
+                logger.warning("Ignoring option %s sent by the coordinator." % name)
+                continue
+            setattr(options, name, value)
+        options.id_file = None
 
-    try:
-        parser = get_parser(file_format)
-        parser.parse_file(api_file)
-    except ValueError as ex:
-        print("[E] Error occurred while processing API file: %s" % ex)
-        sys.exit(2)
+        base_url = options.override_base_url[0]
+        print("[+] Using base URL: %s" % base_url)
 
-    if options.fire:
-        base_url = get_base_url(options, parser)
         req = Requester(
             base_url,
             verify_certs=options.verify_certs,
             proxy=options.proxy,
             auth_type=options.auth_type,
             auth_name=options.auth_name,
-            request_list=parser.get_parsed_requests(),
+            metrics=metrics,
+            transport=get_transport(opt_parser, options),
+            capture=capture,
         )
+        result_buffer = ResultBuffer()
+        tester = Tester(setup["requests"], knocker_conf, req, token_dict, result_store=result_buffer,
+                        print_results=False, schema_compiler=SchemaCompiler.for_references(setup["schemas"]))
+
+        variant_generator = get_variant_generator(opt_parser, options, ids=setup["ids"])
+        if variant_generator:
+            tester.set_variant_generator(variant_generator)
+        digester = get_response_digester(options)
+        if digester is not None:
+            tester.set_response_digester(digester)
+        if metrics:
+            tester.add_listener(metrics)
 
-        req.process_all_requests(options.user_1_token, print_request=True)
+        try:
+            tested = worker.run(tester, result_buffer)
+        finally:
+            req.close()
+    except (KeyError, ValueError) as ex:
+        print("[E] %s" % ex)
+        logger.critical(str(ex))
+        sys.exit(1)
+    finally:
+        worker.close()
+
+    msg = "[+] Finished: tested %d operations with %d requests." % (tested, tester.get_total_requests())
+    print(msg)
+    logger.info(msg)
+
+
+def configure_logging(opt_parser, options):
+    # The log output of apiknock only goes to the log file, the console output is printed separately
+    logger.propagate = False
+
+    if not options.logfile:
+        logger.addHandler(logging.NullHandler())
+        return
+
+    if options.loglevel:
+        loglevel_dict = {
+            'DEBUG': logging.DEBUG,
+            'INFO': logging.INFO,
+            'WARNING': logging.WARNING,
+            'ERROR': logging.ERROR,
+            'CRITICAL': logging.CRITICAL
+        }
+        if options.loglevel.upper() in loglevel_dict:
+            if loglevel_dict[options.loglevel.upper()] == logging.DEBUG:
+                print("[W] !WARNING! Debug-Logging will also log ALL YOUR TOKENS!")
+            logger.setLevel(loglevel_dict[options.loglevel.upper()])
+        else:
+            opt_parser.error("Invalid log-level. Can be 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'.")
+    else:
+        logger.setLevel(logging.ERROR)
+    fh = logging.FileHandler(options.logfile)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    fh.setFormatter(formatter)
+    logger.addHandler(fh)
+
+
+def start_metrics(opt_parser, options):
+    if not options.metrics_file and not options.metrics_port:
+        return None
+
+    from modules.metrics import Metrics
+    metrics = Metrics()
+    if options.metrics_file:
+        metrics.start_file_writer(options.metrics_file)
+    if options.metrics_port:
+        try:
+            metrics.serve(options.metrics_port)
+        except OSError as ex:
+            opt_parser.error("Could not start metrics endpoint on port %d: %s" % (options.metrics_port, ex))
+        print("[+] Metrics available at http://127.0.0.1:%d/metrics" % options.metrics_port)
+    return metrics
 
-    if options.generate_config_filename:
+
+def start_capture(opt_parser, options):
+    if not options.capture:
+        return None
+
+    from modules.capture import TrafficCapture
+    try:
+        capture = TrafficCapture(options.capture, capture_format=options.capture_format,
+                                 max_body_size=options.capture_max_body, body_rate=options.capture_body_rate)
+        capture.start()
+    except ValueError as ex:
+        opt_parser.error(str(ex))
+    except IOError as ex:
+        print("[E] Could not write to capture file: %s" % str(ex))
+        sys.exit(1)
+    return capture
+
+
+def stop_metrics(options, metrics):
+    metrics.stop()
+    if options.metrics_file:
         try:
-            user_count = int(input("So, tell me. How many users do you want to knock for? "))
+            metrics.write_file(options.metrics_file)
+        except IOError as ex:
+            print("[E] Could not write metrics file: %s" % str(ex))
 
-            if user_count < 2 or user_count > 9:
-                raise ValueError
-        except ValueError:
-            print("[E] Please provide a valid number of users... Can be between 2 and 9.")
-            sys.exit(2)
 
-        config = KnockerConfig()
-        config.set(USER_COUNT, user_count)
-        config.generate_config_file(parser.get_parsed_requests(), options.generate_config_filename)
-        print("[+] Success: Written configuration file to %s." % options.generate_config_filename)
-        sys.exit(0)
+def get_transport(opt_parser, options):
+    from modules.transport import get_transport as create_transport
+    try:
+        return create_transport(options.transport, verify_certs=options.verify_certs, proxy=options.proxy)
+    except ValueError as ex:
+        opt_parser.error(str(ex))
+
+
+def fire(opt_parser, options, parser, metrics, capture):
+    from modules.requester import Requester
+
+    # Without a stop condition --fire sends every request once, which would silently ignore the load options
+    if not options.load_duration and not options.load_requests and (
+            options.rps or options.load_mix or options.concurrency != 1):
+        opt_parser.error("--rps, --concurrency and --load-mix need --duration or --requests to turn --fire into a "
+                         "load run.")
+
+    base_url = get_base_url(options, parser)
+    req = Requester(
+        base_url,
+        verify_certs=options.verify_certs,
+        proxy=options.proxy,
+        auth_type=options.auth_type,
+        auth_name=options.auth_name,
+        request_list=parser.get_parsed_requests(),
+        metrics=metrics,
+        transport=get_transport(opt_parser, options),
+        capture=capture,
+    )
+
+    if options.load_duration or options.load_requests:
+        from modules.loadgen import LoadGenerator
+        try:
+            load = LoadGenerator(
+                req,
+                parser.get_parsed_requests(),
+                auth_value=options.user_1_token,
+                concurrency=options.concurrency,
+                duration=options.load_duration,
+                request_count=options.load_requests,
+                rps=options.rps,
+                weights=LoadGenerator.load_weights(options.load_mix) if options.load_mix else None,
+            )
+        except ValueError as ex:
+            opt_parser.error(str(ex))
+
+        print("[+] Sending load with %d workers %s" % (
+            options.concurrency,
+            "at %.1f requests/s" % options.rps if options.rps else "as fast as possible"
+        ))
+        load.run()
+        load.print_report()
+    else:
+        req.process_all_requests(options.user_1_token, print_request=True)
+    req.close()
+
+
+def generate_config(options, parser):
+    try:
+        user_count = int(input("So, tell me. How many users do you want to knock for? "))
+
+        if user_count < 2 or user_count > 9:
+            raise ValueError
+    except ValueError:
+        print("[E] Please provide a valid number of users... Can be between 2 and 9.")
+        sys.exit(2)
+
+    config = KnockerConfig()
+    config.set(USER_COUNT, user_count)
+    config.generate_config_file(parser.get_parsed_requests(), options.generate_config_filename)
+    print("[+] Success: Written configuration file to %s." % options.generate_config_filename)
+
 
+def get_reporters(opt_parser, options, api_file):
+    reporters = []
     if options.out_format or options.out_file:
-        if not options.out_format and options.out_file:
+        if len(options.out_format) != len(options.out_file):
             opt_parser.error("Please provide both, output format (-o) and output filename (-w).")
 
-        if options.out_format not in ['junit']:
-            opt_parser.error("Pleas provide a valid output format. Can be 'junit'.")
+        for out_format, out_file in zip(options.out_format, options.out_file):
+            try:
+                reporters.append(get_reporter(out_format, out_file, api_file=api_file))
+            except ValueError as ex:
+                opt_parser.error("Please provide a valid output format: %s" % ex)
+    return reporters
 
-    if options.config_filename:
-        if not options.auth_type or not options.user_1_token:
-            opt_parser.error("Please provide authentication info (-a, -n, -1, ...")
 
-        knocker_conf = KnockerConfig()
-        knocker_conf.load_config_file(options.config_filename)
+def get_token_dict(opt_parser, options, user_count):
+    token_dict = {}
 
-        user_count = knocker_conf.get(USER_COUNT)
+    for user_number in range(1, user_count + 1):
+        token = getattr(options, 'user_%d_token' % user_number)
 
-        if user_count < 2 or user_count > 9:
-            print("[E] Invalid value of 'user_count' in config file. Can be between 2 and 9.")
+        if not token:
+            opt_parser.error("There are %d users in config file, but the token for user %d is missing." % (
+                user_count, user_number
+            ))
 
-        token_dict = {}
+        token_dict['user_%d' % user_number] = token
 
-        for user_number in range(1, user_count + 1):
-            token = getattr(options, 'user_%d_token' % user_number)
+    return token_dict
 
-            if not token:
-                opt_parser.error("There are %d users in config file, but the token for user %d is missing." % (
-                    user_count, user_number
-                ))
 
-            token_dict['user_%d' % user_number] = token
+def get_variant_generator(opt_parser, options, ids=None):
+    if not options.variants:
+        return None
 
-        base_url = get_base_url(options, parser)
-        req = Requester(
-            base_url,
-            verify_certs=options.verify_certs,
-            proxy=options.proxy,
-            auth_type=options.auth_type,
-            auth_name=options.auth_name,
+    from modules.variants import VariantGenerator
+    try:
+        return VariantGenerator(
+            max_variants=options.max_variants,
+            max_values_per_parameter=options.max_values,
+            ids=VariantGenerator.load_ids(options.id_file) if options.id_file else ids,
+            strategy=options.variant_strategy,
         )
+    except ValueError as ex:
+        opt_parser.error(str(ex))
+
+
+def get_response_digester(options):
+    if not options.differential and not options.volatile_fields:
+        return None
+
+    from modules.differential import ResponseDigester
+    return ResponseDigester(volatile_fields=options.volatile_fields)
+
+
+def load_knocker_config(options):
+    knocker_conf = KnockerConfig()
+    knocker_conf.load_config_file(options.config_filename)
+    return knocker_conf
+
+
+def save_plan(options, parser, api_file):
+    from modules.plan import RunPlan
+
+    plan = RunPlan.build(parser.get_parsed_requests(), load_knocker_config(options), get_base_url(options, parser),
+                         api_file=api_file, schemas=parser.get_referenced_schemas())
+    try:
+        plan.save(options.save_plan)
+    except IOError as ex:
+        print("[E] Could not write run plan: %s" % str(ex))
+        sys.exit(1)
+    print("[+] Success: Written run plan to %s." % options.save_plan)
+
+
+def knock(opt_parser, options, parser, knocker_conf, metrics, capture, reporters):
+    from modules.requester import Requester
+    from modules.resultstore import ResultStore
+    from modules.tester import Tester
 
-        tester = Tester(parser.get_parsed_requests(), knocker_conf, req, token_dict)
-        tester.test_all_requests()
+    if options.record and options.replay:
+        opt_parser.error("Please use either --record or --replay.")
 
-        if options.out_file:
-            junit = JUnitCreator(tester)
+    if options.coordinator and (options.replay or options.record):
+        opt_parser.error("A distributed run can neither be recorded nor replayed.")
+    if options.coordinator and not options.distributed_secret:
+        opt_parser.error("Please provide the secret shared with the workers (--secret or APIKNOCK_SECRET).")
+
+    if not options.replay and not options.coordinator and (not options.auth_type or not options.user_1_token):
+        opt_parser.error("Please provide authentication info (-a, -n, -1, ...")
+
+    user_count = knocker_conf.get(USER_COUNT)
+
+    if user_count < 2 or user_count > 9:
+        print("[E] Invalid value of 'user_count' in config file. Can be between 2 and 9.")
+
+    if options.replay:
+        # No requests are sent, so neither tokens nor a base URL are needed
+        token_dict = {"user_%d" % user_number: None for user_number in range(1, user_count + 1)}
+        base_urls = [None]
+    elif options.coordinator:
+        # The workers send the requests with their own tokens to their own base URLs
+        token_dict = {"user_%d" % user_number: None for user_number in range(1, user_count + 1)}
+        base_urls = get_base_urls(options, parser)
+        if len(base_urls) > 1:
+            opt_parser.error("A distributed run can only be executed against a single base URL.")
+    else:
+        token_dict = get_token_dict(opt_parser, options, user_count)
+        base_urls = get_base_urls(options, parser)
+
+    if len(base_urls) > 1 and options.save_latency_baseline:
+        opt_parser.error("A latency baseline can only be saved for a single base URL.")
+    if len(base_urls) > 1 and options.record:
+        opt_parser.error("Only a run against a single base URL can be recorded.")
+
+    recording = None
+    if options.record or options.replay:
+        from modules.recording import Recording
+        try:
+            recording = Recording(options.replay or options.record, replay=bool(options.replay))
+        except ValueError as ex:
+            opt_parser.error(str(ex))
+
+    variant_generator = get_variant_generator(opt_parser, options)
+
+    latency_baseline = None
+    if options.latency_baseline:
+        from modules.baseline import LatencyBaseline
+        try:
+            latency_baseline = LatencyBaseline.load(options.latency_baseline)
+        except ValueError as ex:
+            opt_parser.error(str(ex))
+
+    history = None
+    if options.history:
+        from modules.history import RunHistory
+        try:
+            history = RunHistory.load(options.history)
+        except ValueError as ex:
+            opt_parser.error(str(ex))
+
+    if options.concurrency < 1:
+        opt_parser.error("The concurrency has to be at least 1.")
+    if options.fail_fast is not None and options.fail_fast < 1:
+        opt_parser.error("The number of failures for --fail-fast has to be at least 1.")
+
+    digester = get_response_digester(options)
+
+    coordinator = None
+    if options.coordinator:
+        from modules.distributed import Coordinator
+        setup = {
+            "requests": parser.get_parsed_requests(),
+            "schemas": parser.get_referenced_schemas(),
+            "knockerconf": knocker_conf.get_config(),
+            "options": {name: getattr(options, name) for name in WORKER_OPTIONS},
+            "ids": None,
+        }
+        if options.variants and options.id_file:
+            from modules.variants import VariantGenerator
             try:
-                with open(options.out_file, "w") as out_file:
-                    out_file.write(junit.generate_xml())
+                setup["ids"] = VariantGenerator.load_ids(options.id_file)
+            except ValueError as ex:
+                opt_parser.error(str(ex))
+        try:
+            coordinator = Coordinator(options.coordinator, setup, options.distributed_secret,
+                                      batch_size=options.batch_size, lease_timeout=options.lease_timeout)
+            coordinator.start()
+        except ValueError as ex:
+            opt_parser.error(str(ex))
+
+    # Several base URLs are tested in parallel. The targets share the parsed requests and the compiled checks, but
+    # every target has its own Requester with its own connection pool.
+    runner = None
+    if len(base_urls) > 1:
+        from modules.targets import MultiTargetRunner
+        runner = MultiTargetRunner()
+
+    requesters = []
+    result_stores = []
+    testers = []
+    compiled_checks = None
+    for number, base_url in enumerate(base_urls):
+        req = None
+        if not options.replay and not coordinator:
+            req = Requester(
+                base_url,
+                verify_certs=options.verify_certs,
+                proxy=options.proxy,
+                auth_type=options.auth_type,
+                auth_name=options.auth_name,
+                metrics=metrics,
+                transport=get_transport(opt_parser, options),
+                capture=capture,
+            )
+            requesters.append(req)
+
+        spill_file = options.result_store
+        if runner and spill_file:
+            spill_file = "%s.%d" % (spill_file, number + 1)
+        result_store = ResultStore(max_memory_results=options.max_memory_results, spill_file=spill_file,
+                                   target=base_url if runner else None)
+        result_stores.append(result_store)
+
+        # Parallel targets would mix up their output lines, they are summarized at the end instead
+        tester = Tester(parser.get_parsed_requests(), knocker_conf, req, token_dict, result_store=result_store,
+                        print_results=not options.progress and not runner, compiled_checks=compiled_checks,
+                        schema_compiler=parser.get_schema_compiler())
+        compiled_checks = tester.get_compiled_checks()
+
+        if variant_generator:
+            tester.set_variant_generator(variant_generator)
+        if latency_baseline is not None:
+            tester.set_latency_baseline(latency_baseline, options.latency_ratio)
+        if options.save_latency_baseline:
+            tester.collect_latencies()
+        if digester is not None:
+            tester.set_response_digester(digester)
+        if recording is not None:
+            tester.set_recording(recording)
+        if history is not None:
+            tester.set_history(history)
+        if coordinator is not None:
+            tester.set_coordinator(coordinator)
+        tester.set_concurrency(options.concurrency)
+        tester.set_fail_fast(options.fail_fast)
+
+        testers.append(tester)
+        if runner:
+            runner.add_target(base_url, tester)
+
+    add_listener = runner.add_listener if runner else testers[0].add_listener
+
+    if options.progress:
+        from modules.progress import Progress
+        reporters.append(Progress(sum(tester.count_checks() for tester in testers)))
+
+    if metrics:
+        add_listener(metrics)
+    if history is not None:
+        # The durations and failure rates of other targets (e.g. a slower region) would skew the averages, so only the
+        # results of the first base URL are recorded. All targets are scheduled by them.
+        testers[0].add_listener(history)
+
+    started_reporters = []
+    try:
+        for reporter in reporters:
+            try:
+                reporter.start()
             except IOError as ex:
                 print("[E] Could not write to output file: %s" % str(ex))
+                sys.exit(1)
+            started_reporters.append(reporter)
+            add_listener(reporter)
+
+        if runner:
+            print("[+] Knocking on %d base URLs in parallel..." % len(base_urls))
+            runner.run()
+        else:
+            testers[0].test_all_requests()
+    finally:
+        for reporter in started_reporters:
+            reporter.finish()
+
+    if runner:
+        runner.print_report()
+    else:
+        print_summary(testers[0])
+
+    if coordinator is not None:
+        coordinator.close()
+    for result_store in result_stores:
+        result_store.close()
+    for req in requesters:
+        req.close()
+    if recording is not None:
+        recording.close()
+        if options.record:
+            print("[+] Written recording to %s." % options.record)
+
+    if options.save_latency_baseline:
+        try:
+            testers[0].get_latencies().save(options.save_latency_baseline)
+            print("[+] Written latency baseline to %s." % options.save_latency_baseline)
+        except IOError as ex:
+            print("[E] Could not write latency baseline: %s" % str(ex))
+
+    if history is not None:
+        try:
+            history.save(options.history)
+            print("[+] Written run history to %s." % options.history)
+        except IOError as ex:
+            print("[E] Could not write run history: %s" % str(ex))
+
+
+def main():
+    print(""" _______ _______ _______ _     _  ______ _______ _____
+ |______ |______ |       |     | |_____/ |_____|   |  
+ ______| |______ |_____  |_____| |    \_ |     | __|__
+ 
+ [ knock, knock... I'm there!  -  apiknock.securai.de ]                                
+    """)
+    opt_parser = get_option_parser()
+    (options, args) = opt_parser.parse_args()
+
+    api_file = None
+    if not options.plan and not options.worker:
+        if len(args) < 1:
+            opt_parser.error('API filename is missing')
+
+        api_file = args[0]
+        if not os.path.isfile(api_file):
+            opt_parser.error('<api-file> is not a file.')
+
+        file_format = options.format
+        if not file_format or file_format not in ['openapi']:
+            opt_parser.error('Invalid API file FORMAT. Can be \'openapi\'.')
+
+    if not options.config_filename and not options.generate_config_filename and not options.fire \
+            and not options.plan and not options.worker:
+        opt_parser.error('Please provide either a config file (-c) or generate a new one (-g). Or use --fire.')
+
+    if options.save_plan and (not options.config_filename or options.plan):
+        opt_parser.error('Please provide the config file (-c) and the API file to create a run plan.')
+
+    if options.plan and options.config_filename:
+        opt_parser.error('A run plan already contains the config. Please create a new plan instead of using -c.')
+
+    if os.name == 'nt':
+        # Enables ANSI colors on windows-shell
+        os.system("color")
+
+    configure_logging(opt_parser, options)
+
+    if options.worker:
+        # The coordinator sends the parsed requests and the config
+        parser = None
+    elif options.plan:
+        from modules.plan import RunPlan
+        try:
+            parser = RunPlan.load(options.plan)
+        except ValueError as ex:
+            print("[E] Error occurred while loading run plan: %s" % ex)
+            sys.exit(2)
+        api_file = parser.get_api_file()
+    else:
+        try:
+            parser = get_parser(file_format)
+            parser.parse_file(api_file)
+        except ValueError as ex:
+            print("[E] Error occurred while processing API file: %s" % ex)
+            sys.exit(2)
+
+    metrics = start_metrics(opt_parser, options)
+    capture = start_capture(opt_parser, options)
+
+    try:
+        if options.worker:
+            work(opt_parser, options, metrics, capture)
+            sys.exit(0)
+
+        if options.fire:
+            fire(opt_parser, options, parser, metrics, capture)
+
+        if options.generate_config_filename:
+            generate_config(options, parser)
+            sys.exit(0)
+
+        if options.save_plan:
+            save_plan(options, parser, api_file)
+            sys.exit(0)
+
+        reporters = get_reporters(opt_parser, options, api_file)
+
+        if options.plan:
+            knock(opt_parser, options, parser, parser.get_knocker_config(), metrics, capture, reporters)
+        elif options.config_filename:
+            knock(opt_parser, options, parser, load_knocker_config(options), metrics, capture, reporters)
+    finally:
+        if metrics:
+            stop_metrics(options, metrics)
+        if capture:
+            if capture.finish():
+                print("[+] Written captured traffic to %s." % options.capture)
+            else:
+                print("[E] The captured traffic in %s is incomplete." % options.capture)
 
 
 if __name__ == '__main__':
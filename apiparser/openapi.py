@@ -1,4 +1,3 @@
-import yaml
 import json
 import logging
 
@@ -12,18 +11,29 @@ class OpenAPIParser:
     _host = None
     _scheme = None
     _base_path = None
+    _schema_compiler = None
 
     def parse_file(self, file_name):
         with open(file_name, "r") as api_file:
+            content = api_file.read()
+
+        self._api_spec = None
+        self._requests = []
+        self._schema_compiler = None
+        if file_name.lower().endswith(".json"):
+            # JSON files are loaded without the (slow) YAML parser, which is only imported if it is needed
+            try:
+                self._api_spec = json.loads(content)
+            except json.JSONDecodeError:
+                pass
+
+        if self._api_spec is None:
+            import yaml
             try:
-                # First try to load as YAML
-                self._api_spec = yaml.safe_load(api_file)
+                # YAML is a superset of JSON, so this also loads JSON files with another extension
+                self._api_spec = yaml.safe_load(content)
             except yaml.YAMLError:
-                # If it is not a YAML, try to load as JSON
-                try:
-                    self._api_spec = json.load(api_file)
-                except json.JSONDecodeError:
-                    raise TypeError("Invalid file provided, as it can neither be parsed as YAML nor JSON.")
+                raise TypeError("Invalid file provided, as it can neither be parsed as YAML nor JSON.")
 
         openapi_version = self._api_spec.get("openapi", None)
 
@@ -57,7 +67,9 @@ class OpenAPIParser:
                         "cookie": {},
                     },
                     "method": method,
-                    "content_type": None
+                    "content_type": None,
+                    "parameter_schemas": {},
+                    "tags": self._get_tags(self._api_spec["paths"][path][method]),
                 }
 
                 if "requestBody" in self._api_spec["paths"][path][method]:
@@ -109,9 +121,13 @@ class OpenAPIParser:
 
                         if parameter.get("in") in request["parameters"]:
                             request["parameters"][parameter.get("in")][name] = example_value
+                            request["parameter_schemas"].setdefault(parameter_in, {})[name] = \
+                                self._resolve_parameter_schema(parameter)
                         else:
                             raise ValueError("The parameter type %s is not supported. Sorry!" % parameter.get("in"))
 
+                request["response_schemas"] = self._get_response_schemas(self._api_spec["paths"][path][method])
+
                 self._requests.append(request)
 
     def _process_openapi2(self):
@@ -139,6 +155,8 @@ class OpenAPIParser:
                         "cookie": {},
                     },
                     "method": method,
+                    "parameter_schemas": {},
+                    "tags": self._get_tags(self._api_spec["paths"][path][method]),
                 }
 
                 if "parameters" in self._api_spec["paths"][path][method]:
@@ -189,11 +207,87 @@ class OpenAPIParser:
 
                             if parameter.get("in") in request["parameters"]:
                                 request["parameters"][parameter.get("in")][name] = example_value
+                                request["parameter_schemas"].setdefault(parameter_in, {})[name] = \
+                                    self._resolve_parameter_schema(parameter)
                             else:
                                 raise ValueError("The parameter type %s is not supported. Sorry!" % parameter.get("in"))
 
+                request["response_schemas"] = self._get_response_schemas(self._api_spec["paths"][path][method])
+
                 self._requests.append(request)
 
+    def _get_response_schemas(self, operation):
+        """
+        Collects the JSON schemas of the responses of an operation. References in the schemas are kept, they are only
+        resolved when a schema is compiled.
+        :return: A dict mapping the status code (e.g. "200" or "default") to the schema
+        """
+        response_schemas = {}
+        responses = operation.get("responses") if isinstance(operation, dict) else None
+
+        for status, response in (responses or {}).items():
+            if not isinstance(response, dict):
+                continue
+            if "$ref" in response:
+                response = self._parse_reference(response)
+
+            if self._api_version == 3:
+                # The schema of the first JSON media type is used
+                schema = None
+                for media_type, content in (response.get("content") or {}).items():
+                    if "json" in media_type and isinstance(content, dict) and "schema" in content:
+                        schema = content["schema"]
+                        break
+            else:
+                schema = response.get("schema")
+
+            if isinstance(schema, dict):
+                response_schemas[str(status)] = schema
+
+        return response_schemas
+
+    def resolve_reference(self, reference):
+        """
+        :param reference: A local reference, e.g. "#/components/schemas/Pet"
+        :return: The part of the API file the reference points to
+        """
+        if not isinstance(reference, str) or not reference.startswith("#/"):
+            raise ValueError(
+                "A reference was defined, however only local references are supported at the moment.")
+
+        current_item = self._api_spec
+        for reference_path in reference[2:].split("/"):
+            reference_path = reference_path.replace("~1", "/").replace("~0", "~")
+            if not isinstance(current_item, dict) or reference_path not in current_item:
+                raise ValueError("Could not find reference path %s" % reference_path)
+            current_item = current_item[reference_path]
+
+        return current_item
+
+    def get_schema_compiler(self):
+        """
+        :return: The SchemaCompiler for the response schemas. It compiles every referenced schema only once, so it is
+        shared by all operations.
+        """
+        if self._schema_compiler is None:
+            from modules.schema import SchemaCompiler
+            self._schema_compiler = SchemaCompiler(self.resolve_reference)
+        return self._schema_compiler
+
+    def get_referenced_schemas(self):
+        """
+        :return: A dict mapping every reference used by the response schemas (also indirectly) to its schema
+        """
+        from modules.schema import collect_references
+        return collect_references(
+            [schema for request in self._requests for schema in (request.get("response_schemas") or {}).values()],
+            self.resolve_reference)
+
+    @staticmethod
+    def _get_tags(operation):
+        tags = operation.get("tags") if isinstance(operation, dict) else None
+        return [str(tag) for tag in tags] if isinstance(tags, list) else []
+
     def get_parsed_requests(self):
         if len(self._requests) <= 0:
             raise ValueError("Either no file at all or an empty file was parsed.")
@@ -228,6 +322,13 @@ class OpenAPIParser:
 
         return current_item
 
+    def _resolve_parameter_schema(self, parameter):
+        # Returns the schema of a parameter with all references resolved. In OpenAPI v2 the parameter itself is it.
+        schema = parameter.get("schema", parameter)
+        while "$ref" in schema:
+            schema = self._parse_reference(schema)
+        return schema
+
     def _parse_schema(self, path, method, schema):
         try:
             if "$ref" in schema or "schema" in schema and "$ref" in schema["schema"]:
@@ -0,0 +1,164 @@
+"""
+Measures the cost of the response schema check for a large API file.
+
+    python benchmarks/schema.py [--operations N] [--runs N]
+
+Prints the time to parse the API file, the size of its run plan, the time to compile the checks with and without
+response_schema checks and the time to validate a response body compared to a request against a local server.
+"""
+from optparse import OptionParser
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from apiparser.openapi import OpenAPIParser  # noqa: E402
+from modules.knockerconfig import KnockerConfig  # noqa: E402
+from modules.plan import RunPlan  # noqa: E402
+from modules.schema import SchemaCompiler  # noqa: E402
+from modules.tester import Tester  # noqa: E402
+
+# Every operation references one of these component schemas, which reference each other (and themselves)
+COMPONENTS = 50
+
+
+def build_spec(operations):
+    """
+    :return: An OpenAPI v3 API file with the given number of operations sharing COMPONENTS component schemas
+    """
+    schemas = {
+        "Error": {"type": "object", "required": ["error"], "properties": {"error": {"type": "string"}}},
+    }
+    for number in range(COMPONENTS):
+        schemas["Item%d" % number] = {
+            "type": "object",
+            "required": ["id", "name"],
+            "properties": {
+                "id": {"type": "integer", "minimum": 1},
+                "name": {"type": "string", "minLength": 1, "maxLength": 100},
+                "state": {"type": "string", "enum": ["new", "active", "deleted"]},
+                "owner": {"$ref": "#/components/schemas/Item%d" % ((number + 1) % COMPONENTS)},
+                "children": {"type": "array", "items": {"$ref": "#/components/schemas/Item%d" % number}},
+            },
+        }
+
+    paths = {}
+    for number in range(operations):
+        paths["/items%d/{id}" % number] = {
+            "get": {
+                "parameters": [{"name": "id", "in": "path", "required": True, "schema": {"type": "integer"}}],
+                "responses": {
+                    "200": {"description": "ok", "content": {"application/json": {
+                        "schema": {"$ref": "#/components/schemas/Item%d" % (number % COMPONENTS)}}}},
+                    "403": {"description": "denied", "content": {"application/json": {
+                        "schema": {"$ref": "#/components/schemas/Error"}}}},
+                },
+            },
+        }
+
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "schema", "version": "1"},
+        "servers": [{"url": "http://127.0.0.1/"}],
+        "paths": paths,
+        "components": {"schemas": schemas},
+    }
+
+
+def build_config(requests, checks):
+    """
+    :param checks: Whether the operations use response_schema checks
+    """
+    auth_matrix = {}
+    for request in requests:
+        auth_matrix.setdefault(request["path"], {})[request["method"]] = {
+            "matrix": {"user_1": True, "user_2": False},
+            "success": ["response_schema", 200] if checks else ["http_code", 200],
+            "blocked": ["response_schema", 403] if checks else ["http_code", 403],
+        }
+    knocker_conf = KnockerConfig()
+    knocker_conf.load_config({"content_type": "json", "user_count": 2, "auth_matrix": auth_matrix})
+    return knocker_conf
+
+
+def build_body(children):
+    return {"id": 1, "name": "item", "state": "active", "owner": {"id": 2, "name": "owner"},
+            "children": [{"id": number + 2, "name": "child", "state": "new"} for number in range(children)]}
+
+
+def measure(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def measure_request(runs):
+    """
+    :return: The median time of a request against a local server, i.e. without any network latency
+    """
+    from modules.transport import get_transport
+    from tests.server import LocalServer
+
+    transport = get_transport("requests")
+    try:
+        with LocalServer() as server:
+            return measure(lambda: transport.request("get", server.url + "echo", params={"id": "1"}).content, runs)
+    finally:
+        transport.close()
+
+
+def main():
+    opt_parser = OptionParser(usage="%prog [--operations N] [--runs N]")
+    opt_parser.add_option("--operations", dest="operations", type="int", default=5000,
+                          help="operations of the API file (default 5000)")
+    opt_parser.add_option("--runs", dest="runs", type="int", default=5, help="runs per measurement (default 5)")
+    options, _ = opt_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        api_file = os.path.join(directory, "api.json")
+        with open(api_file, "w") as spec_file:
+            json.dump(build_spec(options.operations), spec_file)
+
+        def parse():
+            parser = OpenAPIParser()
+            parser.parse_file(api_file)
+            return parser
+
+        print("Parsing %d operations: %.1f ms" % (options.operations, measure(parse, options.runs) * 1000))
+
+        parser = parse()
+        requests = parser.get_parsed_requests()
+        plan_file = os.path.join(directory, "plan.json")
+        RunPlan.build(requests, build_config(requests, True), "http://127.0.0.1/", api_file,
+                      parser.get_referenced_schemas()).save(plan_file)
+        print("Run plan: %.1f MB, loaded in %.1f ms" % (
+            os.path.getsize(plan_file) / 1000000.0, measure(lambda: RunPlan.load(plan_file), options.runs) * 1000))
+
+        for checks in (False, True):
+            knocker_conf = build_config(requests, checks)
+            # Every run starts with a new compiler, which has not compiled any referenced schema yet
+            print("Compiling the checks %s response_schema: %.1f ms" % ("with" if checks else "without", measure(
+                lambda: Tester(requests, knocker_conf, None, {}, print_results=False,
+                               schema_compiler=SchemaCompiler(parser.resolve_reference)), options.runs) * 1000))
+
+    validator = parser.get_schema_compiler().compile({"$ref": "#/components/schemas/Item0"})
+    request_time = measure_request(options.runs * 20)
+    print("Request against a local server: %.3f ms" % (request_time * 1000))
+    for children in (0, 10, 100):
+        body = json.dumps(build_body(children))
+        validation_time = measure(lambda: validator(json.loads(body), "$"), options.runs * 20)
+        print("Validating a body with %3d children (%6d bytes): %.3f ms (%.1f%% of the request)" % (
+            children, len(body), validation_time * 1000, validation_time / request_time * 100))
+
+
+if __name__ == '__main__':
+    main()
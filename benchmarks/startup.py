@@ -0,0 +1,104 @@
+"""
+Measures the startup time of apiknock.py for the code paths, which never touch the network.
+
+    python benchmarks/startup.py [--runs N]
+
+Prints the median wall time of every command and the modules apiknock imports itself, sorted by their cumulative
+import time (python -X importtime).
+"""
+from optparse import OptionParser
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APIKNOCK = os.path.join(ROOT, "apiknock.py")
+
+SPEC = {
+    "swagger": "2.0",
+    "info": {"title": "startup", "version": "1"},
+    "host": "127.0.0.1",
+    "schemes": ["http"],
+    "paths": {
+        "/items/{id}": {
+            "get": {
+                "parameters": [{"name": "id", "in": "path", "required": True, "type": "integer"}],
+                "responses": {"200": {"description": "ok", "schema": {"$ref": "#/definitions/Item"}}},
+            },
+        },
+    },
+    "definitions": {"Item": {"type": "object", "properties": {"id": {"type": "integer"}}}},
+}
+
+
+def write_spec(directory, spec=None):
+    """
+    :return: The path of a small Swagger 2.0 API file in directory
+    """
+    path = os.path.join(directory, "api.json")
+    with open(path, "w") as spec_file:
+        json.dump(spec or SPEC, spec_file)
+    return path
+
+
+def get_commands(directory):
+    spec = write_spec(directory)
+    return {
+        "--help": [APIKNOCK, "--help"],
+        "-g": [APIKNOCK, "-f", "openapi", "-g", os.path.join(directory, "config.json"), spec],
+    }
+
+
+def run(command, import_time=False):
+    """
+    Runs apiknock.py. The number of users asked for by -g is answered with 2.
+    :return: The wall time in seconds and the output of -X importtime (empty unless import_time is set)
+    """
+    arguments = [sys.executable] + (["-X", "importtime"] if import_time else []) + command
+    start = time.perf_counter()
+    process = subprocess.run(arguments, input="2\n", stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, cwd=ROOT, timeout=120)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError("%s failed: %s" % (" ".join(command), process.stderr[-2000:]))
+    return elapsed, process.stderr
+
+
+def parse_import_times(output):
+    """
+    :return: A dict mapping every imported module to its cumulative import time in seconds
+    """
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            import_times[name.strip()] = int(cumulative) / 1000000.0
+    return import_times
+
+
+def main():
+    opt_parser = OptionParser(usage="%prog [--runs N]")
+    opt_parser.add_option("--runs", dest="runs", type="int", default=10, help="runs per command (default 10)")
+    options, _ = opt_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, command in get_commands(directory).items():
+            times = [run(command)[0] for _ in range(options.runs)]
+            _, output = run(command, import_time=True)
+            own_modules = sorted(((seconds, module) for module, seconds in parse_import_times(output).items()
+                                  if module.split(".")[0] in ("modules", "apiparser")), reverse=True)
+
+            print("apiknock.py %s: median %.1f ms, min %.1f ms (%d runs)" % (
+                name, statistics.median(times) * 1000, min(times) * 1000, options.runs))
+            for seconds, module in own_modules:
+                print("    %-30s %7.1f ms" % (module, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
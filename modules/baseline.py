@@ -0,0 +1,70 @@
+from .histogram import LatencyHistogram
+import json
+
+
+class LatencyBaseline:
+    """
+    Collects the request durations of a run per operation in a LatencyHistogram, so the memory stays constant no matter
+    how many requests are sent. The p90 latencies can be stored as baseline and compared to the ones of a previous run
+    to detect performance regressions.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+
+    @staticmethod
+    def _operation(method, path):
+        return "%s %s" % (method.upper(), path)
+
+    def add_result(self, result):
+        if result.duration is None:
+            return
+        operation = self._operation(result.method, result.path)
+        histogram = self._histograms.get(operation)
+        if histogram is None:
+            histogram = self._histograms[operation] = LatencyHistogram()
+        histogram.record(result.duration)
+
+    def get_p90(self):
+        """
+        :return: A dict mapping "METHOD path" to the p90 latency of the operation in milliseconds
+        """
+        return {operation: histogram.percentile(90) * 1000 for operation, histogram in self._histograms.items()}
+
+    def save(self, path):
+        baseline = {
+            "version": 1,
+            "operations": {
+                operation: {"p90_ms": round(p90, 3), "samples": self._histograms[operation].count}
+                for operation, p90 in self.get_p90().items()
+            },
+        }
+        with open(path, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a baseline written by save().
+        :return: A dict mapping "METHOD path" to the p90 latency of the operation in milliseconds
+        """
+        try:
+            with open(path, "r") as baseline_file:
+                baseline = json.load(baseline_file)
+            return {operation: float(values["p90_ms"]) for operation, values in baseline["operations"].items()}
+        except (IOError, ValueError, KeyError, TypeError) as ex:
+            raise ValueError("Could not load latency baseline %s: %s" % (path, ex))
+
+    def find_regressions(self, baseline, ratio):
+        """
+        Compares the current p90 latencies with a baseline.
+        :param baseline: The baseline as returned by load()
+        :param ratio: The factor by which the p90 latency of an operation may grow before it counts as regression
+        :return: List of (method, path, current p90, baseline p90) for every regressed operation
+        """
+        regressions = []
+        for operation, p90 in self.get_p90().items():
+            if operation in baseline and p90 > baseline[operation] * ratio:
+                method, path = operation.split(" ", 1)
+                regressions.append((method.lower(), path, p90, baseline[operation]))
+        return regressions
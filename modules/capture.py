@@ -0,0 +1,268 @@
+from urllib.parse import urlencode
+import datetime
+import json
+import logging
+import queue
+import random
+import threading
+
+logger = logging.getLogger('apiknock')
+
+HAR = "har"
+JSONL = "jsonl"
+
+REDACTED = "[REDACTED]"
+# Headers, which carry credentials in (almost) every API
+SENSITIVE_HEADERS = frozenset(["authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key"])
+
+
+class TrafficCapture:
+    """
+    Writes the requests sent and the responses received to a HAR or JSONL file. The Requester only puts the raw
+    exchanges into a bounded queue, a background thread formats and writes them. If the writer can't keep up, exchanges
+    are dropped instead of slowing down the run.
+    Credentials are redacted and response bodies are only captured for a sample of the exchanges and truncated to a
+    maximum size. The body of a streamed response is only captured if its Content-Length is within that size, so a
+    response is never downloaded just for the capture. Bodies are only decoded by the background thread.
+    If the capture file can't be written, the capture is disabled and the run continues without it.
+    """
+    _stop = object()
+    # Seconds finish() waits for the writer to accept the stop signal
+    _stop_timeout = 10.0
+
+    def __init__(self, filename, capture_format=HAR, max_body_size=4096, body_rate=1.0, queue_size=10000):
+        """
+        :param filename: The capture file
+        :param capture_format: Either HAR or JSONL (one HAR entry per line)
+        :param max_body_size: Bodies are truncated to this many characters
+        :param body_rate: The fraction of exchanges whose bodies are captured (0 to 1)
+        :param queue_size: The maximum number of exchanges waiting to be written
+        """
+        if capture_format not in (HAR, JSONL):
+            raise ValueError("Invalid capture format %s. Can be '%s' or '%s'." % (capture_format, HAR, JSONL))
+        if not 0 <= body_rate <= 1:
+            raise ValueError("The body capture rate has to be between 0 and 1.")
+        if max_body_size < 0:
+            raise ValueError("The maximum body size can't be negative.")
+
+        self._filename = filename
+        self._format = capture_format
+        self._max_body_size = max_body_size
+        self._body_rate = body_rate
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._writer = None
+        self._entries = 0
+        self._dropped = 0
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._file = open(self._filename, "w", encoding="utf-8")
+        if self._format == HAR:
+            self._file.write('{"log":{"version":"1.2","creator":{"name":"apiknock","version":"1"},"entries":[')
+
+        self._writer = threading.Thread(target=self._write_entries, name="apiknock-capture", daemon=True)
+        self._writer.start()
+
+    def add(self, elapsed, method, url, request_kwargs, response, secrets):
+        """
+        Queues an exchange. Called by the Requester for every response.
+        :param elapsed: The time in seconds until the response headers were received
+        :param request_kwargs: The arguments the request was sent with (params, headers, cookies, json, data, files)
+        :param response: The response object produced by Python requests module
+        :param secrets: Dict with the names of "header", "cookie" and "query" parameters carrying credentials
+        """
+        if self._disabled:
+            return
+
+        started = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=elapsed)
+
+        body = None
+        if self._body_rate and (self._body_rate >= 1 or random.random() < self._body_rate):
+            body = self._read_body(method, url, request_kwargs, response)
+
+        exchange = (started, elapsed, method, url, request_kwargs, response.status_code, response.reason,
+                    list(response.headers.items()), body, secrets)
+        try:
+            self._queue.put_nowait(exchange)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _read_body(self, method, url, request_kwargs, response):
+        """
+        :return: The raw body truncated right away, so the queued exchanges can't take up much memory, and its length.
+        None if the body is not captured.
+        """
+        # A character takes up to 4 bytes in UTF-8
+        limit = self._max_body_size * 4
+        if request_kwargs.get("stream"):
+            # The body of a streamed response has not been downloaded yet. It is only read if it is small, otherwise
+            # it is left to the checks, which may not need it at all.
+            try:
+                length = int(response.headers.get("Content-Length"))
+            except (TypeError, ValueError):
+                return None
+            if length > limit:
+                return None
+
+        try:
+            content = response.content or b""
+        except (OSError, ValueError) as ex:
+            logger.warning("Could not read the response body of %s %s for the capture: %s" % (method, url, ex))
+            return None
+        return content[:limit], len(content)
+
+    def _truncate(self, text):
+        """
+        :return: The text truncated to the maximum body size and its original length
+        """
+        return text[:self._max_body_size], len(text)
+
+    @staticmethod
+    def _decode(data, content_type):
+        """
+        :return: The body decoded with the charset of its content type, UTF-8 by default
+        """
+        _, _, charset = content_type.partition("charset=")
+        try:
+            return data.decode(charset.split(";")[0].strip() or "utf-8", errors="replace")
+        except LookupError:
+            return data.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _redact(pairs, names):
+        return [{"name": str(name), "value": REDACTED if str(name).lower() in names else str(value)}
+                for name, value in pairs]
+
+    def _build_entry(self, exchange):
+        started, elapsed, method, url, request_kwargs, status_code, reason, response_headers, body, secrets = exchange
+
+        header_names = SENSITIVE_HEADERS | set(name.lower() for name in secrets.get("header", []))
+        query_names = set(name.lower() for name in secrets.get("query", []))
+        cookie_names = set(name.lower() for name in secrets.get("cookie", []))
+
+        query_string = self._redact((request_kwargs.get("params") or {}).items(), query_names)
+        cookies = self._redact((request_kwargs.get("cookies") or {}).items(), cookie_names)
+
+        request = {
+            "method": method.upper(),
+            "url": url + ("?" + urlencode([(pair["name"], pair["value"]) for pair in query_string])
+                          if query_string else ""),
+            "httpVersion": "HTTP/1.1",
+            "headers": self._redact((request_kwargs.get("headers") or {}).items(), header_names),
+            "queryString": query_string,
+            "cookies": cookies,
+            "headersSize": -1,
+            "bodySize": -1,
+        }
+
+        if request_kwargs.get("json") is not None:
+            post_data = {"mimeType": "application/json", "text": json.dumps(request_kwargs["json"])}
+        elif request_kwargs.get("data") is not None:
+            data = request_kwargs["data"]
+            post_data = {"mimeType": "application/x-www-form-urlencoded",
+                         "text": urlencode(data) if isinstance(data, dict) else str(data)}
+        elif request_kwargs.get("files") is not None:
+            post_data = {"mimeType": "multipart/form-data", "text": ""}
+        else:
+            post_data = None
+
+        if post_data is not None:
+            post_data["text"], size = self._truncate(post_data["text"])
+            if size > self._max_body_size:
+                post_data["comment"] = "truncated from %d characters" % size
+            request["postData"] = post_data
+
+        content_type = ""
+        for name, value in response_headers:
+            if name.lower() == "content-type":
+                content_type = value
+
+        content = {"size": -1, "mimeType": content_type}
+        if body is not None:
+            data, content["size"] = body
+            text = self._decode(data, content_type)
+            content["text"] = text[:self._max_body_size]
+            if content["size"] > len(data) or len(text) > self._max_body_size:
+                content["comment"] = "truncated from %d bytes" % content["size"]
+        else:
+            content["comment"] = "body not captured"
+
+        return {
+            "startedDateTime": started.isoformat(),
+            "time": round(elapsed * 1000, 3),
+            "request": request,
+            "response": {
+                "status": status_code,
+                "statusText": reason or "",
+                "httpVersion": "HTTP/1.1",
+                "headers": self._redact(response_headers, SENSITIVE_HEADERS),
+                "cookies": [],
+                "content": content,
+                "redirectURL": "",
+                "headersSize": -1,
+                "bodySize": -1,
+            },
+            "cache": {},
+            "timings": {"send": 0, "wait": round(elapsed * 1000, 3), "receive": 0},
+        }
+
+    def _write_entries(self):
+        while True:
+            exchange = self._queue.get()
+            if exchange is self._stop:
+                return
+            if self._disabled:
+                # The exchanges queued before the capture was disabled are discarded
+                continue
+
+            try:
+                entry = json.dumps(self._build_entry(exchange))
+            except (TypeError, ValueError) as ex:
+                logger.error("Could not capture %s %s: %s" % (exchange[2], exchange[3], ex))
+                continue
+
+            try:
+                if self._format == HAR:
+                    self._file.write("%s%s" % ("," if self._entries else "", entry))
+                else:
+                    self._file.write(entry + "\n")
+            except OSError as ex:
+                logger.error("Could not write to capture file %s, the capture is stopped: %s" % (self._filename, ex))
+                self._disabled = True
+                continue
+            self._entries += 1
+
+    def finish(self):
+        """
+        Writes the remaining exchanges and closes the capture file.
+        :return: False if the capture file could not be written completely
+        """
+        if self._writer is not None:
+            try:
+                self._queue.put(self._stop, timeout=self._stop_timeout)
+            except queue.Full:
+                # The writer is stuck, e.g. on a hanging file system. It is a daemon thread, so it does not keep the
+                # process alive, but the file must not be closed under its hands.
+                logger.error("The capture file %s could not be finished in time." % self._filename)
+                return False
+            self._writer.join()
+            self._writer = None
+
+        if self._file is not None:
+            try:
+                if self._format == HAR and not self._disabled:
+                    self._file.write("]}}")
+                self._file.close()
+            except OSError as ex:
+                logger.error("Could not close capture file %s: %s" % (self._filename, ex))
+                self._disabled = True
+            self._file = None
+
+        if self._dropped:
+            print("[W] %d exchanges were not captured, as the capture file could not be written fast enough." %
+                  self._dropped)
+
+        return not self._disabled
@@ -0,0 +1,147 @@
+ALL = "all"
+ANY = "any"
+NOT = "not"
+
+# Checks, which only need the status line and the headers of a response, are cheap. Everything that needs the body
+# forces its download and is evaluated last.
+CHECKER_COSTS = {
+    'http_code': 0,
+    'http_header': 0,
+    'max_latency_ms': 0,
+    'http_body': 10,
+    'response_schema': 20,
+}
+DEFAULT_COST = 10
+
+
+class Check:
+    """
+    A single [checker, value] check.
+    """
+
+    def __init__(self, name, checker, value):
+        self.name = name
+        self.cost = CHECKER_COSTS.get(name, DEFAULT_COST)
+        self._checker = checker
+        self._value = value
+
+    def __call__(self, response):
+        return self._checker(response, self._value)
+
+
+class AllCheck:
+    """
+    Succeeds if all sub-checks succeed. The cheapest sub-checks are evaluated first and the evaluation stops at the
+    first failing one.
+    """
+    _operator = " AND "
+
+    def __init__(self, checks):
+        self._checks = sorted(checks, key=lambda check: check.cost)
+        self.cost = sum(check.cost for check in self._checks)
+
+    def _stops_at(self, success):
+        return not success
+
+    def __call__(self, response):
+        messages = []
+        success = False
+        for check in self._checks:
+            result = check(response)
+            messages.append(result["message"])
+            success = result["success"]
+            if self._stops_at(success):
+                break
+
+        return {
+            "success": success,
+            "message": "(%s)" % self._operator.join(messages) if len(messages) > 1 else messages[0],
+        }
+
+
+class AnyCheck(AllCheck):
+    """
+    Succeeds if at least one sub-check succeeds. The cheapest sub-checks are evaluated first and the evaluation stops at
+    the first successful one.
+    """
+    _operator = " OR "
+
+    def _stops_at(self, success):
+        return success
+
+
+class NotCheck:
+    """
+    Inverts the result of its sub-check.
+    """
+
+    def __init__(self, check):
+        self._check = check
+        self.cost = check.cost
+
+    def __call__(self, response):
+        result = self._check(response)
+        return {
+            "success": not result["success"],
+            "message": "NOT (%s)" % result["message"],
+        }
+
+
+def compile_check(definition, checker_dict):
+    """
+    Compiles a check definition of the knocker config into a callable, which takes the response and returns a dict with
+    "success" and "message" just like the single checkers. A definition is either a [checker, value] pair or a boolean
+    combination of definitions:
+        {"all": [definition, ...]}, {"any": [definition, ...]} or {"not": definition}
+    :param definition: The check definition
+    :param checker_dict: The available checkers by name
+    :return: The compiled check
+    """
+    if isinstance(definition, dict):
+        if len(definition) != 1:
+            raise ValueError("A combined check needs exactly one of \"%s\", \"%s\" or \"%s\": %s" % (
+                ALL, ANY, NOT, definition))
+
+        operator, operands = next(iter(definition.items()))
+
+        if operator == NOT:
+            return NotCheck(compile_check(operands, checker_dict))
+
+        if operator in (ALL, ANY):
+            if not isinstance(operands, list) or len(operands) < 1:
+                raise ValueError("\"%s\" needs a list of checks." % operator)
+
+            checks = [compile_check(operand, checker_dict) for operand in operands]
+            return AllCheck(checks) if operator == ALL else AnyCheck(checks)
+
+        raise ValueError("Invalid check combination %s. Can be \"%s\", \"%s\" or \"%s\"." % (operator, ALL, ANY, NOT))
+
+    if not isinstance(definition, list) or len(definition) != 2:
+        raise ValueError("A check has to be a [checker, value] pair: %s" % (definition,))
+
+    if definition[0] not in checker_dict:
+        raise ValueError("Invalid check method %s." % definition[0])
+
+    return Check(definition[0], checker_dict[definition[0]], definition[1])
+
+
+def get_check_values(definition, name):
+    """
+    Collects the values a checker is used with in a check definition, e.g. the status codes of all response_schema
+    checks. Invalid definitions are skipped, compile_check() reports them.
+    :param definition: The check definition
+    :param name: The name of the checker
+    :return: The list of values
+    """
+    if isinstance(definition, dict):
+        values = []
+        for operator, operands in definition.items():
+            if operator != NOT and not isinstance(operands, list):
+                continue
+            for operand in [operands] if operator == NOT else operands:
+                values.extend(get_check_values(operand, name))
+        return values
+
+    if isinstance(definition, list) and len(definition) == 2 and definition[0] == name:
+        return [definition[1]]
+    return []
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger('apiknock')
+
+
+class ResponseDigester:
+    """
+    Reduces a response to a digest, so the responses of different users to the same request can be compared without
+    keeping the bodies. Without volatile fields the body is hashed while it is streamed. With volatile fields (e.g.
+    timestamps or request IDs), JSON bodies are parsed and hashed in a normalized form without these fields, so
+    responses containing the same data still have the same digest.
+    """
+    _chunk_size = 65536
+
+    def __init__(self, volatile_fields=None):
+        """
+        :param volatile_fields: Names of JSON object fields, which are ignored wherever they occur
+        """
+        self._volatile_fields = frozenset(volatile_fields or [])
+
+    def _strip(self, value):
+        if isinstance(value, dict):
+            return {key: self._strip(item) for key, item in value.items() if key not in self._volatile_fields}
+        if isinstance(value, list):
+            return [self._strip(item) for item in value]
+        return value
+
+    def digest(self, response):
+        """
+        :param response: The response object produced by Python requests module
+        :return: The hex digest of status code and body, or None if the body is empty
+        """
+        digest = hashlib.sha256(b"%d\n" % response.status_code)
+
+        if self._volatile_fields:
+            try:
+                body = json.loads(response.text)
+            except ValueError:
+                # Bodies, which are not JSON, are hashed as they are
+                pass
+            else:
+                digest.update(json.dumps(self._strip(body), sort_keys=True, separators=(",", ":")).encode("utf-8"))
+                return digest.hexdigest()
+
+        size = 0
+        for chunk in response.iter_content(self._chunk_size):
+            digest.update(chunk)
+            size += len(chunk)
+
+        return digest.hexdigest() if size else None
@@ -0,0 +1,638 @@
+from .reporter import Outcome
+from .resultstore import ResultStore
+from collections import deque
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+logger = logging.getLogger('apiknock')
+
+PROTOCOL_VERSION = 2
+# Seconds a client has to authenticate after connecting to the coordinator
+HANDSHAKE_TIMEOUT = 10.0
+
+
+def parse_address(address):
+    """
+    :param address: Either HOST:PORT (e.g. 127.0.0.1:7070 or [::1]:7070) or unix:PATH
+    :return: The socket family and the address as needed by bind() and connect()
+    """
+    if address.startswith("unix:"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not supported on this platform.")
+        return socket.AF_UNIX, address[len("unix:"):]
+
+    host, separator, port = address.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ValueError("Invalid address %s. Can be HOST:PORT or unix:PATH." % address)
+
+    host = host.strip("[]") or "127.0.0.1"
+    return socket.AF_INET6 if ":" in host else socket.AF_INET, (host, int(port))
+
+
+def sign(key, *parts):
+    """
+    :return: The HMAC-SHA256 of the parts as hex string
+    """
+    return hmac.new(key, "\n".join(parts).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def get_session_keys(secret, challenge, worker_challenge):
+    """
+    :param secret: The secret shared by the coordinator and its workers
+    :param challenge: The random challenge sent by the coordinator
+    :param worker_challenge: The random challenge sent by the worker
+    :return: The keys signing the messages of the coordinator and the ones of the worker
+    """
+    return (sign(secret, "coordinator", challenge, worker_challenge).encode("ascii"),
+            sign(secret, "worker", challenge, worker_challenge).encode("ascii"))
+
+
+class Connection:
+    """
+    A socket exchanging JSON messages, one per line. After authenticate() every message is signed with a key of the
+    connection and a sequence number, so messages can neither be forged nor replayed.
+    """
+
+    def __init__(self, sock):
+        self._socket = sock
+        self._file = sock.makefile("r", encoding="utf-8")
+        self._send_lock = threading.Lock()
+        self._send_key = None
+        self._receive_key = None
+        self._sent = 0
+        self._received = 0
+
+    def set_timeout(self, timeout):
+        self._socket.settimeout(timeout)
+
+    def authenticate(self, send_key, receive_key):
+        """
+        :param send_key: The key the sent messages are signed with
+        :param receive_key: The key the received messages have to be signed with
+        """
+        self._send_key = send_key
+        self._receive_key = receive_key
+
+    def send(self, message):
+        data = json.dumps(message)
+        with self._send_lock:
+            if self._send_key is not None:
+                data = "%s %s" % (sign(self._send_key, str(self._sent), data), data)
+                self._sent += 1
+            self._socket.sendall((data + "\n").encode("utf-8"))
+
+    def receive(self):
+        """
+        :return: The next message, None if the connection was closed
+        """
+        try:
+            line = self._file.readline()
+        except (OSError, ValueError):
+            return None
+        if not line:
+            return None
+
+        data = line.rstrip("\n")
+        if self._receive_key is not None:
+            signature, _, data = data.partition(" ")
+            expected = sign(self._receive_key, str(self._received), data)
+            if not hmac.compare_digest(signature.encode("utf-8"), expected.encode("ascii")):
+                raise ValueError("Received a message with an invalid signature.")
+            self._received += 1
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise ValueError("Received an invalid message: %s" % line[:100])
+
+    def close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._file.close()
+        self._socket.close()
+
+
+class RemoteWorker:
+    """
+    The coordinator's view of a connected worker.
+    """
+
+    def __init__(self, number, connection, peer):
+        self.number = number
+        self.connection = connection
+        self.peer = peer
+        # The operations of the current batch, which are not finished yet, in the order they are tested
+        self.assigned = []
+        self.batch = None
+        # The time (time.monotonic()) by which the worker has to finish its next operation
+        self.deadline = None
+
+    def send(self, message):
+        try:
+            self.connection.send(message)
+        except OSError as ex:
+            # The reading thread notices the closed connection and reassigns the operations
+            logger.warning("Could not send to worker %d: %s" % (self.number, ex))
+
+
+class Coordinator:
+    """
+    Distributes the operations of a run to workers, which may run on other hosts. The coordinator holds the parsed
+    requests and the AuthMatrix and sends them to every worker once. The workers send the requests with their own
+    tokens to their own base URL, so the coordinator neither knows the tokens nor where they are sent to.
+    Workers ask for the next batch of operations whenever they are done with their current one, so fast workers test
+    more operations than slow ones. If there is nothing left to hand out, an idle worker takes over the second half of
+    the batch of the busiest worker (work stealing). The operations of a worker, which disconnects or does not finish
+    an operation of its batch within the lease timeout (e.g. because it hangs), are handed out again. The results of an
+    operation are sent at once when it is finished, so an operation tested twice (e.g. by the victim and the thief) is
+    only reported once.
+    The coordinator and its workers prove to each other that they know a shared secret, before the setup is sent. All
+    further messages are signed, so other clients can neither fetch the setup nor inject results. The protocol is not
+    encrypted though, so the requests and results can be read by anyone on the network.
+    """
+
+    def __init__(self, address, setup, secret, batch_size=5, lease_timeout=300.0):
+        """
+        :param address: The address to listen on, see parse_address()
+        :param setup: The dict sent to every worker: requests, schemas, knockerconf and options
+        :param secret: The secret shared by the coordinator and its workers
+        :param batch_size: The maximum number of operations handed out at once
+        :param lease_timeout: The number of seconds a worker has to finish the next operation of its batch, before
+        the batch is handed out again
+        """
+        if batch_size < 1:
+            raise ValueError("The batch size has to be at least 1.")
+        if lease_timeout <= 0:
+            raise ValueError("The lease timeout has to be greater than 0.")
+        if not secret:
+            raise ValueError("The coordinator and its workers need a shared secret.")
+
+        self._address = address
+        self._family, self._bind_address = parse_address(address)
+        self._secret = secret.encode("utf-8")
+        self._setup = dict(setup, type="setup", version=PROTOCOL_VERSION)
+        self._batch_size = batch_size
+        self._lease_timeout = lease_timeout
+
+        self._socket = None
+        self._workers = []
+        self._waiting = []
+        self._worker_count = 0
+        self._batch_count = 0
+        self._queue = deque()
+        self._remaining = set()
+        self._owners = {}
+        self._add_results = None
+        self._stop = None
+        self._running = False
+        self._closed = False
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+
+    def start(self):
+        """
+        Listens for workers in a background thread. Workers can connect before run() is called.
+        """
+        try:
+            if self._family == socket.AF_UNIX and os.path.exists(self._bind_address):
+                os.remove(self._bind_address)
+            self._socket = socket.socket(self._family, socket.SOCK_STREAM)
+            if self._family != socket.AF_UNIX:
+                self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind(self._bind_address)
+            self._socket.listen()
+        except OSError as ex:
+            raise ValueError("Could not listen on %s: %s" % (self._address, ex))
+
+        threading.Thread(target=self._accept, name="apiknock-coordinator", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, peer = self._socket.accept()
+            except OSError:
+                # The listening socket was closed
+                return
+            if self._family != socket.AF_UNIX:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if isinstance(peer, tuple):
+                peer = "%s:%d" % peer[:2]
+            threading.Thread(target=self._serve, args=(Connection(sock), peer or self._address),
+                             name="apiknock-coordinator-worker", daemon=True).start()
+
+    def _authenticate(self, connection, peer):
+        """
+        Lets a client prove that it knows the shared secret.
+        :return: True if the client is a worker of this run
+        """
+        challenge = os.urandom(16).hex()
+        connection.set_timeout(HANDSHAKE_TIMEOUT)
+        try:
+            connection.send({"type": "hello", "version": PROTOCOL_VERSION, "challenge": challenge})
+            join = connection.receive()
+        except (OSError, ValueError):
+            join = None
+        if not isinstance(join, dict) or join.get("type") != "join":
+            logger.warning("Closed the connection of %s, which did not join." % peer)
+            return False
+        if join.get("version") != PROTOCOL_VERSION:
+            print("[E] The worker %s uses an unsupported protocol version." % peer)
+            return False
+
+        worker_challenge = str(join.get("challenge"))
+        proof = sign(self._secret, "join", challenge, worker_challenge)
+        if not hmac.compare_digest(str(join.get("proof")).encode("utf-8"), proof.encode("ascii")):
+            print("[E] The worker %s was rejected, as it does not know the secret." % peer)
+            return False
+
+        connection.set_timeout(None)
+        coordinator_key, worker_key = get_session_keys(self._secret, challenge, worker_challenge)
+        connection.authenticate(coordinator_key, worker_key)
+        return True
+
+    def _serve(self, connection, peer):
+        if not self._authenticate(connection, peer):
+            connection.close()
+            return
+
+        with self._lock:
+            if self._closed:
+                connection.close()
+                return
+            self._worker_count += 1
+            worker = RemoteWorker(self._worker_count, connection, peer)
+            self._workers.append(worker)
+        print("[+] Worker %d (%s) connected." % (worker.number, peer))
+
+        try:
+            worker.send(self._setup)
+            while True:
+                message = connection.receive()
+                if message is None:
+                    break
+                self._handle(worker, message)
+        except (KeyError, TypeError, ValueError) as ex:
+            logger.error("Worker %d: %s" % (worker.number, ex))
+            print("[E] Worker %d sent an invalid message and is disconnected: %s" % (worker.number, ex))
+        finally:
+            connection.close()
+            self._remove(worker)
+
+    def _handle(self, worker, message):
+        message_type = message.get("type")
+        with self._lock:
+            if message_type == "next":
+                self._assign(worker)
+            elif message_type == "operation":
+                self._finish_operation(worker, message)
+            else:
+                raise ValueError("Unknown message type %s" % message_type)
+
+    def _assign(self, worker):
+        """
+        Hands out the next batch to a worker. Has to be called with the lock held.
+        """
+        if self._closed:
+            worker.send({"type": "done"})
+            return
+        if not self._running:
+            self._waiting.append(worker)
+            return
+
+        batch = []
+        while self._queue and len(batch) < self._batch_size:
+            operation = self._queue.popleft()
+            if operation in self._remaining:
+                batch.append(operation)
+
+        if not batch:
+            batch = self._steal()
+        if not batch:
+            # The worker gets the operations of workers, which disconnect, or is told that the run is done
+            self._waiting.append(worker)
+            return
+
+        self._batch_count += 1
+        for operation in batch:
+            self._owners[operation] = worker
+        # A worker asks for the next batch only after it finished or skipped all operations of its current one
+        worker.assigned = batch
+        worker.batch = self._batch_count
+        worker.deadline = time.monotonic() + self._lease_timeout
+        worker.send({"type": "batch", "batch": worker.batch, "operations": [list(operation) for operation in batch]})
+
+    def _steal(self):
+        """
+        Takes the second half of the unfinished operations of the busiest worker. Its first operation is left to it,
+        as the worker is most likely testing it right now.
+        :return: The stolen operations
+        """
+        victim = max(self._workers, key=lambda worker: len(worker.assigned), default=None)
+        if victim is None or len(victim.assigned) < 2:
+            return []
+
+        count = len(victim.assigned) // 2
+        stolen = victim.assigned[-count:]
+        del victim.assigned[-count:]
+        victim.send({"type": "revoke", "batch": victim.batch,
+                     "operations": [list(operation) for operation in stolen]})
+        logger.info("Moved %d operations from worker %d to an idle worker." % (count, victim.number))
+        return stolen
+
+    def _finish_operation(self, worker, message):
+        try:
+            operation = (message["path"], message["method"])
+            results = message["results"]
+            requests = int(message["requests"])
+        except (KeyError, TypeError, ValueError) as ex:
+            raise ValueError("Invalid operation message: %s" % ex)
+
+        if operation not in self._remaining:
+            # Already reported by another worker, e.g. after the operation was stolen
+            if operation in worker.assigned:
+                worker.assigned.remove(operation)
+            return
+
+        self._remaining.discard(operation)
+        owner = self._owners.pop(operation, worker)
+        if operation in owner.assigned:
+            owner.assigned.remove(operation)
+        if operation in worker.assigned:
+            worker.assigned.remove(operation)
+        # The worker is alive, so its lease is renewed for the next operation
+        worker.deadline = time.monotonic() + self._lease_timeout
+
+        self._add_results(operation[0], operation[1], results, requests)
+
+        if not self._remaining or self._stop.is_set():
+            self._finished.notify_all()
+
+    def _remove(self, worker):
+        with self._lock:
+            self._workers.remove(worker)
+            if worker in self._waiting:
+                self._waiting.remove(worker)
+
+            unfinished = [operation for operation in worker.assigned if operation in self._remaining]
+            worker.assigned = []
+            if self._closed:
+                return
+
+            if unfinished and self._running:
+                print("[W] Worker %d disconnected, %d operations are handed out again." % (
+                    worker.number, len(unfinished)))
+                self._queue.extendleft(reversed(unfinished))
+                self._serve_waiting()
+            else:
+                print("[+] Worker %d disconnected." % worker.number)
+
+    def _expire_leases(self):
+        """
+        Hands out the unfinished operations of the workers, which did not finish an operation within the lease timeout,
+        again. The operation a worker is stuck with is revoked as well. If the worker finishes it anyway, its results
+        are ignored, unless no other worker finished it before. Has to be called with the lock held.
+        """
+        now = time.monotonic()
+        expired = []
+        for worker in self._workers:
+            if not worker.assigned or worker.deadline is None or worker.deadline > now:
+                continue
+
+            unfinished = [operation for operation in worker.assigned if operation in self._remaining]
+            worker.send({"type": "revoke", "batch": worker.batch,
+                         "operations": [list(operation) for operation in worker.assigned]})
+            worker.assigned = []
+            worker.deadline = None
+            for operation in unfinished:
+                self._owners.pop(operation, None)
+            print("[W] Worker %d did not finish an operation within %g seconds, %d operations are handed out "
+                  "again." % (worker.number, self._lease_timeout, len(unfinished)))
+            expired.extend(unfinished)
+
+        if expired:
+            # The waiting workers are served first, so the expired operations go to other workers
+            self._queue.extendleft(reversed(expired))
+            self._serve_waiting()
+
+    def _serve_waiting(self):
+        waiting, self._waiting = self._waiting, []
+        for worker in waiting:
+            self._assign(worker)
+
+    def run(self, operations, add_results, stop):
+        """
+        Hands out the operations until all of them are finished.
+        :param operations: The (path, method) of every operation in the order they are handed out
+        :param add_results: Called with path, method, the results ([status, user, message, duration, variant]) and the
+        number of requests sent for every finished operation
+        :param stop: Event, which stops handing out operations when set
+        """
+        with self._lock:
+            self._queue = deque(operations)
+            self._remaining = set(operations)
+            self._add_results = add_results
+            self._stop = stop
+            self._running = True
+            print("[+] Waiting for workers on %s to test %d operations..." % (self._address, len(operations)))
+            self._serve_waiting()
+
+            try:
+                while self._remaining and not stop.is_set():
+                    # Waiting with a timeout keeps the run interruptible with Ctrl+C and checks the leases regularly
+                    self._finished.wait(0.5)
+                    self._expire_leases()
+            finally:
+                self._running = False
+                self._closed = True
+                for worker in self._workers:
+                    worker.send({"type": "done"})
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            if self._family == socket.AF_UNIX and os.path.exists(self._bind_address):
+                os.remove(self._bind_address)
+
+        for worker in workers:
+            worker.connection.close()
+
+
+class ResultBuffer(ResultStore):
+    """
+    Takes the place of the ResultStore of a worker's Tester. The results are only kept until they are sent to the
+    coordinator, which stores them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pending = []
+
+    def add(self, outcome, path, method, user, detail, duration=None, variant=None):
+        outcome = Outcome(outcome)
+        self._counts[outcome] += 1
+        self._pending.append([str(outcome), user, detail, duration, variant])
+        return self._to_result((path, method, user, outcome, detail, duration, variant))
+
+    def take(self):
+        """
+        :return: The results added since the last call as [status, user, detail, duration, variant]
+        """
+        results, self._pending = self._pending, []
+        return results
+
+
+class Worker:
+    """
+    Tests the operations handed out by a Coordinator with a local Tester and sends the results back.
+    """
+
+    def __init__(self, address, secret, connect_timeout=30.0):
+        """
+        :param address: The address of the coordinator, see parse_address()
+        :param secret: The secret shared by the coordinator and its workers
+        :param connect_timeout: The number of seconds to wait for the coordinator to listen
+        """
+        if not secret:
+            raise ValueError("The coordinator and its workers need a shared secret.")
+
+        self._address = address
+        self._secret = secret.encode("utf-8")
+        self._family, self._connect_address = parse_address(address)
+        self._connect_timeout = connect_timeout
+        self._connection = None
+        self._messages = queue.Queue()
+        self._revoked = set()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """
+        Connects to the coordinator, retrying until the connect timeout is reached.
+        :return: The setup sent by the coordinator
+        """
+        deadline = time.monotonic() + self._connect_timeout
+        while True:
+            sock = socket.socket(self._family, socket.SOCK_STREAM)
+            try:
+                sock.connect(self._connect_address)
+                break
+            except OSError as ex:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ValueError("Could not connect to the coordinator %s: %s" % (self._address, ex))
+                time.sleep(0.5)
+
+        if self._family != socket.AF_UNIX:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._connection = Connection(sock)
+
+        hello = self._connection.receive()
+        if not hello or hello.get("type") != "hello":
+            raise ValueError("%s is not an apiknock coordinator." % self._address)
+        if hello.get("version") != PROTOCOL_VERSION:
+            raise ValueError("The coordinator %s uses an unsupported protocol version." % self._address)
+
+        challenge = str(hello.get("challenge"))
+        worker_challenge = os.urandom(16).hex()
+        self._send({"type": "join", "version": PROTOCOL_VERSION, "challenge": worker_challenge,
+                    "proof": sign(self._secret, "join", challenge, worker_challenge)})
+        coordinator_key, worker_key = get_session_keys(self._secret, challenge, worker_challenge)
+        self._connection.authenticate(worker_key, coordinator_key)
+
+        # Only a coordinator knowing the secret can sign the setup
+        try:
+            setup = self._connection.receive()
+        except ValueError:
+            raise ValueError("The coordinator %s does not know the secret." % self._address)
+        if not setup or setup.get("type") != "setup":
+            raise ValueError("The coordinator %s rejected this worker. Do both use the same secret?" % self._address)
+        return setup
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._connection.receive()
+            except ValueError as ex:
+                logger.error(str(ex))
+                message = None
+
+            if message is None or message.get("type") == "done":
+                self._done.set()
+                self._messages.put(message)
+                return
+            if message.get("type") == "revoke":
+                with self._lock:
+                    self._revoked.update((message["batch"], path, method) for path, method in message["operations"])
+            else:
+                self._messages.put(message)
+
+    def _send(self, message):
+        try:
+            self._connection.send(message)
+        except OSError as ex:
+            raise ValueError("The connection to the coordinator %s was lost: %s" % (self._address, ex))
+
+    def run(self, tester, result_buffer):
+        """
+        Tests batches of operations until the coordinator is done.
+        :param tester: The Tester created from the setup
+        :param result_buffer: The ResultBuffer of the Tester
+        :return: The number of operations tested
+        """
+        # Incomplete configurations are reported by the coordinator, not by every worker
+        tester.get_operations()
+        result_buffer.take()
+
+        threading.Thread(target=self._receive, name="apiknock-worker", daemon=True).start()
+
+        tested = 0
+        while True:
+            if not self._done.is_set():
+                self._send({"type": "next"})
+            message = self._messages.get()
+            if message is None:
+                raise ValueError("The connection to the coordinator %s was lost." % self._address)
+            if message.get("type") == "done":
+                return tested
+
+            for path, method in message["operations"]:
+                if self._done.is_set():
+                    break
+                with self._lock:
+                    if (message["batch"], path, method) in self._revoked:
+                        # Taken over by another worker
+                        continue
+
+                requests = tester.get_total_requests()
+                try:
+                    tester.test_operation(path, method)
+                    results = result_buffer.take()
+                except ValueError as ex:
+                    results = result_buffer.take() + [[str(Outcome.ERROR), "-", str(ex), None, None]]
+
+                self._send({
+                    "type": "operation",
+                    "path": path,
+                    "method": method,
+                    "results": results,
+                    "requests": tester.get_total_requests() - requests,
+                })
+                tested += 1
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,85 @@
+import math
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram for latencies. Values are recorded in microseconds into log-linear buckets, so every recorded
+    value is kept with the given number of significant digits while the memory stays constant, no matter how many
+    values are recorded.
+    """
+
+    def __init__(self, significant_digits=3):
+        if significant_digits < 1 or significant_digits > 5:
+            raise ValueError("The number of significant digits has to be between 1 and 5.")
+
+        self._sub_bucket_bits = int(math.ceil(math.log2(2 * 10 ** significant_digits)))
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._sub_bucket_half = self._sub_bucket_count >> 1
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_bucket_count:
+            return value
+        shift = value.bit_length() - self._sub_bucket_bits
+        return self._sub_bucket_count + (shift - 1) * self._sub_bucket_half + (value >> shift) - self._sub_bucket_half
+
+    def _highest_value(self, index):
+        if index < self._sub_bucket_count:
+            return index
+        shift = (index - self._sub_bucket_count) // self._sub_bucket_half + 1
+        sub_bucket = (index - self._sub_bucket_count) % self._sub_bucket_half + self._sub_bucket_half
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, seconds):
+        """
+        Records a latency.
+        :param seconds: The latency in seconds
+        """
+        value = max(int(seconds * 1000000), 0)
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Adds all values of another histogram with the same precision, e.g. the one of another worker thread.
+        """
+        if other._sub_bucket_bits != self._sub_bucket_bits:
+            raise ValueError("Only histograms with the same number of significant digits can be merged.")
+
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        :param percent: The percentile, e.g. 99.9
+        :return: The latency in seconds, which percent of all recorded values are less than or equal to
+        """
+        if not self.count:
+            return 0.0
+
+        threshold = max(int(math.ceil(percent / 100.0 * self.count)), 1)
+        cumulative = 0
+        for index in sorted(self._counts):
+            cumulative += self._counts[index]
+            if cumulative >= threshold:
+                return min(self._highest_value(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def mean(self):
+        """
+        :return: The mean latency in seconds
+        """
+        return self.total / self.count / 1000000.0 if self.count else 0.0
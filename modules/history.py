@@ -0,0 +1,89 @@
+from .reporter import FAILURE
+import json
+import os
+
+HISTORY_VERSION = 1
+
+
+class RunHistory:
+    """
+    Remembers per operation how likely its cells fail and how long it takes to test it, so the next run can schedule
+    the operations accordingly. The values are exponential moving averages over the previous runs, so the history
+    follows changes of the API without being thrown off by a single run.
+    """
+    _weight = 0.5
+
+    def __init__(self, operations=None):
+        """
+        :param operations: Dict mapping "METHOD path" to {"failure_rate": ..., "duration": ...}
+        """
+        self._operations = operations or {}
+        self._current = {}
+
+    @staticmethod
+    def _operation(method, path):
+        return "%s %s" % (method.upper(), path)
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a history written by save(). A missing file is an empty history.
+        """
+        if not os.path.exists(path):
+            return RunHistory()
+
+        try:
+            with open(path, "r") as history_file:
+                history = json.load(history_file)
+            return RunHistory({
+                operation: {"failure_rate": float(values["failure_rate"]), "duration": float(values["duration"])}
+                for operation, values in history["operations"].items()
+            })
+        except (IOError, ValueError, KeyError, TypeError, AttributeError) as ex:
+            raise ValueError("Could not load run history %s: %s" % (path, ex))
+
+    def estimate(self, method, path):
+        """
+        :return: The expected failure rate of the cells of an operation and the expected time in seconds to test it.
+        Operations without history get the averages of all known operations.
+        """
+        operation = self._operations.get(self._operation(method, path))
+        if operation is not None:
+            return operation["failure_rate"], operation["duration"]
+
+        if not self._operations:
+            return 0.5, 1.0
+        return (
+            sum(values["failure_rate"] for values in self._operations.values()) / len(self._operations),
+            sum(values["duration"] for values in self._operations.values()) / len(self._operations),
+        )
+
+    def add_result(self, result):
+        if result.user == "-" or result.duration is None:
+            # Configuration errors and latency regressions are not cells
+            return
+
+        current = self._current.setdefault(self._operation(result.method, result.path), [0, 0, 0.0])
+        current[0] += 1
+        current[1] += result.status == FAILURE
+        current[2] += result.duration
+
+    def save(self, path):
+        for operation, (cells, failures, duration) in self._current.items():
+            failure_rate = failures / float(cells)
+            previous = self._operations.get(operation)
+            if previous is not None:
+                failure_rate = self._weight * failure_rate + (1 - self._weight) * previous["failure_rate"]
+                duration = self._weight * duration + (1 - self._weight) * previous["duration"]
+            self._operations[operation] = {"failure_rate": failure_rate, "duration": duration}
+        self._current = {}
+
+        history = {
+            "version": HISTORY_VERSION,
+            "operations": {
+                operation: {"failure_rate": round(values["failure_rate"], 4), "duration": round(values["duration"], 4)}
+                for operation, values in self._operations.items()
+            },
+        }
+        with open(path, "w") as history_file:
+            json.dump(history, history_file, indent=1, sort_keys=True)
@@ -0,0 +1,38 @@
+from .reporter import Reporter
+import json
+import time
+
+
+class JSONLReporter(Reporter):
+    """
+    Writes one JSON object per line for every result, which can directly be fed into log pipelines.
+    """
+
+    def __init__(self, filename, api_file=None):
+        super().__init__(filename, api_file)
+        self._file = None
+
+    def start(self):
+        # Line buffered, so that every finished result is visible to tailing consumers immediately
+        self._file = open(self._filename, "w", buffering=1, encoding="utf-8")
+
+    def add_result(self, result):
+        if self._file is None:
+            raise ValueError("The JSONL output file %s is not opened." % self._filename)
+
+        self._file.write(json.dumps({
+            "timestamp": time.time(),
+            "path": result.path,
+            "method": result.method,
+            "user": result.user,
+            "target": result.target,
+            "variant": result.variant,
+            "status": result.status,
+            "duration_ms": round(result.duration * 1000, 3) if result.duration is not None else None,
+            "message": result.message,
+        }) + "\n")
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
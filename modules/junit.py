@@ -1,13 +1,21 @@
-from .tester import Tester
+from .reporter import Reporter, SUCCESS, ERROR
 
 
-class JUnitCreator:
+class JUnitReporter(Reporter):
+    """
+    Writes the JUnit XML incrementally while the Tester is running. Every testcase is written to the output file as
+    soon as its result is known, so neither the whole document has to be kept in memory nor is everything lost if a run
+    dies. The totals are written as padded placeholders and patched in when the reporter is finished.
+    """
+    _totals_width = 64
 
-    def __init__(self, tester):
-        if tester is None or not isinstance(tester, Tester):
-            raise ValueError("No or invalid tester provided.")
-
-        self._tester = tester
+    def __init__(self, filename, api_file=None):
+        super().__init__(filename, api_file)
+        self._file = None
+        self._totals_offsets = []
+        self._tests = 0
+        self._errors = 0
+        self._failures = 0
 
     @staticmethod
     def _primitive_escape(insecure_string):
@@ -27,18 +35,21 @@ class JUnitCreator:
     @staticmethod
     def _generate_path_from_tuple(result_tuple):
         """
-        Helper function that generates a nice method /path (user) string
+        Helper function that generates a nice method /path (user) [variant] string
         :param result_tuple: The tuple generated by Tester class
         :return: the aforementioned nice string
         """
         path = result_tuple[0]
         method = result_tuple[1].upper()
         user = result_tuple[2]
-
-        return "%s %s (%s)" % (
-            JUnitCreator._primitive_escape(method),
-            JUnitCreator._primitive_escape(path),
-            JUnitCreator._primitive_escape(user)
+        # The variants of a request are tested with the same user, so they need their own testcase names
+        variant = getattr(result_tuple, "variant", None)
+
+        return "%s %s (%s)%s" % (
+            JUnitReporter._primitive_escape(method),
+            JUnitReporter._primitive_escape(path),
+            JUnitReporter._primitive_escape(user),
+            " [%s]" % JUnitReporter._primitive_escape(variant) if variant else ""
         )
 
     @staticmethod
@@ -52,66 +63,69 @@ class JUnitCreator:
         if entry_type not in ['failure', 'error', 'skipped']:
             raise ValueError("Invalid entry_type. Can be 'failure', 'error', 'skipped'.")
 
-        xml_message = JUnitCreator._generate_path_from_tuple(result_tuple)
-        xml_description = "%s: %s" % (xml_message, JUnitCreator._primitive_escape(result_tuple[3]))
+        xml_message = JUnitReporter._generate_path_from_tuple(result_tuple)
+        xml_description = "%s: %s" % (xml_message, JUnitReporter._primitive_escape(result_tuple[3]))
 
         return '<%s message="%s">%s</%s>' % (entry_type, xml_message, xml_description, entry_type)
 
-    @staticmethod
-    def _generate_testcase(entry_type, result_tuple):
+    def start(self):
         """
-        Generates the XML of testcase.
-        :param entry_type: Either failure, error or skipped
-        :param result_tuple: The tuple generated by Tester class
-        :return: XML-String for testcase
+        Opens the output file and writes the document header including the placeholders for the totals.
         """
-        if entry_type not in ['failure', 'error', 'skipped']:
-            raise ValueError("Invalid entry_type. Can be 'failure', 'error', 'skipped'.")
+        self._file = open(self._filename, "wb")
+        self._write('<?xml version="1.0" encoding="UTF-8" ?><testsuites disabled="0" name="de.secanium.apiknock" ')
+        self._totals_offsets.append(self._file.tell())
+        self._write(" " * self._totals_width)
+        self._write('><testsuite name="de.secanium.apiknock" id="0" ')
+        self._totals_offsets.append(self._file.tell())
+        self._write(" " * self._totals_width)
+        self._write('>')
+        self._file.flush()
+
+    def add_result(self, result):
+        """
+        Writes a single testcase. Successful results are written as passing testcases.
+        :param result: The Result generated by Tester class
+        """
+        if self._file is None:
+            raise ValueError("The JUnit output file %s is not opened." % self._filename)
+
+        path = self._generate_path_from_tuple(result)
+        duration = ' time="%.3f"' % result.duration if result.duration is not None else ''
+        # Results of runs against several base URLs are grouped by their base URL
+        classname = self._primitive_escape(result.target) if result.target else "de.secanium.apiknock"
+
+        if result.status == SUCCESS:
+            self._write('<testcase name="%s" classname="%s"%s />' % (path, classname, duration))
+        else:
+            entry_type = 'error' if result.status == ERROR else 'failure'
+            self._write('<testcase name="%s" classname="%s"%s>%s</testcase>' % (
+                path, classname, duration, self._generate_entry(entry_type, result)))
+
+            if entry_type == 'error':
+                self._errors += 1
+            else:
+                self._failures += 1
+
+        self._tests += 1
+        self._file.flush()
+
+    def finish(self):
+        """
+        Closes the document and patches the totals into the placeholders written by start().
+        """
+        if self._file is None:
+            return
 
-        entry = JUnitCreator._generate_entry(entry_type, result_tuple)
-        path = JUnitCreator._generate_path_from_tuple(result_tuple)
+        self._write('</testsuite></testsuites>')
 
-        return '<testcase name="%s" classname="de.secanium.apiknock">%s</testcase>' % (path, entry)
+        totals = ('tests="%d" errors="%d" failures="%d"' % (self._tests, self._errors, self._failures)).encode("utf-8")
+        for offset in self._totals_offsets:
+            self._file.seek(offset)
+            self._file.write(totals.ljust(self._totals_width))
 
-    def generate_xml(self):
-        """
-        Generates the actual JUnit XML.
-        Format:
-        <testsuites>
-            <testsuite>
-                <testcase>
-                    <error />/<failure />
-                </testcase>
-            </testsuite>
-        </testsuites>
-        :return: JUnit XML
-        """
-        error_list = self._tester.get_errors()
-        failed_list = self._tester.get_failed()
-        total_requests = self._tester.get_total_requests()
-
-        error_cases = ""
-        failed_cases = ""
-
-        for error in error_list:
-            error_cases += self._generate_testcase('error', error)
-
-        for failed in failed_list:
-            failed_cases += self._generate_testcase('failure', failed)
-
-        testsuite = '<testsuite name="de.secanium.apiknock" tests="%d" errors="%d" ' \
-                    'failures="%d" id="0">%s%s</testsuite>' % (
-                        total_requests,
-                        len(error_list),
-                        len(failed_list),
-                        error_cases,
-                        failed_cases
-                    )
-
-        return '<?xml version="1.0" encoding="UTF-8" ?><testsuites disabled="0" errors="%d" failures="%s" ' \
-               'name="de.secanium.apiknock" tests="%d">%s</testsuites>' % (
-                   len(error_list),
-                   len(failed_list),
-                   total_requests,
-                   testsuite
-               )
+        self._file.close()
+        self._file = None
+
+    def _write(self, xml_string):
+        self._file.write(xml_string.encode("utf-8"))
@@ -7,6 +7,8 @@ CONTENT_TYPE = "content_type"
 USER_COUNT = "user_count"
 PARAMETER_OVERRIDE = "parameter_override"
 
+logger = logging.getLogger('apiknock')
+
 
 class KnockerConfig:
     _valid_fields = [
@@ -22,7 +24,7 @@ class KnockerConfig:
 
     def set(self, config_name, value):
         if config_name in self._valid_fields:
-            logging.debug("Parameter %s set to %s", config_name, value)
+            logger.debug("Parameter %s set to %s", config_name, value)
             self._config[config_name] = value
         else:
             raise ValueError("Invalid configuration directive \"%s\"." % config_name)
@@ -37,15 +39,15 @@ class KnockerConfig:
         if AUTH_MATRIX not in self._config \
                 or not isinstance(self._config[AUTH_MATRIX], dict) \
                 or len(self._config[AUTH_MATRIX]) >= 1:
-            logging.error("Configuration parameter %s is missing or invalid." % AUTH_MATRIX)
+            logger.error("Configuration parameter %s is missing or invalid." % AUTH_MATRIX)
             raise ValueError("No \"%s\" configured." % AUTH_MATRIX)
 
         if USER_COUNT not in self._config or 2 <= self._config[USER_COUNT] >= 10:
-            logging.error("Configuration parameter %s is either not provided or not between 2 and 10." % USER_COUNT)
+            logger.error("Configuration parameter %s is either not provided or not between 2 and 10." % USER_COUNT)
             raise ValueError("No \"%s\" provided or not between 2 and 10" % USER_COUNT)
 
         if "content_type" not in self._config or self._config["content_type"] != "json":
-            logging.error("Configuration parameter %s is missing or invalid (currently only \"json\" is)" % CONTENT_TYPE)
+            logger.error("Configuration parameter %s is missing or invalid (currently only \"json\" is)" % CONTENT_TYPE)
             raise ValueError("\"content_type\" not provided or not supported. Currently only \"json\" works.")
 
     def generate_config_file(self, requests, path="knockerconf.json"):
@@ -68,20 +70,35 @@ class KnockerConfig:
                     "http_code", 403
                 ],
             }
+            if request.get("tags"):
+                # Only used by the configurator to filter the AuthMatrix
+                auth_matrix[request["path"]][request["method"]]["tags"] = request["tags"]
 
         self.set(AUTH_MATRIX, auth_matrix)
 
         with open(path, "w") as config_file:
-            logging.info("Trying to write ApiKnock configuration to %s" % path)
+            logger.info("Trying to write ApiKnock configuration to %s" % path)
             json.dump(self._config, config_file)
 
     def load_config_file(self, path):
         try:
             with open(path, "r") as config_file:
-                logging.info("Trying to load config file from path %s." % path)
+                logger.info("Trying to load config file from path %s." % path)
                 self._config = json.load(config_file)
         except (IOError, json.JSONDecodeError) as ex:
             msg = "Could not load config file %s: %s" % (path, ex)
-            logging.critical(msg)
+            logger.critical(msg)
             sys.stderr.write("%s\n" % msg)
             sys.exit(1)
+
+    def load_config(self, config):
+        """
+        Uses an already loaded configuration, e.g. the one stored in a run plan.
+        :param config: The configuration dict as stored in a config file
+        """
+        if not isinstance(config, dict):
+            raise ValueError("The configuration has to be a dict.")
+        self._config = config
+
+    def get_config(self):
+        return self._config
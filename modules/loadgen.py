@@ -0,0 +1,209 @@
+from .histogram import LatencyHistogram
+import bisect
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger('apiknock')
+
+
+class LoadGenerator:
+    """
+    Sends the parsed requests as load against the API. Without a target rate every worker sends its next request as
+    soon as the previous one finished (closed loop). With a target rate, the send times are scheduled up front (open
+    loop) and latencies are measured from the scheduled time, so a slow API does not hide its own queueing delay.
+    """
+
+    def __init__(self, requester, requests, auth_value=None, concurrency=1, duration=None, request_count=None,
+                 rps=None, weights=None):
+        """
+        :param requester: The Requester used to send the requests
+        :param requests: The requests as parsed by the API parser
+        :param auth_value: The authentication value used for all requests
+        :param concurrency: The number of worker threads
+        :param duration: Stop after this many seconds
+        :param request_count: Stop after this many requests
+        :param rps: The target rate in requests per second, or None to send as fast as possible
+        :param weights: Dict mapping "METHOD path" to its relative weight in the operation mix (default 1)
+        """
+        if concurrency < 1:
+            raise ValueError("The concurrency has to be at least 1.")
+        if duration is None and request_count is None:
+            raise ValueError("Either a duration or a request count is required.")
+        if rps is not None and rps <= 0:
+            raise ValueError("The target rate has to be greater than 0.")
+
+        self._requester = requester
+        self._auth_value = auth_value
+        self._concurrency = concurrency
+        self._duration = duration
+        self._request_count = request_count
+        self._rps = rps
+
+        weights = weights or {}
+        self._operations = []
+        cumulative_weights = []
+        total_weight = 0
+        for request in requests:
+            operation = "%s %s" % (request["method"].upper(), request["path"])
+            weight = float(weights.get(operation, 1))
+            if weight <= 0:
+                continue
+            total_weight += weight
+            self._operations.append((operation, requester.prepare_request(request)))
+            cumulative_weights.append(total_weight)
+
+        if not self._operations:
+            raise ValueError("No operation with a weight greater than 0.")
+
+        self._cumulative_weights = cumulative_weights
+        self._total_weight = total_weight
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._worker_stats = []
+        self._elapsed = 0
+
+    @staticmethod
+    def load_weights(path):
+        """
+        Loads the operation mix from a JSON file like {"GET /pets": 10, "POST /pets": 1}.
+        """
+        try:
+            with open(path, "r") as weights_file:
+                weights = json.load(weights_file)
+        except (IOError, ValueError) as ex:
+            raise ValueError("Could not load operation mix %s: %s" % (path, ex))
+
+        if not isinstance(weights, dict):
+            raise ValueError("The operation mix has to map \"METHOD path\" to a weight.")
+        normalized_weights = {}
+        for operation, weight in weights.items():
+            method, _, path = operation.strip().partition(" ")
+            normalized_weights["%s %s" % (method.upper(), path.strip())] = weight
+        return normalized_weights
+
+    def _choose_operation(self, rng):
+        index = bisect.bisect_right(self._cumulative_weights, rng.random() * self._total_weight)
+        return self._operations[min(index, len(self._operations) - 1)]
+
+    def _next_slot(self, start):
+        """
+        Reserves the next request.
+        :return: The time the request is scheduled for, or None if the run is finished
+        """
+        number = next(self._counter)
+        if self._request_count is not None and number >= self._request_count:
+            return None
+
+        scheduled = start + number / self._rps if self._rps else time.monotonic()
+        if self._duration is not None and scheduled - start >= self._duration:
+            return None
+        return scheduled
+
+    def _work(self, start, stats):
+        rng = random.Random()
+        while not self._stop.is_set():
+            scheduled = self._next_slot(start)
+            if scheduled is None:
+                return
+
+            delay = scheduled - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+
+            operation, prepared = self._choose_operation(rng)
+            if operation not in stats:
+                stats[operation] = {"histogram": LatencyHistogram(), "errors": 0, "status_codes": {}}
+            operation_stats = stats[operation]
+
+            try:
+                response = self._requester.send_request(auth_value=self._auth_value, **prepared)
+                response.content
+                response.close()
+                status_code = response.status_code
+            except (ValueError, OSError) as ex:
+                logger.error("Load request %s failed: %s" % (operation, ex))
+                status_code = None
+
+            operation_stats["histogram"].record(time.monotonic() - scheduled)
+            if status_code is None or status_code >= 400:
+                operation_stats["errors"] += 1
+            operation_stats["status_codes"][status_code] = operation_stats["status_codes"].get(status_code, 0) + 1
+
+    def run(self):
+        """
+        Runs the load until the duration or request count is reached or stop() is called.
+        """
+        start = time.monotonic()
+        workers = []
+        for number in range(self._concurrency):
+            stats = {}
+            self._worker_stats.append(stats)
+            worker = threading.Thread(target=self._work, args=(start, stats), name="apiknock-load-%d" % number,
+                                      daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(0.2)
+        except KeyboardInterrupt:
+            print("[W] Load run interrupted, waiting for the running requests...")
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+
+        self._elapsed = time.monotonic() - start
+
+    def stop(self):
+        self._stop.set()
+
+    def get_report(self):
+        """
+        :return: Dict mapping every operation (and "TOTAL") to its request count, errors, throughput and latency
+        histogram
+        """
+        report = {}
+        total = {"histogram": LatencyHistogram(), "errors": 0, "status_codes": {}}
+        for stats in self._worker_stats:
+            for operation, operation_stats in stats.items():
+                if operation not in report:
+                    report[operation] = {"histogram": LatencyHistogram(), "errors": 0, "status_codes": {}}
+                for target in (report[operation], total):
+                    target["histogram"].merge(operation_stats["histogram"])
+                    target["errors"] += operation_stats["errors"]
+                    for status_code, count in operation_stats["status_codes"].items():
+                        target["status_codes"][status_code] = target["status_codes"].get(status_code, 0) + count
+
+        report["TOTAL"] = total
+        for operation_stats in report.values():
+            operation_stats["throughput"] = operation_stats["histogram"].count / self._elapsed if self._elapsed else 0
+        return report
+
+    def print_report(self):
+        report = self.get_report()
+        operation_width = max(len(operation) for operation in report)
+
+        print("[+] Load run finished after %.1f s" % self._elapsed)
+        print("%s %9s %9s %7s %10s %10s %10s %10s %10s" % (
+            "Operation".ljust(operation_width), "Requests", "Req/s", "Errors", "p50 ms", "p90 ms", "p99 ms",
+            "p99.9 ms", "max ms"))
+
+        for operation in sorted(report, key=lambda name: (name == "TOTAL", name)):
+            operation_stats = report[operation]
+            histogram = operation_stats["histogram"]
+            print("%s %9d %9.1f %7d %10.1f %10.1f %10.1f %10.1f %10.1f" % (
+                operation.ljust(operation_width),
+                histogram.count,
+                operation_stats["throughput"],
+                operation_stats["errors"],
+                histogram.percentile(50) * 1000,
+                histogram.percentile(90) * 1000,
+                histogram.percentile(99) * 1000,
+                histogram.percentile(99.9) * 1000,
+                (histogram.max or 0) / 1000.0
+            ))
@@ -0,0 +1,176 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import threading
+
+logger = logging.getLogger('apiknock')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                             for name, value in pairs)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s counter" % self.name]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append("%s%s %s" % (self.name, _format_labels(self._labelnames, labelvalues), value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            if labelvalues not in self._values:
+                self._values[labelvalues] = [[0] * len(self._buckets), 0, 0.0]
+            bucket_counts, _, _ = entry = self._values[labelvalues]
+
+            for index, upper_bound in enumerate(self._buckets):
+                if value <= upper_bound:
+                    bucket_counts[index] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            for labelvalues, (bucket_counts, count, total) in sorted(self._values.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self._buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append("%s_bucket%s %d" % (
+                        self.name, _format_labels(self._labelnames, labelvalues, ("le", repr(upper_bound))),
+                        cumulative))
+                lines.append("%s_bucket%s %d" % (
+                    self.name, _format_labels(self._labelnames, labelvalues, ("le", "+Inf")), count))
+                lines.append("%s_sum%s %s" % (self.name, _format_labels(self._labelnames, labelvalues), total))
+                lines.append("%s_count%s %d" % (self.name, _format_labels(self._labelnames, labelvalues), count))
+        return lines
+
+
+class Metrics:
+    """
+    Collects the counters and histograms of a run and exposes them in the Prometheus text format, either as file
+    (e.g. for the node_exporter textfile collector) or via a local HTTP endpoint.
+    """
+
+    def __init__(self):
+        self.http_requests = Counter("apiknock_http_requests_total", "HTTP requests sent by apiknock.",
+                                     ("method", "status_code"))
+        self.http_request_errors = Counter("apiknock_http_request_errors_total",
+                                           "HTTP requests which could not be sent.", ("method",))
+        self.http_request_duration = Histogram("apiknock_http_request_duration_seconds",
+                                               "Duration of the HTTP requests sent by apiknock.", ("method",))
+        self.checks = Counter("apiknock_checks_total", "Results of the access checks.", ("outcome",))
+        self.check_duration = Histogram("apiknock_check_duration_seconds",
+                                        "Duration of the requests of the access checks.", ("outcome",))
+
+        self._server = None
+        self._writer = None
+        self._stop_writer = threading.Event()
+
+    def add_result(self, result):
+        """
+        Counts the results of the Tester, so Metrics can directly be registered as listener.
+        :param result: The Result produced by the Tester
+        """
+        self.checks.inc(str(result.status))
+        if result.duration is not None:
+            self.check_duration.observe(result.duration, str(result.status))
+
+    def render(self):
+        """
+        :return: All metrics in the Prometheus text format
+        """
+        lines = []
+        for metric in (self.http_requests, self.http_request_errors, self.http_request_duration, self.checks,
+                       self.check_duration):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """
+        Atomically writes all metrics to path, so collectors never read a partially written file.
+        """
+        temp_path = "%s.tmp" % path
+        with open(temp_path, "w") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temp_path, path)
+
+    def start_file_writer(self, path, interval=10.0):
+        """
+        Writes the metrics file every interval seconds until stop() is called.
+        """
+        def write_periodically():
+            while not self._stop_writer.wait(interval):
+                try:
+                    self.write_file(path)
+                except IOError as ex:
+                    logger.error("Could not write metrics file %s: %s" % (path, ex))
+
+        self._writer = threading.Thread(target=write_periodically, name="apiknock-metrics-writer", daemon=True)
+        self._writer.start()
+
+    def serve(self, port, address="127.0.0.1"):
+        """
+        Exposes the metrics on http://address:port/metrics in a background thread.
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, log_format, *args):
+                logger.debug("Metrics endpoint: %s" % (log_format % args))
+
+        self._server = ThreadingHTTPServer((address, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="apiknock-metrics-server", daemon=True).start()
+
+    def stop(self):
+        self._stop_writer.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,106 @@
+from .knockerconfig import KnockerConfig, AUTH_MATRIX
+from .schema import SchemaCompiler
+import json
+import logging
+
+logger = logging.getLogger('apiknock')
+
+PLAN_VERSION = 1
+
+
+class RunPlan:
+    """
+    A run plan contains everything a run needs: the parsed requests, the knocker config restricted to the operations
+    of the API file and the base URL. It is stored as compact JSON, so repeated runs can skip parsing the API file
+    (YAML, $ref resolution) and start sending requests right away.
+    The plan provides get_parsed_requests(), get_base_url(), get_schema_compiler() and get_referenced_schemas() like
+    the API parsers, so it can be used instead of them. The schemas referenced by the response schemas are stored once,
+    not inlined into every operation.
+    """
+
+    def __init__(self, requests, config, base_url, api_file=None, schemas=None):
+        self._requests = requests
+        self._config = config
+        self._base_url = base_url
+        self._api_file = api_file
+        self._schemas = schemas or {}
+        self._schema_compiler = None
+
+    @staticmethod
+    def build(requests, knocker_conf, base_url, api_file=None, schemas=None):
+        """
+        Joins the parsed requests with the knocker config.
+        :param requests: The requests as parsed by the API parser
+        :param knocker_conf: The loaded KnockerConfig
+        :param base_url: The resolved base URL
+        :param api_file: The name of the API file the plan is built from
+        :param schemas: The schemas referenced by the response schemas, as returned by get_referenced_schemas()
+        :return: The RunPlan
+        """
+        config = dict(knocker_conf.get_config())
+        auth_matrix = config.get(AUTH_MATRIX) or {}
+
+        # Only the AuthMatrix entries of operations in the API file are needed
+        operations = {}
+        for request in requests:
+            if request["path"] in auth_matrix and request["method"] in auth_matrix[request["path"]]:
+                operations.setdefault(request["path"], {})[request["method"]] = \
+                    auth_matrix[request["path"]][request["method"]]
+        config[AUTH_MATRIX] = operations
+
+        return RunPlan(requests, config, base_url, api_file, schemas)
+
+    def save(self, path):
+        plan = {
+            "version": PLAN_VERSION,
+            "api_file": self._api_file,
+            "base_url": self._base_url,
+            "config": self._config,
+            "requests": self._requests,
+            "schemas": self._schemas,
+        }
+        with open(path, "w") as plan_file:
+            json.dump(plan, plan_file, separators=(",", ":"))
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path, "r") as plan_file:
+                plan = json.load(plan_file)
+        except (IOError, ValueError) as ex:
+            raise ValueError("Could not load run plan %s: %s" % (path, ex))
+
+        if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION:
+            raise ValueError("%s is not a run plan of version %d. Please create it again." % (path, PLAN_VERSION))
+
+        logger.info("Loaded run plan %s with %d requests" % (path, len(plan["requests"])))
+
+        return RunPlan(plan["requests"], plan["config"], plan["base_url"], plan.get("api_file"),
+                       plan.get("schemas"))
+
+    def get_parsed_requests(self):
+        if len(self._requests) <= 0:
+            raise ValueError("The run plan does not contain any requests.")
+
+        return self._requests
+
+    def get_base_url(self):
+        if not self._base_url:
+            raise ValueError("The run plan does not contain a base URL. Use --override-base-url.")
+        return self._base_url
+
+    def get_schema_compiler(self):
+        if self._schema_compiler is None:
+            self._schema_compiler = SchemaCompiler.for_references(self._schemas)
+        return self._schema_compiler
+
+    def get_referenced_schemas(self):
+        return self._schemas
+
+    def get_api_file(self):
+        return self._api_file
+
+    def get_knocker_config(self):
+        knocker_conf = KnockerConfig()
+        knocker_conf.load_config(self._config)
+        return knocker_conf
@@ -0,0 +1,75 @@
+from .reporter import FAILURE, ERROR
+import sys
+import time
+
+
+class Progress:
+    """
+    Shows a single, continuously updated status line (checks done/total, requests/sec, error rate, ETA) instead of one
+    line per checked request. The line is redrawn at most every interval seconds.
+    """
+
+    def __init__(self, total, stream=None, interval=0.5):
+        self._total = total
+        self._stream = stream if stream is not None else sys.stderr
+        self._interval = interval
+        self._done = 0
+        self._failed = 0
+        self._errors = 0
+        self._start = None
+        self._last_update = 0
+        self._last_line_length = 0
+
+    def start(self):
+        self._start = time.monotonic()
+        self._update(force=True)
+
+    def add_result(self, result):
+        self._done += 1
+        if result.status == FAILURE:
+            self._failed += 1
+        elif result.status == ERROR:
+            self._errors += 1
+        self._update()
+
+    def finish(self):
+        self._update(force=True)
+        self._stream.write("\n")
+        self._stream.flush()
+
+    @staticmethod
+    def _format_duration(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+    def _update(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_update < self._interval:
+            return
+        self._last_update = now
+
+        elapsed = now - self._start if self._start is not None else 0
+        rate = self._done / elapsed if elapsed > 0 else 0.0
+        error_rate = 100.0 * self._errors / self._done if self._done else 0.0
+
+        if rate > 0 and self._total >= self._done:
+            eta = self._format_duration((self._total - self._done) / rate)
+        else:
+            eta = "--:--:--"
+
+        line = "[+] %d/%d checks (%.0f%%) | %.1f req/s | %d failed | %.1f%% errors | elapsed %s | ETA %s" % (
+            self._done,
+            self._total,
+            100.0 * self._done / self._total if self._total else 100.0,
+            rate,
+            self._failed,
+            error_rate,
+            self._format_duration(elapsed),
+            eta
+        )
+
+        # Pad with blanks to overwrite leftovers of a longer previous line
+        self._stream.write("\r%s" % line.ljust(self._last_line_length))
+        self._stream.flush()
+        self._last_line_length = len(line)
@@ -0,0 +1,209 @@
+from .capture import REDACTED, SENSITIVE_HEADERS
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+logger = logging.getLogger('apiknock')
+
+RECORDING_VERSION = 2
+
+
+class RecordedHeaders(dict):
+    """
+    The headers of a recorded response. Like the headers of Python requests, the names are case-insensitive, so
+    replaying does not need to import requests.
+    """
+
+    def __init__(self, headers):
+        super().__init__((name.lower(), value) for name, value in headers.items())
+
+    def __getitem__(self, name):
+        return super().__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super().__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class RecordedResponse:
+    """
+    A response read from a recording. It provides the attributes of the responses of Python requests the checks use.
+    """
+
+    def __init__(self, status_code, reason, headers, elapsed, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = RecordedHeaders(headers)
+        self.elapsed = datetime.timedelta(seconds=elapsed)
+        self.content = content
+        self.request = None
+
+    @property
+    def text(self):
+        content_type = self.headers.get("Content-Type", "")
+        _, _, charset = content_type.partition("charset=")
+        try:
+            return self.content.decode(charset.split(";")[0].strip() or "utf-8", errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=1):
+        return iter([self.content]) if self.content else iter([])
+
+    def close(self):
+        pass
+
+
+class Recording:
+    """
+    Stores the responses of a run in a SQLite database, so the checks can be evaluated again later without sending a
+    single request. The bodies are compressed and stored by their SHA-256 digest, so identical bodies (e.g. the same
+    error message for all blocked users) are stored once.
+    The responses are stored per cell: the user and the request (variant) as sent, but without the credentials, so
+    a recording can be replayed after the tokens expired. Next to every response, the request actually sent is
+    stored for reference: method, URL and headers with the credentials redacted and the digest of the body.
+    """
+    _commit_interval = 1000
+
+    def __init__(self, path, replay=False):
+        """
+        :param path: The recording database
+        :param replay: If True, an existing recording is opened for replaying, otherwise a new one is created
+        """
+        self._path = path
+        self._replay = replay
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+
+        if replay:
+            if not os.path.isfile(path):
+                raise ValueError("The recording %s does not exist." % path)
+            self._database = sqlite3.connect("file:%s?mode=ro" % path, uri=True, check_same_thread=False)
+            try:
+                version = self._database.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            except sqlite3.DatabaseError as ex:
+                raise ValueError("%s is not a recording: %s" % (path, ex))
+            if not version or int(version[0]) != RECORDING_VERSION:
+                raise ValueError("The recording %s has an unsupported version." % path)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            self._database = sqlite3.connect(path, check_same_thread=False)
+            self._database.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._database.execute("CREATE TABLE bodies (digest TEXT PRIMARY KEY, body BLOB)")
+            self._database.execute("CREATE TABLE responses (cell TEXT PRIMARY KEY, status_code INTEGER, reason TEXT, "
+                                   "headers TEXT, elapsed REAL, body_digest TEXT, request TEXT)")
+            self._database.execute("INSERT INTO meta VALUES ('version', ?)", (str(RECORDING_VERSION),))
+
+        self._load_body = functools.lru_cache(maxsize=256)(self._load_body)
+
+    @staticmethod
+    def cell_key(request, user):
+        """
+        :param request: The (variant of the) parsed request
+        :param user: The user, e.g. user_1
+        :return: The key of the cell in the recording
+        """
+        cell = [user, request["method"], request["path"], request["parameters"], request.get("body")]
+        return hashlib.sha256(json.dumps(cell, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def normalize_request(sent, secrets=None):
+        """
+        :param sent: The request as sent, e.g. the request attribute of a response of Python requests
+        :param secrets: Dict with the names of "header", "cookie" and "query" parameters carrying credentials
+        :return: Dict with method, URL and headers of the request, the credentials redacted, and the SHA-256 digest
+        of its body (None without body)
+        """
+        secrets = secrets or {}
+        header_names = SENSITIVE_HEADERS | set(name.lower() for name in secrets.get("header", []))
+        query_names = set(name.lower() for name in secrets.get("query", []))
+
+        url = urlsplit(sent.url)
+        if query_names and url.query:
+            query = [(name, REDACTED if name.lower() in query_names else value)
+                     for name, value in parse_qsl(url.query, keep_blank_values=True)]
+            url = url._replace(query=urlencode(query))
+
+        body = sent.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        return {
+            "method": sent.method.upper(),
+            "url": urlunsplit(url),
+            "headers": {name: REDACTED if name.lower() in header_names else value
+                        for name, value in sent.headers.items()},
+            "body_digest": hashlib.sha256(body).hexdigest() if isinstance(body, bytes) and body else None,
+        }
+
+    def record(self, request, user, response, secrets=None):
+        """
+        Stores a response. The body is read completely.
+        :param request: The (variant of the) parsed request
+        :param user: The user, e.g. user_1
+        :param response: The response object produced by Python requests module
+        :param secrets: Dict with the names of "header", "cookie" and "query" parameters carrying credentials, which
+        are redacted in the stored request
+        """
+        content = response.content or b""
+        body_digest = hashlib.sha256(content).hexdigest()
+        sent = self.normalize_request(response.request, secrets) if response.request is not None else None
+
+        with self._lock:
+            self._database.execute("INSERT OR IGNORE INTO bodies VALUES (?, ?)", (body_digest, zlib.compress(content)))
+            self._database.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                self.cell_key(request, user),
+                response.status_code,
+                response.reason,
+                json.dumps(dict(response.headers)),
+                response.elapsed.total_seconds(),
+                body_digest,
+                json.dumps(sent),
+            ))
+
+            self._uncommitted += 1
+            if self._uncommitted >= self._commit_interval:
+                self._database.commit()
+                self._uncommitted = 0
+
+    def _load_body(self, body_digest):
+        with self._lock:
+            row = self._database.execute("SELECT body FROM bodies WHERE digest = ?", (body_digest,)).fetchone()
+        return zlib.decompress(row[0]) if row else b""
+
+    def replay(self, request, user):
+        """
+        :param request: The (variant of the) parsed request
+        :param user: The user, e.g. user_1
+        :return: The recorded response
+        """
+        with self._lock:
+            row = self._database.execute(
+                "SELECT status_code, reason, headers, elapsed, body_digest FROM responses WHERE cell = ?",
+                (self.cell_key(request, user),)).fetchone()
+
+        if row is None:
+            raise ValueError("There is no recorded response for %s %s and %s." % (
+                request["method"].upper(), request["path"], user))
+
+        status_code, reason, headers, elapsed, body_digest = row
+        return RecordedResponse(status_code, reason, json.loads(headers), elapsed, self._load_body(body_digest))
+
+    def is_replay(self):
+        return self._replay
+
+    def close(self):
+        with self._lock:
+            if not self._replay:
+                self._database.commit()
+            self._database.close()
@@ -0,0 +1,86 @@
+from collections import namedtuple
+from enum import Enum
+import importlib
+
+
+class Outcome(str, Enum):
+    SUCCESS = "success"
+    FAILURE = "failure"
+    ERROR = "error"
+
+    def __str__(self):
+        return self.value
+
+
+SUCCESS = Outcome.SUCCESS
+FAILURE = Outcome.FAILURE
+ERROR = Outcome.ERROR
+
+# The first four fields match the (path, method, user, message) tuples the Tester always produced.
+# target is the base URL the result belongs to, if a run is executed against several base URLs.
+# variant is the label of the request variant the result belongs to, None for the original request.
+Result = namedtuple("Result", ["path", "method", "user", "message", "status", "duration", "target", "variant"])
+Result.__new__.__defaults__ = (ERROR, None, None, None)
+
+REPORTERS = {
+    'junit': 'modules.junit.JUnitReporter',
+    'jsonl': 'modules.jsonl.JSONLReporter',
+    'sarif': 'modules.sarif.SARIFReporter',
+}
+
+
+class Reporter:
+    """
+    Base class for all reporters. A reporter is registered at the Tester and receives every result as soon as it is
+    available, so several reporters can be served within one run without traversing the results again.
+    """
+
+    def __init__(self, filename, api_file=None):
+        self._filename = filename
+        self._api_file = api_file
+
+    def start(self):
+        """
+        Called once before the first result is reported, e.g. to open the output file.
+        """
+        pass
+
+    def add_result(self, result):
+        """
+        Called for every single result.
+        :param result: The Result produced by the Tester
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """
+        Called once after the last result was reported, e.g. to write totals and close the output file.
+        """
+        pass
+
+
+def get_reporter(out_format, filename, api_file=None):
+    """
+    Creates a reporter for the given output format.
+    :param out_format: Either one of the built-in formats in REPORTERS or the dotted path of a Reporter subclass
+    (e.g. mypackage.reporting.MyReporter)
+    :param filename: The output file of the reporter
+    :param api_file: The API file which is tested
+    :return: The reporter instance
+    """
+    class_path = REPORTERS.get(out_format, out_format)
+
+    module_name, _, class_name = class_path.rpartition(".")
+    if not module_name:
+        raise ValueError("Invalid output format %s. Can be %s or the path of a reporter class." % (
+            out_format, ", ".join(REPORTERS)))
+
+    try:
+        reporter_class = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as ex:
+        raise ValueError("Could not load reporter %s: %s" % (class_path, ex))
+
+    if not isinstance(reporter_class, type) or not issubclass(reporter_class, Reporter):
+        raise ValueError("%s is not a reporter." % class_path)
+
+    return reporter_class(filename, api_file=api_file)
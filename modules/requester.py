@@ -1,19 +1,29 @@
-from urllib3.exceptions import InsecureRequestWarning
-import requests
+from .transport import RequestsTransport
 import logging
+import time
 
 logger = logging.getLogger('apiknock')
 
 
 class Requester:
     def __init__(self, base_url, auth_type=None, auth_name=None, request_list=None, proxy=None,
-                 verify_certs=True):
+                 verify_certs=True, metrics=None, transport=None, capture=None):
+        """
+        :param transport: The Transport sending the requests, by default a RequestsTransport using proxy and
+        verify_certs
+        :param capture: The TrafficCapture all exchanges are written to
+        """
         self._base_url = base_url
         self._proxy = proxy
         self._requests = [] if not request_list else request_list
         self._verify = verify_certs
         self._auth_type = auth_type
         self._auth_name = auth_name
+        self._metrics = metrics
+        self._transport = transport or RequestsTransport(verify_certs=verify_certs, proxy=proxy)
+        self._capture = capture
+        # The parameters carrying the credentials, which are redacted in the capture
+        self._secrets = {auth_type: [auth_name]} if auth_type in ("header", "cookie", "query") and auth_name else {}
 
     @staticmethod
     def _prettify_http_request(req):
@@ -31,29 +41,33 @@ class Requester:
             res.content if res.content else "",
         )
 
+    def get_secrets(self):
+        """
+        :return: Dict with the names of "header", "cookie" and "query" parameters carrying credentials
+        """
+        return self._secrets
+
     def set_requests(self, request_list):
         self._requests = request_list
 
     def get_requests(self):
         return self._requests
 
+    def close(self):
+        self._transport.close()
+
     def send_request(self, method, url, query_string=None, headers=None, body=None, cookies=None,
-                     content_type=None, auth_value=None):
+                     content_type=None, auth_value=None, stream=False):
 
         request_kwargs = {}
 
-        if not self._verify:
-            request_kwargs["verify"] = False
-            requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
-
-        if self._proxy:
-            request_kwargs["proxies"] = {
-                'http': self._proxy,
-                'https': self._proxy,
-            }
+        if stream:
+            # Only the status line and the headers are read, the body is downloaded when it is accessed
+            request_kwargs["stream"] = True
 
+        # The parameter dicts are copied, as the authentication is added to them and they are shared between users
         if headers:
-            request_kwargs["headers"] = headers
+            request_kwargs["headers"] = dict(headers)
 
         if body and len(body) >= 1:
             if content_type == "application/json":
@@ -64,10 +78,10 @@ class Requester:
                 request_kwargs["data"] = body
 
         if query_string:
-            request_kwargs["params"] = query_string
+            request_kwargs["params"] = dict(query_string)
 
         if cookies:
-            request_kwargs["cookies"] = cookies
+            request_kwargs["cookies"] = dict(cookies)
 
         if auth_value:
             logger.debug("Using authentication type %s with name %s" % (self._auth_type, self._auth_name))
@@ -100,10 +114,24 @@ class Requester:
         logger.info("Sending request %s %s" % (method.upper(), url))
         logger.debug("Using kwargs for request: %s" % request_kwargs)
 
-        response = requests.request(method, url=url, **request_kwargs)
+        start = time.perf_counter()
+        try:
+            response = self._transport.request(method, url, **request_kwargs)
+        except Exception:
+            if self._metrics:
+                self._metrics.http_request_errors.inc(method.upper())
+            raise
+
+        if self._metrics:
+            self._metrics.http_requests.inc(method.upper(), response.status_code)
+            self._metrics.http_request_duration.observe(time.perf_counter() - start, method.upper())
 
-        logger.debug("Actual request: \n%s" % self._prettify_http_request(response.request))
-        logger.debug("Response: \n%s\n---" % self._prettify_http_response(response))
+        if self._capture:
+            self._capture.add(time.perf_counter() - start, method, url, request_kwargs, response, self._secrets)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Actual request: \n%s" % self._prettify_http_request(response.request))
+            logger.debug("Response: \n%s\n---" % self._prettify_http_response(response))
 
         return response
 
@@ -111,7 +139,12 @@ class Requester:
         for request in self._requests:
             self.process_request(request, auth_value, print_request)
 
-    def process_request(self, request, auth_value=None, print_request=False):
+    def prepare_request(self, request):
+        """
+        Resolves a parsed request into the arguments of send_request(), so they can be reused for many requests.
+        :param request: A request as parsed by the API parser
+        :return: Dict of keyword arguments for send_request()
+        """
         path = request["path"]
 
         if path.startswith('/') and self._base_url.endswith('/'):
@@ -120,28 +153,31 @@ class Requester:
         for path_param, value in request["parameters"]["path"].items():
             path = path.replace("{%s}" % path_param, str(value))
 
+        return {
+            "method": request["method"],
+            "url": self._base_url + path,
+            "query_string": request["parameters"]["query"],
+            "headers": request["parameters"]["header"],
+            "cookies": request["parameters"]["cookie"],
+            "body": request["body"] if "body" in request else None,
+            "content_type": request["content_type"] if "content_type" in request else None,
+        }
+
+    def process_request(self, request, auth_value=None, print_request=False, stream=False):
+        prepared = self.prepare_request(request)
+
         if print_request:
             print("[+] Sending request %s %s: %s" % (
                 request["method"].upper(),
-                self._base_url + path,
+                prepared["url"],
                 "Authenticated" if auth_value else "Not authenticated"
             ))
 
         try:
-            return self.send_request(
-                request["method"],
-                self._base_url + path,
-                query_string=request["parameters"]["query"],
-                headers=request["parameters"]["header"],
-                cookies=request["parameters"]["cookie"],
-                body=request["body"] if "body" in request else None,
-                content_type=request["content_type"] if "content_type" in request else None,
-                auth_value=auth_value
-            )
+            return self.send_request(auth_value=auth_value, stream=stream, **prepared)
         except (ConnectionError, ConnectionRefusedError, OSError) as ex:
-            msg = "[E] Error connecting to %s%s: %s" % (
-                self._base_url,
-                path,
+            msg = "[E] Error connecting to %s: %s" % (
+                prepared["url"],
                 ex
             )
             logger.critical(msg)
@@ -0,0 +1,158 @@
+from .reporter import Result, Outcome, SUCCESS, FAILURE, ERROR
+import logging
+import os
+import sys
+import threading
+
+logger = logging.getLogger('apiknock')
+
+MESSAGE_TEMPLATES = {
+    SUCCESS: "For request %s (%s) and user %s the check succeeded. Check Output: %s",
+    FAILURE: "For request %s (%s) and user %s the check failed. Check Output: %s",
+}
+
+OUTCOME_CODES = {outcome: code for code, outcome in enumerate(Outcome)}
+OUTCOMES = list(Outcome)
+
+
+class ResultStore:
+    """
+    Keeps the results of a run in a compact form. Path, method, user and the check output are interned, so the
+    results of a matrix share the same string objects, and the full message is only formatted when a result is
+    queried. Once more than max_memory_results results are stored, all results are spilled to a SQLite database and
+    the memory is released again.
+    """
+    _spill_batch_size = 1000
+
+    def __init__(self, max_memory_results=100000, spill_file=None, target=None):
+        """
+        :param max_memory_results: The number of results kept in memory before spilling to disk
+        :param spill_file: The SQLite database the results are spilled to. A temporary file is used if none is given.
+        :param target: The base URL all stored results belong to, if a run is executed against several base URLs
+        """
+        self._max_memory_results = max_memory_results
+        self._target = target
+        self._spill_file = spill_file
+        self._remove_spill_file = False
+        self._database = None
+        self._results = []
+        self._counts = {outcome: 0 for outcome in Outcome}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _intern(value):
+        return sys.intern(value) if isinstance(value, str) else value
+
+    def _to_result(self, record):
+        path, method, user, outcome, detail, duration, variant = record
+        template = MESSAGE_TEMPLATES.get(outcome)
+        message = template % (path, method, user, detail) if template else detail
+        return Result(path, method, user, message, outcome, duration, self._target, variant)
+
+    def add(self, outcome, path, method, user, detail, duration=None, variant=None):
+        """
+        Stores a result.
+        :param outcome: Either SUCCESS, FAILURE or ERROR
+        :param detail: The output of the check for SUCCESS and FAILURE, the full message for ERROR
+        :param duration: The time in seconds the request took, if a request was sent at all
+        :param variant: The label of the request variant, None for the original request
+        :return: The stored Result
+        """
+        outcome = Outcome(outcome)
+        record = (self._intern(path), self._intern(method), self._intern(user), outcome,
+                  self._intern(detail) if outcome != ERROR else detail, duration, self._intern(variant))
+
+        with self._lock:
+            self._results.append(record)
+            self._counts[outcome] += 1
+
+            if self._database is None and len(self._results) > self._max_memory_results:
+                self._open_database()
+
+            if self._database is not None and len(self._results) >= self._spill_batch_size:
+                self._flush()
+
+        return self._to_result(record)
+
+    def _open_database(self):
+        # Only imported if results actually have to be spilled
+        import sqlite3
+        import tempfile
+
+        if not self._spill_file:
+            handle, self._spill_file = tempfile.mkstemp(prefix="apiknock-", suffix=".sqlite")
+            os.close(handle)
+            self._remove_spill_file = True
+
+        logger.info("More than %d results, spilling results to %s" % (self._max_memory_results, self._spill_file))
+
+        self._database = sqlite3.connect(self._spill_file, check_same_thread=False)
+        self._database.execute("DROP TABLE IF EXISTS results")
+        self._database.execute("CREATE TABLE results (id INTEGER PRIMARY KEY, path TEXT, method TEXT, user TEXT, "
+                               "outcome INTEGER, detail TEXT, duration REAL, variant TEXT)")
+
+    def _flush(self):
+        self._database.executemany(
+            "INSERT INTO results (path, method, user, outcome, detail, duration, variant) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((path, method, user, OUTCOME_CODES[outcome], detail, duration, variant)
+             for path, method, user, outcome, detail, duration, variant in self._results)
+        )
+        self._database.commit()
+        self._results = []
+
+    def count(self, outcome=None):
+        """
+        :param outcome: Only count results with this outcome, or all results if None
+        :return: The number of stored results
+        """
+        if outcome is None:
+            return sum(self._counts.values())
+        return self._counts[Outcome(outcome)]
+
+    def counts(self):
+        """
+        :return: A dict with the number of results per outcome
+        """
+        return dict(self._counts)
+
+    def iter_results(self, outcome=None):
+        """
+        Iterates over the stored results in the order they were added.
+        :param outcome: Only return results with this outcome, or all results if None
+        :return: Generator of Result
+        """
+        outcome = Outcome(outcome) if outcome is not None else None
+
+        with self._lock:
+            if self._database is not None:
+                self._flush()
+            pending = list(self._results)
+
+        if self._database is not None:
+            if outcome is None:
+                cursor = self._database.execute(
+                    "SELECT path, method, user, outcome, detail, duration, variant FROM results ORDER BY id")
+            else:
+                cursor = self._database.execute(
+                    "SELECT path, method, user, outcome, detail, duration, variant FROM results WHERE outcome = ? "
+                    "ORDER BY id", (OUTCOME_CODES[outcome],))
+
+            for path, method, user, outcome_code, detail, duration, variant in cursor:
+                yield self._to_result((path, method, user, OUTCOMES[outcome_code], detail, duration, variant))
+
+        for record in pending:
+            if outcome is None or record[3] == outcome:
+                yield self._to_result(record)
+
+    def close(self):
+        """
+        Writes the remaining results to the spill database and closes it. A temporary database is removed.
+        """
+        if self._database is not None:
+            with self._lock:
+                self._flush()
+            self._database.close()
+            self._database = None
+
+            if self._remove_spill_file:
+                os.remove(self._spill_file)
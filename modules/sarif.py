@@ -0,0 +1,105 @@
+from .reporter import Reporter, ERROR, FAILURE
+import json
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+RULES = [
+    {
+        "id": "apiknock/access-check-failed",
+        "name": "AccessCheckFailed",
+        "shortDescription": {"text": "The response did not match the configured access rule."},
+        "fullDescription": {"text": "A user could access a resource that should be blocked, or was blocked from a "
+                                    "resource that should be accessible, according to the auth matrix."},
+        "defaultConfiguration": {"level": "error"},
+    },
+    {
+        "id": "apiknock/check-error",
+        "name": "CheckError",
+        "shortDescription": {"text": "The access check could not be performed."},
+        "fullDescription": {"text": "The configuration for this request is incomplete or the check raised an error."},
+        "defaultConfiguration": {"level": "warning"},
+    },
+]
+
+
+class SARIFReporter(Reporter):
+    """
+    Writes failed and erroneous checks as SARIF 2.1.0 log, e.g. for code scanning dashboards. The results array is
+    streamed to the output file, the document is closed when the reporter is finished.
+    """
+
+    def __init__(self, filename, api_file=None):
+        super().__init__(filename, api_file)
+        self._file = None
+        self._result_count = 0
+
+    def start(self):
+        self._file = open(self._filename, "w", encoding="utf-8")
+
+        header = json.dumps({
+            "$schema": SARIF_SCHEMA,
+            "version": "2.1.0",
+            "runs": [{
+                "tool": {
+                    "driver": {
+                        "name": "apiknock",
+                        "informationUri": "https://apiknock.securai.de",
+                        "rules": RULES,
+                    }
+                },
+                "results": [],
+            }],
+        })
+
+        # Everything up to the empty results array is written now, the closing brackets when the reporter is finished
+        self._file.write(header[:header.rindex("[]") + 1])
+
+    def add_result(self, result):
+        if self._file is None:
+            raise ValueError("The SARIF output file %s is not opened." % self._filename)
+
+        if result.status not in (FAILURE, ERROR):
+            return
+
+        rule_index = 0 if result.status == FAILURE else 1
+        location = {
+            "logicalLocations": [{
+                "name": "%s %s" % (result.method.upper(), result.path),
+                "kind": "member",
+            }]
+        }
+
+        if self._api_file:
+            location["physicalLocation"] = {
+                "artifactLocation": {"uri": self._api_file.replace("\\", "/")}
+            }
+
+        sarif_result = {
+            "ruleId": RULES[rule_index]["id"],
+            "ruleIndex": rule_index,
+            "level": RULES[rule_index]["defaultConfiguration"]["level"],
+            "message": {"text": result.message},
+            "locations": [location],
+            "partialFingerprints": {
+                "apiknockCell/v1": "%s %s %s" % (result.method.upper(), result.path, result.user),
+            },
+            "properties": {"user": result.user},
+        }
+
+        if result.variant:
+            # Every variant of a request is a cell of its own
+            sarif_result["partialFingerprints"]["apiknockCell/v1"] += " [%s]" % result.variant
+            sarif_result["properties"]["variant"] = result.variant
+
+        if result.target:
+            sarif_result["partialFingerprints"]["apiknockTarget/v1"] = result.target
+            sarif_result["properties"]["target"] = result.target
+
+        self._file.write("%s%s" % ("," if self._result_count else "", json.dumps(sarif_result)))
+        self._result_count += 1
+
+    def finish(self):
+        if self._file is not None:
+            self._file.write("]}]}")
+            self._file.close()
+            self._file = None
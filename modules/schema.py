@@ -0,0 +1,319 @@
+import re
+
+# The JSON types of the schema "type" keyword. bool is a subclass of int, so it is excluded from the numbers.
+TYPE_CHECKS = {
+    "object": lambda instance: isinstance(instance, dict),
+    "array": lambda instance: isinstance(instance, list),
+    "string": lambda instance: isinstance(instance, str),
+    "integer": lambda instance: isinstance(instance, int) and not isinstance(instance, bool)
+    or isinstance(instance, float) and instance.is_integer(),
+    "number": lambda instance: isinstance(instance, (int, float)) and not isinstance(instance, bool),
+    "boolean": lambda instance: isinstance(instance, bool),
+    "null": lambda instance: instance is None,
+}
+
+
+def _compile_type(schema, compile_sub_schema):
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    if schema.get("nullable"):
+        types = types + ["null"]
+    checks = [TYPE_CHECKS[name] for name in types if name in TYPE_CHECKS]
+    expected = " or ".join(types)
+
+    def validate(instance, location):
+        for check in checks:
+            if check(instance):
+                return None
+        return "%s: expected %s, got %s" % (location, expected, type(instance).__name__)
+    return validate
+
+
+def _compile_enum(schema, compile_sub_schema):
+    values = schema["enum"]
+
+    def validate(instance, location):
+        if instance not in values:
+            return "%s: %r is not one of %r" % (location, instance, values)
+        return None
+    return validate
+
+
+def _compile_string(schema, compile_sub_schema):
+    min_length = schema.get("minLength")
+    max_length = schema.get("maxLength")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+
+    def validate(instance, location):
+        if not isinstance(instance, str):
+            return None
+        if min_length is not None and len(instance) < min_length:
+            return "%s: shorter than %d characters" % (location, min_length)
+        if max_length is not None and len(instance) > max_length:
+            return "%s: longer than %d characters" % (location, max_length)
+        if pattern is not None and not pattern.search(instance):
+            return "%s: does not match %s" % (location, pattern.pattern)
+        return None
+    return validate
+
+
+def _compile_number(schema, compile_sub_schema):
+    minimum = schema.get("minimum")
+    maximum = schema.get("maximum")
+    # In OpenAPI v2/v3.0 exclusiveMinimum/-Maximum are booleans, in JSON schema (OpenAPI v3.1) numbers
+    exclusive_minimum = schema.get("exclusiveMinimum")
+    exclusive_maximum = schema.get("exclusiveMaximum")
+    if isinstance(exclusive_minimum, bool):
+        exclusive_minimum = minimum if exclusive_minimum else None
+    if isinstance(exclusive_maximum, bool):
+        exclusive_maximum = maximum if exclusive_maximum else None
+
+    def validate(instance, location):
+        if not isinstance(instance, (int, float)) or isinstance(instance, bool):
+            return None
+        if minimum is not None and instance < minimum:
+            return "%s: %s is less than %s" % (location, instance, minimum)
+        if maximum is not None and instance > maximum:
+            return "%s: %s is greater than %s" % (location, instance, maximum)
+        if exclusive_minimum is not None and instance <= exclusive_minimum:
+            return "%s: %s is not greater than %s" % (location, instance, exclusive_minimum)
+        if exclusive_maximum is not None and instance >= exclusive_maximum:
+            return "%s: %s is not less than %s" % (location, instance, exclusive_maximum)
+        return None
+    return validate
+
+
+def _compile_array(schema, compile_sub_schema):
+    items = compile_sub_schema(schema["items"]) if isinstance(schema.get("items"), dict) else None
+    min_items = schema.get("minItems")
+    max_items = schema.get("maxItems")
+
+    def validate(instance, location):
+        if not isinstance(instance, list):
+            return None
+        if min_items is not None and len(instance) < min_items:
+            return "%s: less than %d items" % (location, min_items)
+        if max_items is not None and len(instance) > max_items:
+            return "%s: more than %d items" % (location, max_items)
+        if items is not None:
+            for index, item in enumerate(instance):
+                error = items(item, "%s[%d]" % (location, index))
+                if error:
+                    return error
+        return None
+    return validate
+
+
+def _compile_object(schema, compile_sub_schema):
+    properties = [(name, compile_sub_schema(property_schema))
+                  for name, property_schema in (schema.get("properties") or {}).items()]
+    required = list(schema.get("required") or [])
+    additional_properties = schema.get("additionalProperties", True)
+    known_properties = set(schema.get("properties") or {})
+    additional_schema = compile_sub_schema(additional_properties) if isinstance(additional_properties, dict) else None
+
+    def validate(instance, location):
+        if not isinstance(instance, dict):
+            return None
+        for name in required:
+            if name not in instance:
+                return "%s: required property %s is missing" % (location, name)
+        for name, validator in properties:
+            if name in instance:
+                error = validator(instance[name], "%s.%s" % (location, name))
+                if error:
+                    return error
+        if additional_properties is False or additional_schema is not None:
+            for name, value in instance.items():
+                if name in known_properties:
+                    continue
+                if additional_schema is None:
+                    return "%s: unexpected property %s" % (location, name)
+                error = additional_schema(value, "%s.%s" % (location, name))
+                if error:
+                    return error
+        return None
+    return validate
+
+
+def _compile_all_of(schema, compile_sub_schema):
+    validators = [compile_sub_schema(sub_schema) for sub_schema in schema["allOf"]]
+
+    def validate(instance, location):
+        for validator in validators:
+            error = validator(instance, location)
+            if error:
+                return error
+        return None
+    return validate
+
+
+def _compile_any_of(schema, compile_sub_schema):
+    validators = [compile_sub_schema(sub_schema) for sub_schema in schema["anyOf"]]
+
+    def validate(instance, location):
+        errors = []
+        for validator in validators:
+            error = validator(instance, location)
+            if not error:
+                return None
+            errors.append(error)
+        return "%s: matches none of anyOf (%s)" % (location, "; ".join(errors))
+    return validate
+
+
+def _compile_one_of(schema, compile_sub_schema):
+    validators = [compile_sub_schema(sub_schema) for sub_schema in schema["oneOf"]]
+
+    def validate(instance, location):
+        matches = sum(1 for validator in validators if not validator(instance, location))
+        if matches != 1:
+            return "%s: matches %d instead of exactly one of oneOf" % (location, matches)
+        return None
+    return validate
+
+
+def _compile_not(schema, compile_sub_schema):
+    validator = compile_sub_schema(schema["not"])
+
+    def validate(instance, location):
+        if not validator(instance, location):
+            return "%s: must not match the \"not\" schema" % location
+        return None
+    return validate
+
+
+# Every keyword is compiled into its own validator. Only the keywords present in a schema are checked.
+KEYWORD_COMPILERS = [
+    ("type", _compile_type),
+    ("enum", _compile_enum),
+    (("minLength", "maxLength", "pattern"), _compile_string),
+    (("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum"), _compile_number),
+    (("items", "minItems", "maxItems"), _compile_array),
+    (("properties", "required", "additionalProperties"), _compile_object),
+    ("allOf", _compile_all_of),
+    ("anyOf", _compile_any_of),
+    ("oneOf", _compile_one_of),
+    ("not", _compile_not),
+]
+
+
+def _accept(instance, location):
+    return None
+
+
+def compile_schema(schema, compiler=None):
+    """
+    Compiles a JSON schema (as used by OpenAPI) into a validator, so the schema does not have to be interpreted again
+    for every response. Formats are not validated.
+    :param schema: The schema
+    :param compiler: The SchemaCompiler compiling the references of the schema. Without a compiler, the schema must
+    not contain any references.
+    :return: A function taking the instance and its location (e.g. "$") and returning the first error or None
+    """
+    if not isinstance(schema, dict):
+        return _accept
+
+    if "$ref" in schema:
+        # Like in JSON schema draft 4 (OpenAPI v2/v3.0), everything next to a reference is ignored
+        if compiler is None:
+            raise ValueError("The reference %s can not be resolved." % schema["$ref"])
+        return compiler.compile_reference(schema["$ref"])
+
+    def compile_sub_schema(sub_schema):
+        return compile_schema(sub_schema, compiler)
+
+    validators = []
+    for keywords, keyword_compiler in KEYWORD_COMPILERS:
+        keywords = keywords if isinstance(keywords, tuple) else (keywords,)
+        if any(keyword in schema for keyword in keywords):
+            validators.append(keyword_compiler(schema, compile_sub_schema))
+
+    if not validators:
+        return _accept
+    if len(validators) == 1:
+        return validators[0]
+
+    def validate(instance, location):
+        for validator in validators:
+            error = validator(instance, location)
+            if error:
+                return error
+        return None
+    return validate
+
+
+class SchemaCompiler:
+    """
+    Compiles schemas containing references. Every referenced schema is compiled only once, the first time it is
+    needed, and its validator is shared by all schemas referencing it.
+    """
+
+    def __init__(self, resolve):
+        """
+        :param resolve: Function returning the schema a reference (e.g. "#/components/schemas/Pet") points to. Raises
+        a ValueError if the reference can not be resolved.
+        """
+        self._resolve = resolve
+        self._validators = {}
+
+    @staticmethod
+    def for_references(schemas):
+        """
+        :param schemas: Dict mapping the references to their schemas, as returned by collect_references()
+        :return: A SchemaCompiler resolving the references with schemas
+        """
+        def resolve(reference):
+            if reference not in schemas:
+                raise ValueError("Could not find reference %s" % reference)
+            return schemas[reference]
+        return SchemaCompiler(resolve)
+
+    def compile(self, schema):
+        return compile_schema(schema, self)
+
+    def compile_reference(self, reference):
+        validator = self._validators.get(reference)
+        if validator is not None:
+            return validator
+
+        # Recursive references are compiled before the referenced schema is finished, so they get a validator calling
+        # the compiled one
+        compiled = []
+
+        def validate_recursive(instance, location):
+            return compiled[0](instance, location)
+
+        known = len(self._validators)
+        self._validators[reference] = validate_recursive
+        try:
+            compiled.append(compile_schema(self._resolve(reference), self))
+        except ValueError:
+            # The references compiled meanwhile may call this one, so they are compiled again next time
+            for unfinished in list(self._validators)[known:]:
+                del self._validators[unfinished]
+            raise
+        self._validators[reference] = compiled[0]
+        return compiled[0]
+
+
+def collect_references(schemas, resolve):
+    """
+    Collects all schemas the given schemas reference, directly or through other referenced schemas.
+    :param schemas: The schemas
+    :param resolve: Function returning the schema a reference points to
+    :return: A dict mapping the references to their schemas
+    """
+    references = {}
+    pending = list(schemas)
+    while pending:
+        item = pending.pop()
+        if isinstance(item, list):
+            pending.extend(item)
+        elif isinstance(item, dict):
+            reference = item.get("$ref")
+            if not isinstance(reference, str):
+                pending.extend(item.values())
+            elif reference not in references:
+                references[reference] = resolve(reference)
+                pending.append(references[reference])
+    return references
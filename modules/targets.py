@@ -0,0 +1,140 @@
+from .reporter import SUCCESS, FAILURE, ERROR
+import logging
+import threading
+
+logger = logging.getLogger('apiknock')
+
+STATUS_COLORS = {
+    SUCCESS: "\033[92m",
+    FAILURE: "\033[91m",
+    ERROR: "\033[93m",
+}
+
+
+class SynchronizedListener:
+    """
+    Passes the results of several Testers running in parallel on to a listener one at a time, as the reporters are
+    not thread-safe.
+    """
+
+    def __init__(self, listener, lock):
+        self._listener = listener
+        self._lock = lock
+
+    def add_result(self, result):
+        with self._lock:
+            self._listener.add_result(result)
+
+
+class MultiTargetRunner:
+    """
+    Runs the same AuthMatrix against several base URLs (e.g. environments or regional replicas) at once. Every target
+    has its own Tester, Requester and connection pool, while the parsed requests and the compiled checks are shared.
+    Afterwards the cells are compared between the targets.
+    """
+
+    def __init__(self):
+        self._testers = []
+        self._aborted = []
+        self._lock = threading.Lock()
+
+    def add_target(self, target, tester):
+        """
+        :param target: The base URL of the target
+        :param tester: The Tester using a Requester for this base URL
+        """
+        self._testers.append((target, tester))
+
+    def get_testers(self):
+        return list(self._testers)
+
+    def add_listener(self, listener):
+        """
+        Registers a listener at the Testers of all targets added so far.
+        """
+        synchronized_listener = SynchronizedListener(listener, self._lock)
+        for _, tester in self._testers:
+            tester.add_listener(synchronized_listener)
+
+    def _run_target(self, target, tester):
+        try:
+            tester.test_all_requests()
+        except SystemExit:
+            # The Requester exits if the target is not reachable
+            logger.critical("Run against %s aborted." % target)
+            self._aborted.append(target)
+
+    def run(self):
+        """
+        Runs the Testers of all targets in parallel and waits until all are finished.
+        """
+        workers = []
+        for number, (target, tester) in enumerate(self._testers):
+            worker = threading.Thread(target=self._run_target, args=(target, tester),
+                                      name="apiknock-target-%d" % number, daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(0.2)
+
+    def get_aborted(self):
+        return list(self._aborted)
+
+    def get_differences(self):
+        """
+        Compares the outcome of every cell between the targets. As all targets test the same requests in the same
+        order, the n-th result of a path, method and user on one target belongs to the n-th one on the others.
+        :return: List of (path, method, user, {target: status}) for every cell whose outcome differs or which is
+        missing on a target
+        """
+        cells = {}
+        for target, tester in self._testers:
+            occurrences = {}
+            for result in tester.get_results().iter_results():
+                key = (result.path, result.method, result.user)
+                occurrence = occurrences.get(key, 0)
+                occurrences[key] = occurrence + 1
+                cells.setdefault(key + (occurrence,), {})[target] = result.status
+
+        return [
+            (path, method, user, statuses)
+            for (path, method, user, _), statuses in cells.items()
+            if len(statuses) < len(self._testers) or len(set(statuses.values())) > 1
+        ]
+
+    def print_report(self):
+        for target, tester in self._testers:
+            counts = tester.get_results().counts()
+            msg = "[+] %s: %d requests sent, %d checks succeeded, %d failed, %d errors.%s" % (
+                target,
+                tester.get_total_requests(),
+                counts[SUCCESS],
+                counts[FAILURE],
+                counts[ERROR],
+                " (aborted)" if target in self._aborted else ""
+            )
+            print(msg)
+            logger.info(msg)
+
+        differences = self.get_differences()
+        if not differences:
+            print("[+] All targets produced the same results.")
+            return
+
+        print("[W] %d cells differ between the targets:" % len(differences))
+        targets = [target for target, _ in self._testers]
+        cell_width = max(len("%s %s (%s)" % (method.upper(), path, user)) for path, method, user, _ in differences)
+        column_width = max(len(target) for target in targets)
+
+        print("%s %s" % ("Cell".ljust(cell_width), " ".join(target.ljust(column_width) for target in targets)))
+        for path, method, user, statuses in differences:
+            columns = []
+            for target in targets:
+                status = statuses.get(target)
+                text = str(status) if status is not None else "-"
+                columns.append("%s%s\033[0m" % (STATUS_COLORS.get(status, ""), text.ljust(column_width)))
+            print("%s %s" % (("%s %s (%s)" % (method.upper(), path, user)).ljust(cell_width), " ".join(columns)))
+            logger.info("Cell %s %s (%s) differs between targets: %s" % (
+                method.upper(), path, user, ", ".join("%s=%s" % (target, statuses.get(target)) for target in targets)))
@@ -1,28 +1,61 @@
 from modules import knockerconfig
+from modules.reporter import Outcome, SUCCESS, FAILURE, ERROR
+from modules.resultstore import ResultStore
+from modules.baseline import LatencyBaseline
+from modules.checks import compile_check, get_check_values
+import functools
+import json
 import logging
 import re
 import sys
+import threading
+import time
 
 logger = logging.getLogger('apiknock')
 
 
 class Tester:
-    def __init__(self, requests, knockerconf, requester, user_auth_table):
+    # Unread bodies up to this size are read before the response is closed, so the connection can be reused
+    _drain_limit = 65536
+    _chunk_size = 16384
+
+    def __init__(self, requests, knockerconf, requester, user_auth_table, result_store=None, print_results=True,
+                 compiled_checks=None, schema_compiler=None):
         self._requests = requests
         self._knockerconf = knockerconf
         self._requester = requester
         self._user_auth_table = user_auth_table
+        self._print_results = print_results
 
-        self._errors = []
-        self._success = []
-        self._failed = []
+        self._results = result_store if result_store is not None else ResultStore()
         self._actual_requests = 0
+        self._listeners = []
+        # Only collected if a latency baseline is compared or saved
+        self._latencies = None
+        self._latency_baseline = None
+        self._latency_ratio = None
+        self._variant_generator = None
+        self._schema_compiler = schema_compiler
+        self._digester = None
+        self._recording = None
+        self._history = None
+        self._concurrency = 1
+        self._fail_fast = None
+        self._coordinator = None
+        self._jobs = None
+        self._failures = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
 
         self._checker_dict = {
             'http_code': self._check_http_code,
             'http_body': self._check_http_body,
+            'http_header': self._check_http_header,
+            'max_latency_ms': self._check_max_latency_ms,
         }
 
+        self._compiled_checks = compiled_checks if compiled_checks is not None else self.compile_checks()
+
     @staticmethod
     def _check_http_code(response, value):
         """
@@ -63,21 +96,334 @@ class Tester:
         except (AttributeError, re.error) as ex:
             raise ValueError("Could not parse %s as a valid regular expression: %s" % (value, ex))
 
+    @staticmethod
+    def _check_http_header(response, value):
+        """
+        Checks if the response contains a header, optionally with a value matching a regular expression.
+        :param response: The response object produced by Python requests module
+        :param value: Either "Header-Name" or "Header-Name: regular expression"
+        :return: True if the header is present (and its value matches), False otherwise
+        """
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            name, expression = value
+        elif isinstance(value, str) and value.strip():
+            name, _, expression = value.partition(":")
+        else:
+            raise ValueError("Provided value %s is not a valid header check (\"Name\" or \"Name: regexp\")." % value)
+
+        name = name.strip()
+        expression = expression.strip() if expression else None
+        header_value = response.headers.get(name)
+
+        logger.debug("Using http header check for %s with reg exp %s" % (name, expression))
+
+        if header_value is None:
+            return {
+                "success": False,
+                "message": "Header %s is missing" % name,
+            }
+
+        if not expression:
+            return {
+                "success": True,
+                "message": "Header %s is present" % name,
+            }
+
+        try:
+            return {
+                "success": True if re.search(expression, header_value) else False,
+                "message": "Header %s: %s / Regular Expression: %s" % (name, header_value, expression),
+            }
+        except re.error as ex:
+            raise ValueError("Could not parse %s as a valid regular expression: %s" % (expression, ex))
+
+    @staticmethod
+    def _check_max_latency_ms(response, value):
+        """
+        Checks if the response was received within a maximum time.
+        :param response: The response object produced by Python requests module
+        :param value: The maximum latency in milliseconds
+        :return: True if the response took at most value milliseconds, False otherwise
+        """
+        try:
+            value = float(value)
+            if value <= 0:
+                raise ValueError
+        except (ValueError, TypeError):
+            raise ValueError("Provided value %s is not a valid latency in milliseconds (> 0)." % value)
+
+        latency = response.elapsed.total_seconds() * 1000
+
+        logger.debug("Using max latency check: MAX: %s ms / IS: %.1f ms" % (value, latency))
+
+        return {
+            "success": latency <= value,
+            "message": "MAXIMUM: %s ms / IS %.1f ms" % (value, latency)
+        }
+
+    @staticmethod
+    def _check_response_schema(validators, response, value):
+        """
+        Checks if the response body matches the response schema of the operation in the API file
+        :param validators: The compiled response schemas of the operation by status code
+        :param response: The response object produced by Python requests module
+        :param value: The status code whose schema is used, or "*" for the status code of the response
+        :return: True if the body is valid JSON matching the schema, False otherwise
+        """
+        status = str(response.status_code) if value == "*" else str(value)
+        validator = validators.get(status) or validators.get(status[:1] + "XX") or validators.get("default")
+        if validator is None:
+            raise ValueError("The API file defines no response schema for status code %s." % status)
+
+        try:
+            body = json.loads(response.text)
+        except ValueError:
+            return {
+                "success": False,
+                "message": "SCHEMA %s: The response body is not valid JSON" % status,
+            }
+
+        error = validator(body, "$")
+
+        logger.debug("Using response schema check for status code %s: %s" % (status, error or "valid"))
+
+        return {
+            "success": error is None,
+            "message": "SCHEMA %s: %s" % (status, error or "valid"),
+        }
+
+    def compile_checks(self):
+        """
+        Compiles the success and blocked checks of every operation in the AuthMatrix once, so they don't have to be
+        interpreted again for every single request.
+        :return: A dict mapping (path, method) to a dict with the compiled "success" and "blocked" checks. If a check
+        could not be compiled, the error message is stored instead.
+        """
+        compiled_checks = {}
+        auth_matrix = self._knockerconf.get(knockerconfig.AUTH_MATRIX) if self._knockerconf else None
+        response_schemas = None
+
+        for path, methods in (auth_matrix or {}).items():
+            for method, current_matrix in methods.items():
+                # The response schema check needs the compiled response schemas of the operation. Only the schemas of
+                # the status codes used by its checks are compiled.
+                validators = {}
+                checker_dict = dict(self._checker_dict, response_schema=functools.partial(
+                    self._check_response_schema, validators))
+
+                operation_checks = {}
+                for check in ("success", "blocked"):
+                    if check not in current_matrix:
+                        continue
+                    try:
+                        statuses = get_check_values(current_matrix[check], "response_schema")
+                        if statuses:
+                            if response_schemas is None:
+                                response_schemas = {(request["path"], request["method"]):
+                                                    request.get("response_schemas") or {} for request in self._requests}
+                            self._compile_response_validators(response_schemas.get((path, method), {}), statuses,
+                                                              validators)
+                        operation_checks[check] = compile_check(current_matrix[check], checker_dict)
+                    except ValueError as ex:
+                        operation_checks[check] = str(ex)
+                compiled_checks[(path, method)] = operation_checks
+
+        return compiled_checks
+
+    def _compile_response_validators(self, schemas, statuses, validators):
+        """
+        Compiles the response schemas of an operation, which are used by response_schema checks.
+        :param schemas: The response schemas of the operation by status code
+        :param statuses: The status codes of the checks. "*" stands for all response schemas of the operation.
+        :param validators: The dict the validators are added to by status code
+        """
+        if self._schema_compiler is None:
+            raise ValueError("The response schemas of the API file are not available.")
+
+        keys = set()
+        for status in statuses:
+            if status == "*":
+                keys.update(schemas)
+                continue
+            status = str(status)
+            key = next((key for key in (status, status[:1] + "XX", "default") if key in schemas), None)
+            if key is None:
+                raise ValueError("The API file defines no response schema for status code %s." % status)
+            keys.add(key)
+
+        for key in keys:
+            if key not in validators:
+                validators[key] = self._schema_compiler.compile(schemas[key])
+
+    def get_compiled_checks(self):
+        return self._compiled_checks
+
+    def set_variant_generator(self, variant_generator):
+        """
+        Tests every request in several variants with different parameter values instead of only once.
+        :param variant_generator: The VariantGenerator producing the variants
+        """
+        self._variant_generator = variant_generator
+
+    def set_response_digester(self, digester):
+        """
+        Enables the differential mode: the response of every user, who should be blocked, is compared with the
+        response of the first user, who should have access (the owner). If both are equal, the cell fails, even if its
+        checks succeeded, as the blocked user obviously received the owner's data.
+        :param digester: The ResponseDigester reducing the responses to digests
+        """
+        self._digester = digester
+
+    def set_recording(self, recording):
+        """
+        Records every response or, if the recording is opened for replaying, uses the recorded responses instead of
+        sending requests.
+        :param recording: The Recording
+        """
+        self._recording = recording
+
+    def set_latency_baseline(self, baseline, ratio):
+        """
+        Enables the detection of latency regressions. Every operation whose p90 latency exceeds its baseline by more
+        than ratio is reported as failure at the end of test_all_requests().
+        :param baseline: The p90 latencies of a previous run, as returned by LatencyBaseline.load()
+        :param ratio: The factor by which the p90 latency may grow, e.g. 1.5
+        """
+        self._latency_baseline = baseline
+        self._latency_ratio = ratio
+        self.collect_latencies()
+
+    def collect_latencies(self):
+        """
+        Collects the latencies of every operation, e.g. to save them as baseline with get_latencies().save().
+        """
+        if self._latencies is None:
+            self._latencies = LatencyBaseline()
+
+    def set_history(self, history):
+        """
+        Orders the operations by the failure rates and durations of previous runs, see _schedule().
+        :param history: The RunHistory
+        """
+        self._history = history
+
+    def set_concurrency(self, concurrency):
+        """
+        :param concurrency: The number of operations tested at the same time
+        """
+        if concurrency < 1:
+            raise ValueError("The concurrency has to be at least 1.")
+        self._concurrency = concurrency
+
+    def set_fail_fast(self, max_failures):
+        """
+        Stops the run as soon as max_failures cells failed.
+        :param max_failures: The number of failures, None to run all checks
+        """
+        if max_failures is not None and max_failures < 1:
+            raise ValueError("The number of failures for fail-fast has to be at least 1.")
+        self._fail_fast = max_failures
+
+    def set_coordinator(self, coordinator):
+        """
+        Hands the operations out to workers instead of testing them, see modules.distributed.
+        :param coordinator: The started Coordinator
+        """
+        self._coordinator = coordinator
+
+    def get_latencies(self):
+        return self._latencies
+
+    def add_listener(self, listener):
+        """
+        Registers a listener, which is notified about every result as soon as it is available.
+        :param listener: A Reporter (or any object providing add_result(result))
+        """
+        self._listeners.append(listener)
+
+    def _add_result(self, status, path, method, user, detail, duration=None, variant=None):
+        """
+        Stores a result and passes it on to all registered listeners.
+        :param status: Either SUCCESS, FAILURE or ERROR
+        :param detail: The output of the check for SUCCESS and FAILURE, the full message for ERROR
+        :param duration: The time in seconds the request took, if a request was sent at all
+        :param variant: The label of the request variant, None for the original request
+        :return: The stored Result
+        """
+        with self._lock:
+            result = self._results.add(status, path, method, user, detail, duration, variant)
+            if self._latencies is not None:
+                self._latencies.add_result(result)
+
+            for listener in self._listeners:
+                listener.add_result(result)
+
+            if status == FAILURE:
+                self._failures += 1
+                if self._fail_fast is not None and self._failures >= self._fail_fast:
+                    self._stop.set()
+
+        return result
+
+    def get_results(self):
+        return self._results
+
     def get_failed(self):
-        return self._failed
+        return list(self._results.iter_results(FAILURE))
 
     def get_successful(self):
-        return self._success
+        return list(self._results.iter_results(SUCCESS))
 
     def get_errors(self):
-        return self._errors
+        return list(self._results.iter_results(ERROR))
 
     def get_total_requests(self):
         return self._actual_requests
 
-    def test_all_requests(self):
+    def count_checks(self):
+        """
+        Counts the checks test_all_requests() will perform, e.g. to show the progress of a run.
+        :return: The number of request (variant)/user combinations configured in the AuthMatrix
+        """
         auth_matrix = self._knockerconf.get(knockerconfig.AUTH_MATRIX)
+        checks = 0
+        for request in self._requests:
+            try:
+                users = len(auth_matrix[request["path"]][request["method"]]["matrix"])
+                checks += users * sum(1 for _ in self._iter_variants(request))
+            except (KeyError, TypeError):
+                # Every incomplete configuration is reported as a single error
+                checks += 1
+        return checks
+
+    def test_all_requests(self):
         self._actual_requests = 0
+        self._failures = 0
+        self._stop.clear()
+
+        jobs = self._schedule(list(self._iter_jobs()))
+        if self._coordinator is not None:
+            self._coordinator.run([(request["path"], request["method"]) for request, _, _ in jobs],
+                                  self._add_remote_results, self._stop)
+        elif self._concurrency > 1:
+            self._run_concurrently(jobs)
+        else:
+            for job in jobs:
+                if self._stop.is_set():
+                    break
+                self._run_job(*job)
+
+        if self._stop.is_set():
+            print("[W] Stopped after %d failures (--fail-fast), not all requests were tested." % self._failures)
+        elif self._latency_baseline is not None:
+            self._check_latency_regressions()
+
+    def _iter_jobs(self):
+        """
+        Validates the AuthMatrix of every request. Incomplete configurations are reported as errors right away.
+        :return: Generator of (request, matrix, checks) for every operation, which can be tested
+        """
+        auth_matrix = self._knockerconf.get(knockerconfig.AUTH_MATRIX)
         for request in self._requests:
             logger.debug("Processing request: %s" % request)
             if "path" not in request:
@@ -88,14 +434,16 @@ class Tester:
                 sys.exit(1)
 
             if request["path"] not in auth_matrix:
-                self._errors.append("Path %s is in API file but not in AuthMatrix of KnockerConf." % request["path"])
+                self._add_result(ERROR, request["path"], request["method"], "-",
+                                 "Path %s is in API file but not in AuthMatrix of KnockerConf." % request["path"])
                 continue
 
             if request["method"] not in auth_matrix[request["path"]]:
-                self._errors.append("Method %s for path %s, is in API file but not in AuthMatrix of KnockerConf." % (
-                    request["method"],
-                    request["path"]
-                ))
+                self._add_result(ERROR, request["path"], request["method"], "-",
+                                 "Method %s for path %s, is in API file but not in AuthMatrix of KnockerConf." % (
+                                     request["method"],
+                                     request["path"]
+                                 ))
                 continue
 
             current_matrix = auth_matrix[request["path"]][request["method"]]
@@ -107,85 +455,300 @@ class Tester:
             ))
 
             if "success" not in current_matrix:
-                self._errors.append("For path %s (%s) there is no definition of \"success\" checks in the config." % (
-                    request["path"],
-                    request["method"]
-                ))
+                self._add_result(ERROR, request["path"], request["method"], "-",
+                                 "For path %s (%s) there is no definition of \"success\" checks in the config." % (
+                                     request["path"],
+                                     request["method"]
+                                 ))
                 continue
 
             if "blocked" not in current_matrix:
-                self._errors.append("For path %s (%s) there is no definition of \"blocked\" checks in the config." % (
-                    request["path"],
-                    request["method"]
-                ))
+                self._add_result(ERROR, request["path"], request["method"], "-",
+                                 "For path %s (%s) there is no definition of \"blocked\" checks in the config." % (
+                                     request["path"],
+                                     request["method"]
+                                 ))
                 continue
 
-            if current_matrix["blocked"][0] not in self._checker_dict:
-                self._errors.append("For path %s (%s) there was an invalid check method %s for blocked." % (
-                    request["path"],
-                    request["method"],
-                    current_matrix["blocked"][0]
-                ))
+            checks = self._compiled_checks[(request["path"], request["method"])]
+            invalid_check = None
+
+            for check in ("blocked", "success"):
+                if isinstance(checks[check], str):
+                    invalid_check = "For path %s (%s) there was an invalid check for %s: %s" % (
+                        request["path"],
+                        request["method"],
+                        check,
+                        checks[check]
+                    )
+                    break
+
+            if invalid_check:
+                self._add_result(ERROR, request["path"], request["method"], "-", invalid_check)
                 continue
 
-            if current_matrix["success"][0] not in self._checker_dict:
-                self._errors.append("For path %s (%s) there was an invalid check method %s for success." % (
-                    request["path"],
-                    request["method"],
-                    current_matrix["success"][0]
+            matrix = list(current_matrix["matrix"].items())
+            if self._digester is not None:
+                # The owner has to be tested before the users, whose responses are compared with the owner's
+                matrix.sort(key=lambda item: not item[1])
+
+            yield request, matrix, checks
+
+    def _schedule(self, jobs):
+        """
+        Orders the operations by their history. Sequential runs start with the operations, which most likely fail
+        per second of testing, so findings are reported early. Concurrent runs start with the longest operations
+        (longest job first), so no worker is left with a long operation at the end of the run.
+        :param jobs: The jobs in the order of the API file
+        :return: The jobs in the order they are tested
+        """
+        if self._history is None:
+            return jobs
+
+        estimates = [self._history.estimate(request["method"], request["path"]) for request, _, _ in jobs]
+        if self._concurrency > 1 or self._coordinator is not None:
+            order = sorted(range(len(jobs)), key=lambda index: -estimates[index][1])
+        else:
+            order = sorted(range(len(jobs)),
+                           key=lambda index: -estimates[index][0] / max(estimates[index][1], 0.001))
+        return [jobs[index] for index in order]
+
+    def get_operations(self):
+        """
+        Validates the AuthMatrix once, e.g. for a worker testing single operations.
+        :return: The (path, method) of every operation, which can be tested with test_operation()
+        """
+        if self._jobs is None:
+            self._jobs = {(request["path"], request["method"]): (request, matrix, checks)
+                          for request, matrix, checks in self._iter_jobs()}
+        return list(self._jobs)
+
+    def test_operation(self, path, method):
+        """
+        Tests all variants of a single operation with all users.
+        """
+        self.get_operations()
+        if (path, method) not in self._jobs:
+            raise ValueError("The operation %s %s can't be tested, its configuration is missing or incomplete." % (
+                method.upper(), path))
+        self._run_job(*self._jobs[(path, method)])
+
+    def _add_remote_results(self, path, method, results, requests):
+        """
+        Stores the results of an operation tested by a worker.
+        :param results: List of [status, user, message, duration, variant]
+        :param requests: The number of requests the worker sent
+        """
+        with self._lock:
+            self._actual_requests += requests
+
+        for status, user, message, duration, variant in results:
+            status = Outcome(status)
+            self._add_result(status, path, method, user, message, duration, variant)
+            if self._print_results:
+                self._print_line("%s %s (%s): %s (%s)" % (
+                    method.upper(),
+                    path,
+                    user,
+                    {SUCCESS: "\033[92mSuccess\033[0m", FAILURE: "\033[91mFailed\033[0m"}.get(status, "Error"),
+                    message
                 ))
-                continue
 
-            for key, value in current_matrix["matrix"].items():
+    def _run_job(self, request, matrix, checks):
+        """
+        Tests all variants of a request with all users.
+        """
+        for variant, label in self._iter_variants(request):
+            owner = None
+            for key, value in matrix:
+                if self._stop.is_set():
+                    return
+
                 if key.startswith("user_"):
                     if key not in self._user_auth_table:
-                        self._errors.append("For path %s (%s) there was a user provided (%s) who had no auth info." % (
-                            request["path"],
-                            request["method"],
-                            key
-                        ))
+                        self._add_result(ERROR, request["path"], request["method"], key,
+                                         "For path %s (%s) there was a user provided (%s) who had no auth "
+                                         "info." % (
+                                             request["path"],
+                                             request["method"],
+                                             key
+                                         ), variant=label)
                         continue
 
-                response = self._requester.process_request(request, self._user_auth_table[key])
+                outcome, digest = self._test_cell(variant, key, "success" if value else "blocked", checks, label,
+                                                  None if value else owner)
+                if value and owner is None and outcome == SUCCESS and digest is not None:
+                    owner = (key, digest)
+
+    def _run_concurrently(self, jobs):
+        """
+        Tests the operations with several threads. Every thread takes the next operation as soon as it is done with
+        its current one.
+        """
+        jobs = iter(jobs)
+        errors = []
+
+        def work():
+            try:
+                while not self._stop.is_set():
+                    with self._lock:
+                        job = next(jobs, None)
+                    if job is None:
+                        return
+                    self._run_job(*job)
+            except BaseException as ex:
+                # E.g. the SystemExit of the Requester, it is raised again in the main thread
+                errors.append(ex)
+                self._stop.set()
+
+        threads = [threading.Thread(target=work, name="apiknock-tester-%d" % number, daemon=True)
+                   for number in range(self._concurrency)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self._stop.set()
+            raise
+
+        if errors:
+            raise errors[0]
+
+    def _iter_variants(self, request):
+        if self._variant_generator is None:
+            return [(request, None)]
+        return self._variant_generator.variants(request)
+
+    def _test_cell(self, request, key, check, checks, label=None, owner=None):
+        """
+        Sends a request as a user and checks the response.
+        :param request: The (variant of the) parsed request
+        :param key: The user, e.g. user_1
+        :param check: Either "success" or "blocked"
+        :param checks: The compiled checks of the operation
+        :param label: Describes the parameters of a request variant, None for the original request
+        :param owner: (user, digest) of the owner's response, which the response must not match
+        :return: The outcome and the digest of the response (None if the differential mode is disabled)
+        """
+        variant = "VARIANT %s / " % label if label else ""
+
+        if self._recording is not None and self._recording.is_replay():
+            try:
+                response = self._recording.replay(request, key)
+            except ValueError as ex:
+                logger.error(str(ex))
+                self._add_result(ERROR, request["path"], request["method"], key, "%s%s" % (variant, ex),
+                                 variant=label)
+                return ERROR, None
+            # The latency of the recorded request
+            duration = response.elapsed.total_seconds()
+        else:
+            # The body is only downloaded if a check needs it
+            start = time.perf_counter()
+            response = self._requester.process_request(request, self._user_auth_table[key], stream=True)
+            duration = time.perf_counter() - start
+            with self._lock:
                 self._actual_requests += 1
 
-                check = "success" if value else "blocked"
-
-                print("%s %s (%s): " % (
-                    request["method"].upper(),
-                    request["path"],
-                    key
-                ), end='')
-
-                try:
-                    result = self._checker_dict[current_matrix[check][0]](response, current_matrix[check][1])
-                    if result["success"]:
-                        msg = "For request %s (%s) and user %s the check succeeded. Check Output: %s" % (
-                            request["path"],
-                            request["method"],
-                            key,
-                            result["message"]
-                        )
-                        self._success.append((request["path"], request["method"], key, msg))
-                        print("\033[92mSuccess\033[0m (%s)" % result["message"])
-                        logger.info(msg)
-                    else:
-                        msg = "For request %s (%s) and user %s the check failed. Check Output: %s" % (
-                            request["path"],
-                            request["method"],
-                            key,
-                            result["message"]
-                        )
-                        self._failed.append((request["path"], request["method"], key, msg))
-                        print("\033[91mFailed\033[0m (%s)" % result["message"])
-                        logger.info(msg)
-                except ValueError as ex:
-                    msg = "The check function raised an exception for path %s (%s) and user %s: %s" % (
-                        request["path"],
-                        request["method"],
-                        key,
-                        ex
-                    )
-                    print("Error (%s)" % ex)
-                    logger.error(msg)
-                    self._errors.append((request["path"], request["method"], key, msg))
+            if self._recording is not None:
+                self._recording.record(request, key, response, self._requester.get_secrets())
+
+        line = "%s %s (%s)%s: " % (
+            request["method"].upper(),
+            request["path"],
+            key,
+            " [%s]" % label if label else ""
+        )
+
+        digest = None
+        try:
+            result = checks[check](response)
+
+            if self._digester is not None:
+                digest = self._get_digest(response)
+                if owner is not None and digest == owner[1]:
+                    result = {
+                        "success": False,
+                        "message": "%s / RESPONSE MATCHES THE ONE OF %s" % (result["message"], owner[0]),
+                    }
+
+            if result["success"]:
+                if self._print_results:
+                    self._print_line("%s\033[92mSuccess\033[0m (%s)" % (line, result["message"]))
+                stored = self._add_result(SUCCESS, request["path"], request["method"], key,
+                                          variant + result["message"], duration, label)
+            else:
+                if self._print_results:
+                    self._print_line("%s\033[91mFailed\033[0m (%s)" % (line, result["message"]))
+                stored = self._add_result(FAILURE, request["path"], request["method"], key,
+                                          variant + result["message"], duration, label)
+            logger.info(stored.message)
+            return stored.status, digest
+        except (OSError, ValueError) as ex:
+            # Checks reading the streamed body raise an OSError if the connection breaks before it was received
+            msg = "The check function raised an exception for path %s (%s) and user %s: %s%s" % (
+                request["path"],
+                request["method"],
+                key,
+                variant,
+                ex
+            )
+            if self._print_results:
+                self._print_line("%sError (%s)" % (line, ex))
+            logger.error(msg)
+            self._add_result(ERROR, request["path"], request["method"], key, msg, duration, label)
+            return ERROR, None
+        finally:
+            self._release_response(response)
+
+    def _release_response(self, response):
+        """
+        Closes a streamed response. Closing a response whose body was not read completely also closes its connection,
+        so small bodies are read first and the connection goes back to the pool. Larger bodies and bodies of unknown
+        length beyond the drain limit are discarded with their connection.
+        """
+        try:
+            length = int(response.headers.get("Content-Length", 0))
+        except ValueError:
+            length = self._drain_limit + 1
+
+        if length <= self._drain_limit:
+            try:
+                read = 0
+                for chunk in response.iter_content(self._chunk_size):
+                    read += len(chunk)
+                    if read > self._drain_limit:
+                        break
+            except (OSError, ValueError, TypeError, RuntimeError) as ex:
+                # E.g. the body was already streamed by the differential comparison or the connection broke
+                logger.debug("Could not drain the response body: %s" % ex)
+        response.close()
+
+    def _print_line(self, line):
+        # Concurrently tested operations must not mix up their lines
+        with self._lock:
+            print(line)
+
+    def _get_digest(self, response):
+        try:
+            return self._digester.digest(response)
+        except OSError as ex:
+            # The body could not be read completely, so there is nothing to compare
+            logger.warning("Could not read the response body for the differential comparison: %s" % ex)
+            return None
+
+    def _check_latency_regressions(self):
+        for method, path, current, previous in self._latencies.find_regressions(self._latency_baseline,
+                                                                                 self._latency_ratio):
+            detail = "P90 LATENCY: %.1f ms / BASELINE %.1f ms (allowed ratio %.2f)" % (
+                current,
+                previous,
+                self._latency_ratio
+            )
+            if self._print_results:
+                print("%s %s: \033[91mLatency regression\033[0m (%s)" % (method.upper(), path, detail))
+            result = self._add_result(FAILURE, path, method, "-", detail)
+            logger.info(result.message)
@@ -0,0 +1,206 @@
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+import contextlib
+import datetime
+import importlib
+import threading
+import time
+
+TRANSPORTS = {
+    'requests': 'modules.transport.RequestsTransport',
+    'httpx': 'modules.transport.HTTPXTransport',
+}
+
+
+class Transport:
+    """
+    Sends the HTTP requests of the Requester. The Requester resolves authentication, parameters and the body, the
+    transport only owns the connections. The responses have to provide status_code, reason, headers, elapsed, content,
+    text, iter_content(), request and close() like the responses of Python requests.
+    Transports are shared between threads and must never store cookies, otherwise cookies set for one user would be
+    sent with the requests of others.
+    """
+
+    def __init__(self, verify_certs=True, proxy=None):
+        self._verify = verify_certs
+        self._proxy = proxy
+
+    def request(self, method, url, params=None, headers=None, cookies=None, json=None, data=None, files=None,
+                stream=False):
+        """
+        Sends a request.
+        :param stream: If True, only the status line and the headers are read, the body is read when it is accessed
+        :return: The response
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    HTTP/1.1 transport using Python requests. Every thread uses its own session, so connections are reused without
+    sharing a session between threads.
+    """
+
+    def __init__(self, verify_certs=True, proxy=None):
+        super().__init__(verify_certs, proxy)
+        self._local = threading.local()
+        self._sessions = []
+
+        if not verify_certs:
+            from urllib3.exceptions import InsecureRequestWarning
+            import urllib3
+            urllib3.disable_warnings(category=InsecureRequestWarning)
+
+    def _get_session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            if not self._verify:
+                session.verify = False
+            if self._proxy:
+                session.proxies = {
+                    'http': self._proxy,
+                    'https': self._proxy,
+                }
+            self._local.session = session
+            self._sessions.append(session)
+        return session
+
+    def request(self, method, url, params=None, headers=None, cookies=None, json=None, data=None, files=None,
+                stream=False):
+        return self._get_session().request(method, url=url, params=params, headers=headers, cookies=cookies,
+                                           json=json, data=data, files=files, stream=stream)
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+        self._sessions = []
+
+
+@contextlib.contextmanager
+def translated_httpx_errors():
+    """
+    Raises the errors of httpx like the ones of Python requests: network errors as ConnectionError, all other errors
+    as OSError, so the callers handle them like the errors of the default transport.
+    """
+    import httpx
+    try:
+        yield
+    except httpx.TransportError as ex:
+        raise ConnectionError("%s: %s" % (type(ex).__name__, ex)) from ex
+    except (httpx.HTTPError, httpx.StreamError, httpx.InvalidURL) as ex:
+        raise OSError("%s: %s" % (type(ex).__name__, ex)) from ex
+
+
+class HTTPXRequest:
+    """
+    The sent request, as needed for debug output.
+    """
+
+    def __init__(self, request):
+        self.method = request.method
+        self.url = str(request.url)
+        self.headers = request.headers
+        self.body = request.content
+
+
+class HTTPXResponse:
+    """
+    Makes a httpx response look like a response of Python requests.
+    """
+
+    def __init__(self, response, elapsed):
+        self._response = response
+        self.status_code = response.status_code
+        self.reason = response.reason_phrase
+        self.headers = response.headers
+        # Like with Python requests, this is the time until the headers were received
+        self.elapsed = datetime.timedelta(seconds=elapsed)
+        self.request = HTTPXRequest(response.request)
+
+    @property
+    def content(self):
+        with translated_httpx_errors():
+            return self._response.read()
+
+    @property
+    def text(self):
+        with translated_httpx_errors():
+            self._response.read()
+        return self._response.text
+
+    def iter_content(self, chunk_size=1):
+        if self._response.is_stream_consumed:
+            return iter([self._response.content])
+        return self._iter_bytes(chunk_size)
+
+    def _iter_bytes(self, chunk_size):
+        with translated_httpx_errors():
+            for chunk in self._response.iter_bytes(chunk_size):
+                yield chunk
+
+    def close(self):
+        self._response.close()
+
+
+class HTTPXTransport(Transport):
+    """
+    HTTP/2 transport using httpx. A single client is shared between all threads, so their requests are multiplexed
+    over few connections. Servers without HTTP/2 support are spoken to with HTTP/1.1.
+    Requires the optional packages httpx and h2 (pip install "httpx[http2]").
+    """
+
+    def __init__(self, verify_certs=True, proxy=None, max_connections=10):
+        super().__init__(verify_certs, proxy)
+        try:
+            import httpx
+            import h2
+        except ImportError:
+            raise ValueError("The httpx transport requires the packages httpx and h2 (pip install \"httpx[http2]\").")
+
+        # Cookies set by responses are stored in this jar, which rejects all of them
+        cookie_jar = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        self._client = httpx.Client(http2=True, verify=verify_certs, proxy=proxy, cookies=cookie_jar,
+                                    limits=httpx.Limits(max_connections=max_connections), timeout=None)
+
+    def request(self, method, url, params=None, headers=None, cookies=None, json=None, data=None, files=None,
+                stream=False):
+        headers = dict(headers) if headers else {}
+        if cookies:
+            # Cookies per request are deprecated in httpx, so they are sent as header
+            headers["Cookie"] = "; ".join("%s=%s" % (name, value) for name, value in cookies.items())
+
+        content = None
+        if isinstance(data, (str, bytes)):
+            content, data = data, None
+
+        with translated_httpx_errors():
+            start = time.perf_counter()
+            request = self._client.build_request(method.upper(), url, params=params, headers=headers, json=json,
+                                                 data=data, files=files, content=content)
+            response = self._client.send(request, stream=True)
+            elapsed = time.perf_counter() - start
+
+            if not stream:
+                response.read()
+        return HTTPXResponse(response, elapsed)
+
+    def close(self):
+        self._client.close()
+
+
+def get_transport(name, verify_certs=True, proxy=None):
+    """
+    Creates the transport with the given name.
+    :param name: A name of TRANSPORTS
+    :return: The transport
+    """
+    if name not in TRANSPORTS:
+        raise ValueError("Invalid transport %s. Can be %s." % (name, ", ".join("'%s'" % name for name in TRANSPORTS)))
+
+    module_name, class_name = TRANSPORTS[name].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)(verify_certs=verify_certs, proxy=proxy)
@@ -0,0 +1,175 @@
+import copy
+import itertools
+import logging
+import re
+
+logger = logging.getLogger('apiknock')
+
+PAIRWISE = "pairwise"
+CARTESIAN = "cartesian"
+
+# Parameters with such names are treated as identifiers of objects and are tested with the IDs of the ID file
+# (e.g. id, user_id, order-uuid, accountId, projectKeys)
+ID_PARAMETER = re.compile(r"((^|[_\-.])(id|uuid|guid|key)|[a-z0-9](Id|ID|Uuid|UUID|Guid|GUID|Key))s?$")
+
+
+class VariantGenerator:
+    """
+    Generates additional variants of a parsed request, where the parameters take several values instead of the single
+    example value of the parser: every enum member, the boundaries of numbers and the IDs of an ID file. As the number
+    of combinations explodes with the number of parameters, values are combined pairwise (every pair of values of two
+    parameters is covered at least once) and the number of variants per request is capped.
+    """
+
+    def __init__(self, max_variants=20, max_values_per_parameter=5, ids=None, strategy=PAIRWISE):
+        """
+        :param max_variants: The maximum number of variants per request, including the original request
+        :param max_values_per_parameter: The maximum number of values used for a single parameter
+        :param ids: List of IDs used for ID-like parameters
+        :param strategy: Either PAIRWISE or CARTESIAN
+        """
+        if max_variants < 1 or max_values_per_parameter < 1:
+            raise ValueError("The maximum number of variants and values per parameter has to be at least 1.")
+        if strategy not in (PAIRWISE, CARTESIAN):
+            raise ValueError("Invalid variant strategy %s. Can be '%s' or '%s'." % (strategy, PAIRWISE, CARTESIAN))
+
+        self._max_variants = max_variants
+        self._max_values_per_parameter = max_values_per_parameter
+        self._ids = ids or []
+        self._strategy = strategy
+
+    @staticmethod
+    def load_ids(path):
+        """
+        Loads IDs from a file with one ID per line. Empty lines and lines starting with # are ignored.
+        """
+        try:
+            with open(path, "r") as id_file:
+                return [line.strip() for line in id_file if line.strip() and not line.startswith("#")]
+        except IOError as ex:
+            raise ValueError("Could not load ID file %s: %s" % (path, ex))
+
+    def _candidate_values(self, name, schema, example):
+        yield example
+
+        if schema.get("type") == "array" and isinstance(schema.get("items"), dict):
+            schema = schema["items"]
+
+        for value in schema.get("enum", []):
+            yield value
+
+        if schema.get("type") in ("integer", "string") and (ID_PARAMETER.search(name) or ID_PARAMETER.search(name.lower())):
+            for value in self._ids:
+                yield int(value) if schema.get("type") == "integer" and value.lstrip("-").isdigit() else value
+
+        if schema.get("type") in ("integer", "number"):
+            for boundary in ("minimum", "maximum"):
+                if boundary in schema:
+                    yield schema[boundary]
+            yield 0
+            yield -1
+
+        if schema.get("type") == "boolean":
+            yield not example
+
+    def parameter_values(self, name, schema, example):
+        """
+        Lazily yields the distinct values for a parameter, starting with the example value of the parser.
+        :param name: The name of the parameter
+        :param schema: The (resolved) schema of the parameter
+        :param example: The example value the parser chose
+        :return: Generator of at most max_values_per_parameter values
+        """
+        seen = []
+        for value in self._candidate_values(name, schema, example):
+            if value in seen:
+                continue
+            seen.append(value)
+            yield value
+            if len(seen) >= self._max_values_per_parameter:
+                return
+
+    @staticmethod
+    def _pairwise(value_lists):
+        """
+        Greedily builds combinations until every pair of values of two different parameters is covered. The first
+        combination consists of the first value of every parameter. Combinations are yielded as they are built.
+        """
+        parameter_count = len(value_lists)
+        uncovered = set()
+        for first, second in itertools.combinations(range(parameter_count), 2):
+            for first_value in range(len(value_lists[first])):
+                for second_value in range(len(value_lists[second])):
+                    uncovered.add((first, first_value, second, second_value))
+
+        combination = [0] * parameter_count
+        while True:
+            for first, second in itertools.combinations(range(parameter_count), 2):
+                uncovered.discard((first, combination[first], second, combination[second]))
+            yield [value_lists[index][value] for index, value in enumerate(combination)]
+
+            if not uncovered:
+                return
+
+            # Start with one uncovered pair and add the values covering most of the remaining pairs
+            first, first_value, second, second_value = min(uncovered)
+            combination = [None] * parameter_count
+            combination[first] = first_value
+            combination[second] = second_value
+
+            for index in range(parameter_count):
+                if combination[index] is not None:
+                    continue
+
+                def newly_covered(value):
+                    covered = 0
+                    for other, other_value in enumerate(combination):
+                        if other_value is None:
+                            continue
+                        pair = (other, other_value, index, value) if other < index else (index, value, other,
+                                                                                           other_value)
+                        covered += pair in uncovered
+                    return covered
+
+                combination[index] = max(range(len(value_lists[index])), key=newly_covered)
+
+    def variants(self, request):
+        """
+        Lazily yields the variants of a request, starting with the unchanged request.
+        :param request: A request as parsed by the API parser
+        :return: Generator of (request, label) tuples. The label describes the changed parameters, it is None for the
+        unchanged request.
+        """
+        parameters = []
+        value_lists = []
+        for parameter_in, schemas in sorted(request.get("parameter_schemas", {}).items()):
+            for name, schema in sorted(schemas.items()):
+                example = request["parameters"][parameter_in][name]
+                values = list(self.parameter_values(name, schema, example))
+                if len(values) > 1:
+                    parameters.append((parameter_in, name))
+                    value_lists.append(values)
+
+        if not parameters:
+            yield request, None
+            return
+
+        if self._strategy == PAIRWISE and len(parameters) > 1:
+            combinations = self._pairwise(value_lists)
+        else:
+            combinations = itertools.product(*value_lists)
+
+        for combination in itertools.islice(combinations, self._max_variants):
+            changed = [(parameter, value) for parameter, value, values in zip(parameters, combination, value_lists)
+                       if value != values[0]]
+            if not changed:
+                yield request, None
+                continue
+
+            variant = copy.copy(request)
+            variant["parameters"] = {parameter_in: dict(values) for parameter_in, values in
+                                     request["parameters"].items()}
+            for (parameter_in, name), value in changed:
+                variant["parameters"][parameter_in][name] = value
+
+            yield variant, ", ".join("%s=%s" % (name, value) for (_, name), value in changed)
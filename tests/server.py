@@ -0,0 +1,117 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import json
+import threading
+import time
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the endpoints the tests need:
+    /echo            the request as JSON (method, path, query, headers, body)
+    /set-cookie      sets the cookie session=secret
+    /status/<code>   responds with the status code
+    /bytes/<size>    responds with size bytes
+    /slow/<seconds>  responds after some time
+    /auth            200 for tokens ending with 1 (user_1), 403 otherwise
+    """
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately, Nagle's algorithm would delay the body until the client ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        with self.server.lock:
+            self.server.connections += 1
+        super().setup()
+
+    def _send(self, code, body, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json" if not isinstance(body, bytes) else "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers.items())))
+
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+
+        if parts[0] == "echo":
+            self._send(200, {
+                "method": self.command,
+                "path": url.path,
+                "query": dict(parse_qsl(url.query)),
+                "headers": {name.lower(): value for name, value in self.headers.items()},
+                "body": body.decode("utf-8", errors="replace"),
+            })
+        elif parts[0] == "set-cookie":
+            self._send(200, {"ok": True}, {"Set-Cookie": "session=secret; Path=/"})
+        elif parts[0] == "status":
+            self._send(int(parts[1]), {"status": int(parts[1])})
+        elif parts[0] == "bytes":
+            self._send(200, b"x" * int(parts[1]))
+        elif parts[0] == "truncated":
+            # The connection is closed before the announced body was sent
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b"x" * 10)
+            self.close_connection = True
+        elif parts[0] == "slow":
+            time.sleep(float(parts[1]))
+            self._send(200, {"slept": float(parts[1])})
+        elif parts[0] == "auth":
+            time.sleep(self.server.delay)
+            authorized = self.headers.get("Authorization", "").endswith("1")
+            self._send(200 if authorized else 403, {"authorized": authorized})
+        else:
+            self._send(404, {"error": "not found"})
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, log_format, *args):
+        pass
+
+
+class LocalServer:
+    """
+    A threaded HTTP/1.1 server on a free port of 127.0.0.1, used as context manager.
+    """
+
+    def __init__(self, delay=0.0):
+        """
+        :param delay: Seconds /auth waits before responding
+        """
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._server.lock = threading.Lock()
+        self._server.connections = 0
+        self._server.requests = []
+        self._server.delay = delay
+        self.url = "http://127.0.0.1:%d/" % self._server.server_address[1]
+
+    @property
+    def connections(self):
+        return self._server.connections
+
+    @property
+    def requests(self):
+        with self._server.lock:
+            return list(self._server.requests)
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
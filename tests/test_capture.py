@@ -0,0 +1,102 @@
+from modules.capture import TrafficCapture, JSONL, REDACTED
+import datetime
+import json
+import os
+import pytest
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, content, headers=None):
+        self.status_code = 200
+        self.reason = "OK"
+        self.headers = headers or {"Content-Type": "application/json; charset=utf-8"}
+        self.elapsed = datetime.timedelta(seconds=0.01)
+        self._content = content
+
+    @property
+    def content(self):
+        if self._content is None:
+            raise AssertionError("The body must not be downloaded for the capture")
+        return self._content
+
+    @property
+    def text(self):
+        raise AssertionError("The body must be decoded by the writer thread")
+
+
+SECRETS = {"header": [], "cookie": [], "query": ["api_key"]}
+
+
+def read_entries(path):
+    with open(path) as capture_file:
+        return [json.loads(line) for line in capture_file]
+
+
+def test_redacts_credentials_and_decodes_bodies_in_the_writer(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    capture = TrafficCapture(path, capture_format=JSONL, max_body_size=5)
+    capture.start()
+    capture.add(0.01, "get", "http://127.0.0.1/items", {
+        "params": {"api_key": "secret", "id": "1"},
+        "headers": {"Authorization": "Bearer secret", "Proxy-Authorization": "secret", "X-API-Key": "secret"},
+        "cookies": {"session": "1"},
+    }, FakeResponse("{\"name\": \"äää\"}".encode("utf-8"), {"Set-Cookie": "s=1"}), SECRETS)
+    assert capture.finish()
+
+    entry, = read_entries(path)
+    assert {header["value"] for header in entry["request"]["headers"]} == {REDACTED}
+    assert entry["request"]["queryString"] == [{"name": "api_key", "value": REDACTED}, {"name": "id", "value": "1"}]
+    assert entry["response"]["headers"] == [{"name": "Set-Cookie", "value": REDACTED}]
+    assert entry["response"]["content"]["text"] == "{\"nam"
+    assert entry["response"]["content"]["size"] == 18
+    assert entry["response"]["content"]["comment"] == "truncated from 18 bytes"
+
+
+def test_captures_only_small_bodies_of_streamed_responses(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    capture = TrafficCapture(path, capture_format=JSONL, max_body_size=5)
+    capture.start()
+    for headers in ({"Content-Length": "21"}, {"Transfer-Encoding": "chunked"}):
+        capture.add(0.01, "get", "http://127.0.0.1/items", {"stream": True}, FakeResponse(None, headers), SECRETS)
+    capture.add(0.01, "get", "http://127.0.0.1/items", {"stream": True},
+                FakeResponse(b"{}", {"Content-Length": "2"}), SECRETS)
+    assert capture.finish()
+
+    large, chunked, small = (entry["response"]["content"] for entry in read_entries(path))
+    assert large["comment"] == chunked["comment"] == "body not captured"
+    assert small["text"] == "{}"
+
+
+@pytest.mark.skipif(not os.path.exists("/dev/full"), reason="needs /dev/full")
+def test_stops_capturing_if_the_file_can_not_be_written():
+    capture = TrafficCapture("/dev/full", capture_format=JSONL)
+    capture.start()
+    for _ in range(1000):
+        capture.add(0.01, "get", "http://127.0.0.1/items", {}, FakeResponse(b"x" * 1000), SECRETS)
+    # The writer discards the exchanges queued before the capture was disabled
+    deadline = time.time() + 10
+    while not (capture._disabled and capture._queue.empty()) and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert capture._disabled
+    capture.add(0.01, "get", "http://127.0.0.1/items", {}, FakeResponse(b"x"), SECRETS)
+    assert capture._queue.empty()
+    assert not capture.finish()
+
+
+def test_finishes_although_the_writer_is_stuck(tmp_path, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(TrafficCapture, "_write_entries", lambda capture: release.wait())
+    monkeypatch.setattr(TrafficCapture, "_stop_timeout", 0.1)
+    capture = TrafficCapture(str(tmp_path / "capture.har"), queue_size=2)
+    capture.start()
+    for _ in range(3):
+        capture.add(0.01, "get", "http://127.0.0.1/items", {}, FakeResponse(b"{}"), SECRETS)
+
+    start = time.time()
+    assert not capture.finish()
+    release.set()
+
+    assert time.time() - start < 5
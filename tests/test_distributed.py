@@ -0,0 +1,189 @@
+from modules import tester
+from modules.distributed import Connection, Coordinator, PROTOCOL_VERSION, ResultBuffer, Worker, get_session_keys
+from modules.knockerconfig import KnockerConfig
+from modules.reporter import SUCCESS
+from modules.requester import Requester
+from tests.server import LocalServer
+import pytest
+import socket
+import threading
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs unix sockets")
+
+TOKENS = {"user_1": "token_1", "user_2": "token_2"}
+# /auth allows user_1 and blocks user_2, so every cell succeeds
+PATHS = ["/auth/%d" % number for number in range(6)]
+SECRET = "secret"
+
+
+def create_setup():
+    return {
+        "requests": [{"path": path, "method": "get",
+                      "parameters": {"query": {}, "path": {}, "header": {}, "cookie": {}}} for path in PATHS],
+        "knockerconf": {"content_type": "json", "user_count": 2, "auth_matrix": {
+            path: {"get": {"matrix": {"user_1": True, "user_2": False},
+                           "success": ["http_code", 200], "blocked": ["http_code", 403]}}
+            for path in PATHS
+        }},
+    }
+
+
+def create_tester(setup, requester, tokens, result_store=None):
+    knocker_conf = KnockerConfig()
+    knocker_conf.load_config(setup["knockerconf"])
+    return tester.Tester(setup["requests"], knocker_conf, requester, tokens, result_store=result_store,
+                         print_results=False)
+
+
+def work(address, server, stall=None, connected=None, secret=SECRET):
+    """
+    Runs a worker like apiknock.py --worker does.
+    :param stall: Event the worker waits for instead of testing its first operation
+    :param connected: Event the worker waits for before it connects
+    """
+    if connected is not None:
+        connected.wait(10)
+    worker = Worker(address, secret, connect_timeout=10)
+    requester = Requester(server.url, auth_type="bearer")
+    try:
+        setup = worker.connect()
+        result_buffer = ResultBuffer()
+        worker_tester = create_tester(setup, requester, TOKENS, result_buffer)
+        if stall is not None:
+            stalled = threading.Event()
+
+            def test_operation(path, method):
+                if not stalled.is_set():
+                    stalled.set()
+                    stall.set()
+                    stall.release.wait(10)
+                else:
+                    tester.Tester.test_operation(worker_tester, path, method)
+            worker_tester.test_operation = test_operation
+        worker.run(worker_tester, result_buffer)
+    except ValueError:
+        # The coordinator closed the connection of the stalled worker
+        pass
+    finally:
+        requester.close()
+        worker.close()
+
+
+def start_worker(*args, **kwargs):
+    thread = threading.Thread(target=work, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+def run_coordinator(address, **kwargs):
+    setup = create_setup()
+    coordinator = Coordinator(address, dict(setup, options={}, ids=None), SECRET, **kwargs)
+    coordinator.start()
+    coordinator_tester = create_tester(setup, None, {user: None for user in TOKENS})
+    coordinator_tester.set_coordinator(coordinator)
+    return coordinator, coordinator_tester
+
+
+def get_cells(coordinator_tester):
+    return sorted((result.path, result.user, result.status)
+                  for result in coordinator_tester.get_results().iter_results())
+
+
+@pytest.fixture
+def server():
+    with LocalServer() as server:
+        yield server
+
+
+def test_workers_test_every_operation_once(tmp_path, server):
+    address = "unix:%s" % (tmp_path / "coordinator.sock")
+    coordinator, coordinator_tester = run_coordinator(address, batch_size=2)
+    workers = [start_worker(address, server) for _ in range(2)]
+    try:
+        coordinator_tester.test_all_requests()
+    finally:
+        coordinator.close()
+    for thread in workers:
+        thread.join(10)
+
+    assert get_cells(coordinator_tester) == sorted(
+        (path, user, SUCCESS) for path in PATHS for user in TOKENS)
+    assert coordinator_tester.get_total_requests() == len(server.requests) == 2 * len(PATHS)
+
+
+def test_hands_out_the_batch_of_a_stalled_worker_again(tmp_path, server, capsys):
+    address = "unix:%s" % (tmp_path / "coordinator.sock")
+    # With a batch size of 1, the stalled batch can't be stolen
+    coordinator, coordinator_tester = run_coordinator(address, batch_size=1, lease_timeout=0.5)
+    stall = threading.Event()
+    stall.release = threading.Event()
+    workers = [start_worker(address, server, stall=stall), start_worker(address, server, connected=stall)]
+    try:
+        coordinator_tester.test_all_requests()
+    finally:
+        stall.release.set()
+        coordinator.close()
+    for thread in workers:
+        thread.join(10)
+
+    assert get_cells(coordinator_tester) == sorted(
+        (path, user, SUCCESS) for path in PATHS for user in TOKENS)
+    assert "Worker 1 did not finish an operation within 0.5 seconds, 1 operations are handed out again." in \
+        capsys.readouterr().out
+
+
+def test_rejects_workers_without_the_secret(tmp_path, capsys):
+    address = "unix:%s" % (tmp_path / "coordinator.sock")
+    coordinator, coordinator_tester = run_coordinator(address)
+    try:
+        worker = Worker(address, "wrong", connect_timeout=10)
+        with pytest.raises(ValueError, match="rejected this worker"):
+            worker.connect()
+        worker.close()
+    finally:
+        coordinator.close()
+
+    assert "was rejected, as it does not know the secret" in capsys.readouterr().out
+
+
+def test_rejects_coordinators_without_the_secret(tmp_path):
+    path = str(tmp_path / "coordinator.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+
+    def accept_any_worker():
+        sock, _ = listener.accept()
+        connection = Connection(sock)
+        connection.send({"type": "hello", "version": PROTOCOL_VERSION, "challenge": "1"})
+        join = connection.receive()
+        connection.authenticate(*get_session_keys(b"wrong", "1", join["challenge"]))
+        connection.send(dict(create_setup(), type="setup", options={}, ids=None))
+        connection.receive()
+        connection.close()
+
+    thread = threading.Thread(target=accept_any_worker, daemon=True)
+    thread.start()
+    worker = Worker("unix:%s" % path, SECRET, connect_timeout=10)
+    try:
+        with pytest.raises(ValueError, match="does not know the secret"):
+            worker.connect()
+    finally:
+        worker.close()
+        listener.close()
+    thread.join(10)
+
+
+def test_rejects_forged_results(tmp_path):
+    address = "unix:%s" % (tmp_path / "coordinator.sock")
+    coordinator, coordinator_tester = run_coordinator(address)
+    try:
+        worker = Worker(address, SECRET, connect_timeout=10)
+        worker.connect()
+        # The message is not signed with the key of the connection
+        worker._connection.authenticate(None, None)
+        worker._send({"type": "operation", "path": PATHS[0], "method": "get", "results": [], "requests": 0})
+        assert worker._connection.receive() is None
+        worker.close()
+    finally:
+        coordinator.close()
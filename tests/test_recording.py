@@ -0,0 +1,43 @@
+from modules.capture import REDACTED
+from modules.recording import Recording
+from modules.requester import Requester
+from tests.server import LocalServer
+from urllib.parse import urlencode
+import hashlib
+import json
+import pytest
+import sqlite3
+
+REQUEST = {"path": "/echo", "method": "post", "content_type": "application/json", "body": {"name": "item"},
+           "parameters": {"query": {"id": "1"}, "path": {}, "header": {"X-Trace": "1"}, "cookie": {}}}
+
+
+@pytest.mark.parametrize("transport", ["requests", "httpx"])
+def test_stores_the_sent_request_without_credentials(tmp_path, transport):
+    if transport == "httpx":
+        pytest.importorskip("httpx")
+    from modules.transport import get_transport
+
+    path = str(tmp_path / "run.sqlite")
+    recording = Recording(path)
+    with LocalServer() as server:
+        requester = Requester(server.url, auth_type="query", auth_name="api_key", transport=get_transport(transport))
+        try:
+            response = requester.process_request(REQUEST, "secret")
+            recording.record(REQUEST, "user_1", response, requester.get_secrets())
+        finally:
+            requester.close()
+    recording.close()
+
+    database = sqlite3.connect(path)
+    sent, = [json.loads(row[0]) for row in database.execute("SELECT request FROM responses")]
+    database.close()
+    assert sent["method"] == "POST"
+    assert sent["url"] == "%secho?%s" % (server.url, urlencode([("id", "1"), ("api_key", REDACTED)]))
+    assert {name.lower(): value for name, value in sent["headers"].items()}["x-trace"] == "1"
+    assert sent["body_digest"] == hashlib.sha256(response.request.body).hexdigest()
+    assert "secret" not in json.dumps(sent)
+
+    replayed = Recording(path, replay=True)
+    assert replayed.replay(REQUEST, "user_1").status_code == 200
+    replayed.close()
@@ -0,0 +1,45 @@
+from modules.junit import JUnitReporter
+from modules.reporter import Result, FAILURE
+from modules.resultstore import ResultStore
+from modules.sarif import SARIFReporter
+import json
+
+RESULTS = [Result("/items/{id}", "get", "user_2", "failed", FAILURE, 0.01, None, variant)
+           for variant in (None, "id=1", "id=2")]
+
+
+def write(reporter, results):
+    reporter.start()
+    for result in results:
+        reporter.add_result(result)
+    reporter.finish()
+
+
+def test_junit_names_every_variant(tmp_path):
+    path = str(tmp_path / "junit.xml")
+    write(JUnitReporter(path), RESULTS)
+
+    with open(path) as junit_file:
+        xml = junit_file.read()
+    for name in ("GET /items/{id} (user_2)", "GET /items/{id} (user_2) [id=1]", "GET /items/{id} (user_2) [id=2]"):
+        assert 'name="%s"' % name in xml
+
+
+def test_sarif_fingerprints_every_variant(tmp_path):
+    path = str(tmp_path / "results.sarif")
+    write(SARIFReporter(path), RESULTS)
+
+    with open(path) as sarif_file:
+        results = json.load(sarif_file)["runs"][0]["results"]
+    assert [result["partialFingerprints"]["apiknockCell/v1"] for result in results] == [
+        "GET /items/{id} user_2", "GET /items/{id} user_2 [id=1]", "GET /items/{id} user_2 [id=2]"]
+
+
+def test_spilled_results_keep_their_variant(tmp_path):
+    store = ResultStore(max_memory_results=1, spill_file=str(tmp_path / "spill.sqlite"))
+    for result in RESULTS:
+        store.add(result.status, result.path, result.method, result.user, result.message, result.duration,
+                  result.variant)
+
+    assert [result.variant for result in store.iter_results()] == [None, "id=1", "id=2"]
+    store.close()
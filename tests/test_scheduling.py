@@ -0,0 +1,98 @@
+from modules import tester
+from modules.history import RunHistory
+from modules.knockerconfig import KnockerConfig
+from modules.requester import Requester
+from tests.server import LocalServer
+import pytest
+
+TOKENS = {"user_1": "token_1", "user_2": "token_2"}
+
+
+def create_request(path):
+    return {"path": path, "method": "get", "parameters": {"query": {}, "path": {}, "header": {}, "cookie": {}}}
+
+
+def create_tester(server, paths, history=None, concurrency=1, fail_fast=None):
+    """
+    Every operation is allowed for user_1 and has to be blocked with a 403 for user_2.
+    """
+    knocker_conf = KnockerConfig()
+    knocker_conf.load_config({"content_type": "json", "user_count": 2, "auth_matrix": {
+        path: {"get": {"matrix": {"user_1": True, "user_2": False},
+                       "success": ["http_code", 200], "blocked": ["http_code", 403]}}
+        for path in paths
+    }})
+    requester = Requester(server.url, auth_type="bearer")
+    operation_tester = tester.Tester([create_request(path) for path in paths], knocker_conf, requester, TOKENS,
+                                     print_results=False)
+    if history is not None:
+        operation_tester.set_history(history)
+    operation_tester.set_concurrency(concurrency)
+    operation_tester.set_fail_fast(fail_fast)
+    return operation_tester, requester
+
+
+def get_tested_paths(server):
+    paths = []
+    for _, path, _ in server.requests:
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def server():
+    with LocalServer() as server:
+        yield server
+
+
+def test_sequential_runs_start_with_the_most_failures_per_second(server):
+    history = RunHistory({
+        "GET /status/200/a": {"failure_rate": 0.1, "duration": 1.0},
+        "GET /status/200/b": {"failure_rate": 0.5, "duration": 1.0},
+        "GET /status/200/c": {"failure_rate": 0.2, "duration": 0.1},
+    })
+    operation_tester, requester = create_tester(server, ["/status/200/a", "/status/200/b", "/status/200/c"], history)
+    try:
+        operation_tester.test_all_requests()
+    finally:
+        requester.close()
+
+    # 2 and 0.5 failures per second before 0.1
+    assert get_tested_paths(server) == ["/status/200/c", "/status/200/b", "/status/200/a"]
+
+
+def test_concurrent_runs_start_with_the_longest_operations(server):
+    paths = ["/slow/0.1/a", "/slow/0.1/b", "/slow/0.1/c", "/slow/0.1/d"]
+    history = RunHistory({
+        "GET /slow/0.1/a": {"failure_rate": 0.9, "duration": 1.0},
+        "GET /slow/0.1/b": {"failure_rate": 0.0, "duration": 4.0},
+        "GET /slow/0.1/c": {"failure_rate": 0.9, "duration": 2.0},
+        "GET /slow/0.1/d": {"failure_rate": 0.0, "duration": 3.0},
+    })
+    operation_tester, requester = create_tester(server, paths, history, concurrency=2)
+    try:
+        operation_tester.test_all_requests()
+    finally:
+        requester.close()
+
+    # Every request takes 0.1 seconds, so both workers have started their first operation before any other request
+    tested = get_tested_paths(server)
+    assert set(tested[:2]) == {"/slow/0.1/b", "/slow/0.1/d"}
+    assert set(tested[2:]) == {"/slow/0.1/a", "/slow/0.1/c"}
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_fail_fast_cancels_the_pending_cells(server, capsys, concurrency):
+    # /status/200 never blocks user_2, so every operation fails
+    paths = ["/status/200/%d" % number for number in range(20)]
+    operation_tester, requester = create_tester(server, paths, concurrency=concurrency, fail_fast=1)
+    try:
+        operation_tester.test_all_requests()
+    finally:
+        requester.close()
+
+    # Only the cells already running when the first failure was reported are finished
+    assert len(operation_tester.get_failed()) <= concurrency
+    assert operation_tester.get_total_requests() == len(server.requests) <= 2 * concurrency
+    assert "Stopped after" in capsys.readouterr().out
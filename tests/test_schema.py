@@ -0,0 +1,113 @@
+from apiparser.openapi import OpenAPIParser
+from benchmarks import schema as benchmark
+from modules.knockerconfig import KnockerConfig
+from modules.schema import SchemaCompiler, collect_references, compile_schema
+from modules import tester
+import json
+import pytest
+
+SCHEMAS = {
+    "#/Item": {"type": "object", "required": ["id"], "properties": {
+        "id": {"type": "integer"},
+        "owner": {"$ref": "#/User"},
+        "children": {"type": "array", "items": {"$ref": "#/Item"}},
+    }},
+    "#/User": {"type": "object", "required": ["name"], "properties": {"name": {"type": "string"}}},
+}
+
+
+class CountingResolver:
+    def __init__(self, schemas):
+        self.schemas = schemas
+        self.resolved = []
+
+    def __call__(self, reference):
+        self.resolved.append(reference)
+        if reference not in self.schemas:
+            raise ValueError("Could not find reference %s" % reference)
+        return self.schemas[reference]
+
+
+def test_shares_the_validators_of_references():
+    resolver = CountingResolver(SCHEMAS)
+    compiler = SchemaCompiler(resolver)
+
+    first = compiler.compile({"$ref": "#/Item"})
+    second = compiler.compile({"type": "array", "items": {"$ref": "#/Item"}})
+
+    assert sorted(resolver.resolved) == ["#/Item", "#/User"]
+    assert first({"id": 1, "owner": {"name": "a"}}, "$") is None
+    assert second([{"id": 1}, {"id": "2"}], "$") == "$[1].id: expected integer, got str"
+
+
+def test_follows_recursive_references():
+    validator = SchemaCompiler.for_references(SCHEMAS).compile({"$ref": "#/Item"})
+
+    assert validator({"id": 1, "children": [{"id": 2, "children": [{"id": 3}]}]}, "$") is None
+    assert validator({"id": 1, "children": [{"id": 2, "children": [{}]}]}, "$") == \
+        "$.children[0].children[0]: required property id is missing"
+
+
+def test_reports_unresolvable_references():
+    compiler = SchemaCompiler.for_references({})
+
+    with pytest.raises(ValueError):
+        compiler.compile({"$ref": "#/Missing"})
+    with pytest.raises(ValueError):
+        compile_schema({"$ref": "#/Item"})
+
+
+def test_collects_references_once():
+    resolver = CountingResolver(SCHEMAS)
+
+    assert collect_references([{"$ref": "#/Item"}, {"items": {"$ref": "#/Item"}}], resolver) == SCHEMAS
+    assert sorted(resolver.resolved) == ["#/Item", "#/User"]
+
+
+@pytest.fixture
+def parser(tmp_path):
+    api_file = tmp_path / "api.json"
+    api_file.write_text(json.dumps(benchmark.build_spec(100)))
+    parser = OpenAPIParser()
+    parser.parse_file(str(api_file))
+    return parser
+
+
+def test_parser_keeps_references(parser):
+    requests = parser.get_parsed_requests()
+
+    assert len(requests) == 100
+    assert requests[0]["response_schemas"]["200"] == {"$ref": "#/components/schemas/Item0"}
+    assert len(parser.get_referenced_schemas()) == benchmark.COMPONENTS + 1
+
+
+def create_tester(parser, compiler, operation):
+    requests = parser.get_parsed_requests()
+    knocker_conf = KnockerConfig()
+    knocker_conf.load_config({"content_type": "json", "user_count": 2, "auth_matrix": {
+        requests[0]["path"]: {"get": dict(operation, matrix={"user_1": True, "user_2": False})},
+        requests[1]["path"]: {"get": {"matrix": {"user_1": True, "user_2": False},
+                                      "success": ["http_code", 200], "blocked": ["http_code", 403]}},
+    }})
+    return tester.Tester(requests, knocker_conf, None, {}, print_results=False, schema_compiler=compiler)
+
+
+def test_compiles_only_the_schemas_of_the_checks(parser):
+    resolved = []
+
+    def resolve(reference):
+        resolved.append(reference)
+        return parser.resolve_reference(reference)
+
+    create_tester(parser, SchemaCompiler(resolve), {"success": ["response_schema", 403], "blocked": ["http_code", 403]})
+
+    assert resolved == ["#/components/schemas/Error"]
+
+
+def test_reports_missing_response_schemas_when_compiling(parser):
+    schema_tester = create_tester(parser, parser.get_schema_compiler(), {
+        "success": {"all": [["http_code", 200], ["response_schema", 201]]}, "blocked": ["response_schema", "*"]})
+
+    checks = schema_tester.get_compiled_checks()[(parser.get_parsed_requests()[0]["path"], "get")]
+    assert checks["success"] == "The API file defines no response schema for status code 201."
+    assert not isinstance(checks["blocked"], str)
@@ -0,0 +1,37 @@
+from benchmarks import startup
+import os
+
+# Modules, which are only needed to send requests, store results or parse YAML
+HEAVY_MODULES = ("requests", "urllib3", "httpx", "yaml", "sqlite3", "http.server", "socket", "ssl")
+
+# The modules apiknock.py imports at startup
+STARTUP_MODULES = ("modules.knockerconfig", "modules.reporter")
+
+# Generous budget for the cumulative import time of the startup modules, the median is usually far below
+IMPORT_BUDGET = 0.25
+
+
+def get_imports(tmp_path, name):
+    _, output = startup.run(startup.get_commands(str(tmp_path))[name], import_time=True)
+    return startup.parse_import_times(output)
+
+
+def test_help_imports_no_heavy_modules(tmp_path):
+    imported = get_imports(tmp_path, "--help")
+    assert [module for module in HEAVY_MODULES if module in imported] == []
+
+
+def test_generate_config_imports_no_heavy_modules(tmp_path):
+    imported = get_imports(tmp_path, "-g")
+    assert [module for module in HEAVY_MODULES if module in imported] == []
+    assert os.path.isfile(os.path.join(str(tmp_path), "config.json"))
+
+
+def test_generate_config_compiles_no_schemas(tmp_path):
+    # The response schemas are only compiled for the checks of a run
+    assert "modules.schema" not in get_imports(tmp_path, "-g")
+
+
+def test_generate_config_import_time(tmp_path):
+    imported = get_imports(tmp_path, "-g")
+    assert sum(imported[module] for module in STARTUP_MODULES + ("apiparser.openapi",)) < IMPORT_BUDGET
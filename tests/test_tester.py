@@ -0,0 +1,30 @@
+from modules import tester
+from modules.knockerconfig import KnockerConfig
+from modules.requester import Requester
+from tests.server import LocalServer
+from tests.test_scheduling import TOKENS, create_request
+import pytest
+
+
+@pytest.mark.parametrize("transport", ["requests", "httpx"])
+def test_reports_truncated_bodies_as_errors(transport):
+    if transport == "httpx":
+        pytest.importorskip("httpx")
+    from modules.transport import get_transport
+
+    knocker_conf = KnockerConfig()
+    knocker_conf.load_config({"content_type": "json", "user_count": 2, "auth_matrix": {
+        "/truncated": {"get": {"matrix": {"user_1": True, "user_2": False},
+                               "success": ["http_body", "x"], "blocked": ["http_code", 403]}},
+    }})
+    with LocalServer() as server:
+        requester = Requester(server.url, auth_type="bearer", transport=get_transport(transport))
+        operation_tester = tester.Tester([create_request("/truncated")], knocker_conf, requester, TOKENS,
+                                         print_results=False)
+        try:
+            operation_tester.test_all_requests()
+        finally:
+            requester.close()
+
+    error, = operation_tester.get_errors()
+    assert error.user == "user_1"
@@ -0,0 +1,147 @@
+"""
+Conformance tests every transport has to pass. They run against a local HTTP/1.1 server, so the httpx transport is
+tested with its HTTP/1.1 fallback.
+"""
+from modules.transport import TRANSPORTS, get_transport
+from tests.server import LocalServer
+import datetime
+import json
+import pytest
+import threading
+
+
+def get_available_transports():
+    transports = []
+    for name in TRANSPORTS:
+        try:
+            get_transport(name).close()
+        except ValueError:
+            # The optional packages of the transport are not installed
+            transports.append(pytest.param(name, marks=pytest.mark.skip(reason="%s is not installed" % name)))
+        else:
+            transports.append(name)
+    return transports
+
+
+@pytest.fixture(params=get_available_transports())
+def transport(request):
+    transport = get_transport(request.param)
+    yield transport
+    transport.close()
+
+
+@pytest.fixture
+def server():
+    with LocalServer() as server:
+        yield server
+
+
+def test_sends_parameters_and_headers(transport, server):
+    response = transport.request("get", server.url + "echo", params={"id": "1", "kind": "a b"},
+                                 headers={"Authorization": "Bearer token", "X-Test": "yes"})
+
+    assert response.status_code == 200
+    assert response.reason == "OK"
+    assert response.headers["content-type"] == "application/json"
+    assert isinstance(response.elapsed, datetime.timedelta)
+
+    echo = json.loads(response.text)
+    assert echo["method"] == "GET"
+    assert echo["query"] == {"id": "1", "kind": "a b"}
+    assert echo["headers"]["authorization"] == "Bearer token"
+    assert echo["headers"]["x-test"] == "yes"
+
+
+@pytest.mark.parametrize("kwargs, content_type, body", [
+    ({"json": {"name": "x"}}, "application/json", '{"name": "x"}'),
+    ({"data": {"name": "x"}}, "application/x-www-form-urlencoded", "name=x"),
+    ({"data": "raw body"}, None, "raw body"),
+])
+def test_sends_bodies(transport, server, kwargs, content_type, body):
+    echo = json.loads(transport.request("post", server.url + "echo", **kwargs).text)
+
+    assert echo["method"] == "POST"
+    if content_type == "application/json":
+        assert json.loads(echo["body"]) == json.loads(body)
+    else:
+        assert echo["body"] == body
+    if content_type:
+        assert echo["headers"]["content-type"] == content_type
+
+
+def test_streams_the_body(transport, server):
+    response = transport.request("get", server.url + "bytes/100000", stream=True)
+
+    assert response.status_code == 200
+    assert sum(len(chunk) for chunk in response.iter_content(8192)) == 100000
+    response.close()
+
+
+def test_reads_the_body_after_streaming_it(transport, server):
+    response = transport.request("get", server.url + "bytes/10", stream=True)
+
+    assert response.content == b"x" * 10
+    assert b"".join(response.iter_content(4)) == b"x" * 10
+    response.close()
+
+
+def test_never_stores_cookies(transport, server):
+    response = transport.request("get", server.url + "set-cookie")
+    assert "session=secret" in response.headers["set-cookie"]
+
+    echo = json.loads(transport.request("get", server.url + "echo", cookies={"user": "1"}).text)
+
+    # Only the cookies of the request itself are sent, never the ones of previous responses (i.e. other users)
+    assert echo["headers"]["cookie"] == "user=1"
+
+
+def test_reports_error_status_codes(transport, server):
+    response = transport.request("delete", server.url + "status/403")
+
+    assert response.status_code == 403
+    assert json.loads(response.text) == {"status": 403}
+
+
+def test_reuses_connections(transport, server):
+    for _ in range(5):
+        response = transport.request("get", server.url + "status/200", stream=True)
+        response.content
+        response.close()
+
+    assert server.connections == 1
+
+
+def test_provides_the_sent_request(transport, server):
+    response = transport.request("get", server.url + "echo", params={"id": "1"})
+
+    assert response.request.method == "GET"
+    assert response.request.url == server.url + "echo?id=1"
+
+
+def test_raises_connection_errors_as_os_error(transport):
+    with LocalServer() as server:
+        url = server.url
+
+    with pytest.raises(OSError):
+        transport.request("get", url + "echo")
+
+
+def test_is_thread_safe(transport, server):
+    errors = []
+
+    def send(number):
+        try:
+            echo = json.loads(transport.request("get", server.url + "echo", params={"n": str(number)},
+                                                cookies={"user": str(number)}).text)
+            assert echo["query"] == {"n": str(number)}
+            assert echo["headers"]["cookie"] == "user=%d" % number
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=send, args=(number,)) for number in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []